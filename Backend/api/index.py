@@ -1,3 +1,8 @@
+import os
+
+# Vercel: funciones efímeras detrás del pooler de Neon -> sin pool propio
+os.environ.setdefault("DB_POOL_PROFILE", "serverless")
+
 from main import app
 
 # Export the FastAPI app for Vercel
@@ -0,0 +1,193 @@
+"""
+Middlewares ASGI puros (sin BaseHTTPMiddleware / @app.middleware("http")).
+
+`@app.middleware("http")` envuelve cada request en una tarea extra y re-emite
+el body de la respuesta por un stream intermedio: costo fijo por request y
+respuestas en streaming (PDF/ZIP) que no fluyen de punta a punta. Estos
+middlewares sólo interceptan `send` para agregar headers; el body pasa
+directo.
+
+Orden del stack (de afuera hacia adentro, ver main.py):
+
+    RequestLogMiddleware   request id, tiempo total y access log; ve también los 429
+    CORSMiddleware         los 429 llevan headers CORS (el front puede leerlos)
+    RateLimitMiddleware    rechaza antes de GZip, routing, DB, etc.
+    TimingMiddleware       queries / ms de DB / tramos -> Server-Timing + histograma
+    GZipMiddleware         el de Starlette, salvo PDF / ZIP (ver abajo)
+    app
+"""
+import logging
+import time
+import uuid
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipResponder
+from starlette.responses import JSONResponse
+
+import logging_setup
+import rate_limit
+import request_metrics
+
+logger = logging.getLogger(__name__)
+
+# Ya vienen comprimidos: gzip sólo gasta CPU y quita el Content-Length del streaming
+GZIP_EXCLUDED_TYPES = frozenset({"application/pdf", "application/zip"})
+
+
+class RateLimitMiddleware:
+    """Cuenta el request contra su presupuesto (rate_limit.py); 429 sin tocar la app."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        client_ip = rate_limit.client_ip(Headers(scope=scope), scope.get("client"))
+        decision = await rate_limit.check(scope["method"], scope["path"], client_ip)
+        if decision is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not decision.allowed:
+            logger.warning(f"Rate limit exceeded for IP: {client_ip} (regla {decision.rule})")
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": "Rate limit exceeded"},
+                headers={
+                    "Retry-After": str(max(1, round(decision.retry_after))),
+                    "X-RateLimit-Limit": str(decision.limit),
+                    "X-RateLimit-Remaining": "0",
+                },
+            )
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-RateLimit-Limit"] = str(decision.limit)
+                headers["X-RateLimit-Remaining"] = str(decision.remaining)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+class GZipMiddleware:
+    """
+    GZipMiddleware de Starlette que deja pasar sin tocar las respuestas de
+    GZIP_EXCLUDED_TYPES. El tipo se conoce recién en http.response.start: a
+    partir de ahí esos mensajes van directo a `send`, sin pasar por el GZipResponder.
+    """
+
+    def __init__(self, app, minimum_size: int = 500, compresslevel: int = 9):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or "gzip" not in Headers(scope=scope).get("accept-encoding", ""):
+            await self.app(scope, receive, send)
+            return
+
+        async def app_sin_comprimidos(scope, receive, send_gzip):
+            target = send_gzip
+
+            async def dispatch(message):
+                nonlocal target
+                if message["type"] == "http.response.start":
+                    content_type = Headers(raw=message["headers"]).get("content-type", "")
+                    if content_type.split(";", 1)[0].strip().lower() in GZIP_EXCLUDED_TYPES:
+                        target = send
+                await target(message)
+
+            await self.app(scope, receive, dispatch)
+
+        responder = GZipResponder(app_sin_comprimidos, self.minimum_size, compresslevel=self.compresslevel)
+        await responder(scope, receive, send)
+
+
+class TimingMiddleware:
+    """
+    Métricas del request (request_metrics.py): header Server-Timing y
+    histograma por ruta. Deja las métricas en scope["request_metrics"] para el access log.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = request_metrics.begin()
+        scope["request_metrics"] = stats
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message)["Server-Timing"] = stats.server_timing()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            # FastAPI deja la ruta resuelta en el scope: se agrupa por plantilla (/turnos/{id}), no por URL
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "(sin ruta)"
+            request_metrics.record(f"{scope['method']} {path}", stats, status)
+
+
+class RequestLogMiddleware:
+    """
+    Access log (muestreado, ver logging_setup), request id y header X-Process-Time.
+    El request id viene del header X-Request-ID o se genera; se devuelve en la respuesta.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        rid = Headers(scope=scope).get("x-request-id") or uuid.uuid4().hex[:16]
+        token = logging_setup.request_id.set(rid[:64])
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers["X-Process-Time"] = str(time.perf_counter() - start)
+                headers["X-Request-ID"] = rid[:64]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            if logging_setup.should_log_access(status, duration_ms):
+                client = scope.get("client")
+                stats = scope.get("request_metrics")
+                logging_setup.access_logger.info(
+                    f"{scope['method']} {scope['path']} {status} {duration_ms:.1f}ms",
+                    extra={
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "status": status,
+                        "duration_ms": round(duration_ms, 1),
+                        "client": client[0] if client else None,
+                        "queries": stats.queries if stats else None,
+                        "db_ms": round(stats.db_ms, 1) if stats else None,
+                    },
+                )
+            logging_setup.request_id.reset(token)
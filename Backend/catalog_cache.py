@@ -0,0 +1,177 @@
+"""
+Cache en memoria (por proceso) para catálogos que casi no cambian:
+coberturas, nacionalidades, localidades, sexo, bases/* y profesionales.
+
+- TTL por catálogo (CATALOG_TTLS), con un default configurable por env.
+- Tamaño acotado: LRU con como máximo CATALOG_CACHE_MAX_ENTRIES entradas.
+- Invalidación explícita: los POST/PUT/DELETE/PATCH llaman a `invalidate(nombre)`
+  después del commit. Cada nombre invalidado sube su generación; una carga
+  que empezó antes (y puede traer datos previos al commit) no se guarda.
+
+Las claves son strings. Una clave puede tener sub-claves con ":" (por ej.
+"pacientes_count:activos"); `invalidate("pacientes_count")` borra todas.
+El TTL se toma del nombre base (lo que está antes del primer ":").
+
+Junto con cada valor se guarda su ETag (hash del contenido), así los GET
+pueden contestar 304 sin tocar la DB ni serializar: ver `cached_response`.
+
+Cada instancia (Render, cada lambda de Vercel) tiene su propia copia: un cambio
+hecho en otra instancia se ve, como mucho, cuando vence el TTL.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from conditional import compute_etag, etag_response
+
+DEFAULT_TTL = int(os.getenv("CATALOG_CACHE_TTL", "300"))  # segundos
+MAX_ENTRIES = int(os.getenv("CATALOG_CACHE_MAX_ENTRIES", "128"))
+
+# TTL por catálogo (segundos). Lo que no figure usa DEFAULT_TTL.
+CATALOG_TTLS = {
+    "sexo": 3600,
+    "nacionalidades": 1800,
+    "localidades": 1800,
+    "coberturas": 600,
+    "laboratorio": 600,
+    "imagenes": 600,
+    "otros": 600,
+    "especialidad": 600,
+    "motivos_consulta": 600,
+    "diagnosticos": 300,
+    "cirujanos": 300,
+    "anestesiologos": 300,
+    "instrumentadores": 300,
+    "plantillas_tecnicas": 300,
+}
+
+_lock = threading.Lock()
+_entries: "OrderedDict[str, Tuple[float, Any, str]]" = OrderedDict()
+# nombre invalidado -> generación; clear() sube _epoch
+_generations: Dict[str, int] = {}
+_epoch = 0
+_stats = {"hits": 0, "misses": 0, "invalidations": 0, "stale_loads": 0}
+
+
+def _ttl_for(key: str) -> int:
+    return CATALOG_TTLS.get(key.split(":", 1)[0], DEFAULT_TTL)
+
+
+def _generation(key: str) -> Tuple[int, ...]:
+    # Generaciones de la clave y de cada prefijo ("a", "a:b", ...); llamar con _lock tomado
+    parts = key.split(":")
+    return (_epoch,) + tuple(_generations.get(":".join(parts[:i + 1]), 0) for i in range(len(parts)))
+
+
+def _get_entry(key: str):
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del _entries[key]
+            return None
+        _entries.move_to_end(key)
+        return entry
+
+
+def get(key: str, default: Any = None) -> Any:
+    """Devuelve el valor cacheado si existe y no venció."""
+    entry = _get_entry(key)
+    return default if entry is None else entry[1]
+
+
+def set(key: str, value: Any, ttl: Optional[int] = None) -> str:
+    """Guarda el valor y devuelve su ETag."""
+    return _store(key, value, ttl)
+
+
+def _store(key: str, value: Any, ttl: Optional[int], generation: Optional[Tuple[int, ...]] = None) -> str:
+    expires_at = time.monotonic() + (ttl if ttl is not None else _ttl_for(key))
+    etag = compute_etag(value)
+    with _lock:
+        if generation is not None and _generation(key) != generation:
+            # Se invalidó mientras el loader corría: el valor puede ser previo al cambio
+            _stats["stale_loads"] += 1
+            return etag
+        _entries[key] = (expires_at, value, etag)
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+    return etag
+
+
+def get_or_load(key: str, loader: Callable[[], Any], ttl: Optional[int] = None) -> Any:
+    """
+    Devuelve el catálogo cacheado o lo carga con `loader()` y lo guarda.
+    El loader corre fuera del lock; si dos requests fallan a la vez, ambos
+    consultan la DB y el último en llegar gana (es idempotente).
+    Si el loader lanza excepción, o hubo un `invalidate` de la clave mientras
+    corría, no se cachea nada (el valor igual se devuelve).
+    """
+    return get_or_load_with_etag(key, loader, ttl)[0]
+
+
+def _lookup(key: str):
+    """(entrada vigente, None) con un hit, o (None, generación actual) con un miss."""
+    entry = _get_entry(key)
+    with _lock:
+        if entry is not None:
+            _stats["hits"] += 1
+            return entry, None
+        _stats["misses"] += 1
+        return None, _generation(key)
+
+
+def get_or_load_with_etag(key: str, loader: Callable[[], Any], ttl: Optional[int] = None) -> Tuple[Any, str]:
+    entry, generation = _lookup(key)
+    if entry is not None:
+        return entry[1], entry[2]
+    value = loader()
+    return value, _store(key, value, ttl, generation)
+
+
+async def get_or_load_async(key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[int] = None) -> Any:
+    """Como get_or_load, para endpoints async: `loader()` es una corrutina (p. ej. una query con AsyncSession)."""
+    entry, generation = _lookup(key)
+    if entry is not None:
+        return entry[1]
+    value = await loader()
+    _store(key, value, ttl, generation)
+    return value
+
+
+def cached_response(request, key: str, loader: Callable[[], Any], ttl: Optional[int] = None):
+    """
+    Atajo para endpoints GET de catálogos: cache + ETag.
+    Con If-None-Match vigente devuelve 304 sin cuerpo.
+    """
+    value, etag = get_or_load_with_etag(key, loader, ttl)
+    return etag_response(request, value, etag)
+
+
+def invalidate(*names: str) -> None:
+    """Borra los catálogos indicados (y sus sub-claves "nombre:...")."""
+    with _lock:
+        for name in names:
+            _generations[name] = _generations.get(name, 0) + 1
+            prefix = name + ":"
+            for key in [k for k in _entries if k == name or k.startswith(prefix)]:
+                del _entries[key]
+        _stats["invalidations"] += 1
+
+
+def clear() -> None:
+    global _epoch
+    with _lock:
+        _epoch += 1
+        _entries.clear()
+
+
+def stats() -> dict:
+    with _lock:
+        size = len(_entries)
+    return {**_stats, "entries": size, "max_entries": MAX_ENTRIES}
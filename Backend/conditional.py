@@ -0,0 +1,52 @@
+"""
+Respuestas condicionales (ETag / If-None-Match).
+
+El ETag es un hash del JSON serializado: si el contenido no cambió, el cliente
+recibe 304 sin cuerpo. Se marca como débil (W/) porque GZipMiddleware puede
+re-codificar el cuerpo y eso no cambia el contenido lógico.
+"""
+import hashlib
+import json
+from typing import Any, Optional
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+# no-cache: el navegador puede guardar la respuesta pero debe revalidarla siempre
+CACHE_CONTROL = "private, no-cache"
+
+
+def compute_etag(content: Any) -> str:
+    raw = json.dumps(
+        jsonable_encoder(content), sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    ).encode("utf-8")
+    return 'W/"%s"' % hashlib.sha1(raw).hexdigest()
+
+
+def _strip_weak(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Comparación débil (RFC 9110) contra el header If-None-Match."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    target = _strip_weak(etag)
+    return any(_strip_weak(t) == target for t in header.split(","))
+
+
+def etag_response(request: Request, content: Any, etag: Optional[str] = None, status_code: int = 200) -> Response:
+    """
+    Devuelve 304 si el cliente ya tiene esta versión; si no, el JSON con su ETag.
+    `etag` se puede pasar precalculado (por ej. desde catalog_cache).
+    """
+    etag = etag or compute_etag(content)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=jsonable_encoder(content), status_code=status_code, headers=headers)
@@ -1,7 +1,10 @@
 # Importamos los módulos necesarios de SQLAlchemy
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
 import os
 
 # Cargar variables de entorno desde .env si existe
@@ -29,10 +32,123 @@ if ENV == "dev":
     if DATABASE_URL_LOCAL:
         DATABASE_URL = DATABASE_URL_LOCAL
 
+# --- Perfiles de pool por despliegue ---
+# DB_POOL_PROFILE elige el perfil:
+#   serverless -> Vercel (api/index.py). Sin pool propio (NullPool): cada invocación
+#                 puede ser un proceso nuevo y el pooler de Neon (PgBouncer) reparte.
+#   render     -> Render (main_render.py / uvicorn). Proceso largo: QueuePool dimensionado.
+#   dev        -> local. Pool chico y timeouts generosos.
+# Si no se define, se infiere: VERCEL -> serverless, ENV=dev -> dev, resto -> render.
+# Cada valor numérico se puede pisar por env: DB_POOL_SIZE, DB_MAX_OVERFLOW,
+# DB_ASYNC_POOL_SIZE, DB_ASYNC_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+# DB_STATEMENT_CACHE_SIZE.
+#
+# El motor sync y el async tienen pools separados: el tope de conexiones a Neon
+# por proceso es (pool_size + max_overflow) + (async_pool_size + async_max_overflow),
+# multiplicado por la cantidad de workers de uvicorn.
+#   render -> (3 + 5) + (3 + 5) = 16 por proceso
+#   dev    -> (2 + 3) + (1 + 2) = 8
+POOL_PROFILES = {
+    "serverless": {
+        "poolclass": NullPool,
+        "connect_timeout": 5,
+        "statement_cache_size": 0,   # asyncpg: PgBouncer en modo transacción no soporta prepared statements
+        "query_cache_size": 200,     # cache de SQL compilado de SQLAlchemy (por proceso)
+    },
+    "render": {
+        "poolclass": QueuePool,
+        "pool_size": 3,
+        "max_overflow": 5,
+        "async_pool_size": 3,
+        "async_max_overflow": 5,
+        "pool_timeout": 10,          # segundos esperando una conexión libre antes de fallar
+        "pool_recycle": 300,
+        "connect_timeout": 5,
+        "statement_cache_size": 100,
+        "query_cache_size": 500,
+    },
+    "dev": {
+        "poolclass": QueuePool,
+        "pool_size": 2,
+        "max_overflow": 3,
+        "async_pool_size": 1,
+        "async_max_overflow": 2,
+        "pool_timeout": 30,
+        "pool_recycle": 1800,
+        "connect_timeout": 10,
+        "statement_cache_size": 100,
+        "query_cache_size": 500,
+    },
+}
+
+
+def _default_pool_profile() -> str:
+    if os.getenv("VERCEL"):
+        return "serverless"
+    if ENV == "dev":
+        return "dev"
+    return "render"
+
+
+def _env_int(name: str, default):
+    val = os.getenv(name)
+    if val is None or val.strip() == "":
+        return default
+    try:
+        return int(val)
+    except ValueError:
+        return default
+
+
+def _load_pool_profile(name: str) -> dict:
+    if name not in POOL_PROFILES:
+        raise ValueError(f"DB_POOL_PROFILE inválido: {name!r} (opciones: {', '.join(POOL_PROFILES)})")
+    profile = dict(POOL_PROFILES[name])
+    for key, env_name in (
+        ("pool_size", "DB_POOL_SIZE"),
+        ("max_overflow", "DB_MAX_OVERFLOW"),
+        ("async_pool_size", "DB_ASYNC_POOL_SIZE"),
+        ("async_max_overflow", "DB_ASYNC_MAX_OVERFLOW"),
+        ("pool_timeout", "DB_POOL_TIMEOUT"),
+        ("pool_recycle", "DB_POOL_RECYCLE"),
+        ("statement_cache_size", "DB_STATEMENT_CACHE_SIZE"),
+    ):
+        if key in profile or os.getenv(env_name):
+            profile[key] = _env_int(env_name, profile.get(key))
+    # Detrás del pooler de Neon (host "-pooler") o de PgBouncer no hay prepared statements estables
+    if "-pooler" in (make_url(DATABASE_URL).host or "") or os.getenv("DB_PGBOUNCER") == "1":
+        profile["statement_cache_size"] = 0
+    return profile
+
+
+POOL_PROFILE = (os.getenv("DB_POOL_PROFILE") or _default_pool_profile()).strip().lower()
+pool_config = _load_pool_profile(POOL_PROFILE)
+
+
+def _engine_pool_kwargs(profile: dict, *, is_async: bool = False) -> dict:
+    """Traduce un perfil a kwargs de create_engine / create_async_engine."""
+    kwargs = {"query_cache_size": profile["query_cache_size"]}
+    if profile["poolclass"] is NullPool:
+        kwargs["poolclass"] = NullPool
+        return kwargs
+    # En async no se puede pasar QueuePool: create_async_engine usa su variante adaptada por defecto
+    if not is_async:
+        kwargs["poolclass"] = profile["poolclass"]
+    kwargs.update(
+        # pool_pre_ping=True: chequear conexión antes de usarla para evitar cuelgues
+        pool_pre_ping=True,
+        pool_size=profile["async_pool_size" if is_async else "pool_size"],
+        max_overflow=profile["async_max_overflow" if is_async else "max_overflow"],
+        pool_timeout=profile["pool_timeout"],
+        pool_recycle=profile["pool_recycle"],
+    )
+    return kwargs
+
+
 # --- Conexión robusta ---
 # Armamos connect_args con keepalives y timeout. Agregamos sslmode=require sólo si no está en la URL
 connect_args = {
-    "connect_timeout": 5,
+    "connect_timeout": pool_config["connect_timeout"],
     # keepalives para conexiones inestables (Neon que despierta, etc.)
     "keepalives": 1,
     "keepalives_idle": 30,
@@ -44,17 +160,12 @@ connect_args = {
 if ENV != "dev" and "sslmode=" not in DATABASE_URL:
     connect_args["sslmode"] = "require"
 
-# Creamos el motor de conexión (engine)
-# pool_pre_ping=True: chequear conexión antes de usarla para evitar cuelgues
-# Configuración optimizada para producción
+# Creamos el motor de conexión (engine) según el perfil de pool elegido
 engine = create_engine(
     DATABASE_URL,
-    pool_pre_ping=True,
-    pool_size=3,  # Reducido para producción
-    max_overflow=5,  # Reducido
-    pool_recycle=300,  # 5 minutos
     connect_args=connect_args,
     echo=False,
+    **_engine_pool_kwargs(pool_config),
 )
 
 # Creamos una clase SessionLocal que usaremos para interactuar con la DB
@@ -69,10 +180,58 @@ Base = declarative_base()
 # Dependencia para FastAPI: se encarga de abrir y cerrar la sesión de DB por cada request
 # `yield` permite que el código del endpoint se ejecute con la DB abierta
 # `finally`: asegura que se cierre la conexión después de usarla
+# Es la ÚNICA definición: main.py y los routers la importan desde acá.
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# --- Motor asíncrono (asyncpg) ---
+# Convive con el motor sync: los endpoints de lectura más usados usan AsyncSession
+# para no ocupar un hilo del threadpool mientras esperan a Neon.
+# asyncpg no entiende los parámetros libpq de la URL (sslmode, channel_binding),
+# así que los quitamos y traducimos sslmode a su argumento `ssl`.
+def _build_async_url(url: str):
+    u = make_url(url)
+    query = dict(u.query)
+    sslmode = query.pop("sslmode", None)
+    query.pop("channel_binding", None)
+    # Cache de prepared statements del lado de SQLAlchemy (dialecto asyncpg)
+    query["prepared_statement_cache_size"] = str(pool_config["statement_cache_size"])
+    return u.set(drivername="postgresql+asyncpg", query=query), sslmode
+
+ASYNC_DATABASE_URL, _sslmode = _build_async_url(DATABASE_URL)
+
+async_connect_args = {
+    "timeout": pool_config["connect_timeout"],  # equivalente a connect_timeout
+    "statement_cache_size": pool_config["statement_cache_size"],
+}
+if _sslmode and _sslmode != "disable":
+    async_connect_args["ssl"] = _sslmode
+elif ENV != "dev":
+    async_connect_args["ssl"] = "require"
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args=async_connect_args,
+    echo=False,
+    **_engine_pool_kwargs(pool_config, is_async=True),
+)
+
+# `expire_on_commit=False`: los objetos siguen usables después del commit sin
+# disparar lazy-loads (que en async no están permitidos)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+# Dependencia async para FastAPI: mismo contrato que get_db pero con AsyncSession
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
\ No newline at end of file
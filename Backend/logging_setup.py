@@ -0,0 +1,158 @@
+"""
+Logging estructurado y no bloqueante.
+
+Antes: basicConfig con StreamHandler + FileHandler('app.log') sincrónicos,
+dos líneas por request y /health/logs leyendo el archivo entero. Ahora:
+
+- Los loggers sólo encolan (QueueHandler). Un hilo aparte (QueueListener)
+  formatea y escribe: el event loop nunca espera a disco ni a stdout.
+- Cada registro sale como una línea JSON (ts, level, logger, msg, request_id
+  y los campos extra del access log).
+- `request_id` se toma de un ContextVar que setea RequestLogMiddleware
+  (header X-Request-ID entrante o uno nuevo): todas las líneas de un mismo
+  request quedan correlacionadas.
+- Access log muestreado: siempre se loguean 4xx/5xx y requests lentos; del
+  resto, una fracción (LOG_ACCESS_SAMPLE).
+- Archivo con rotación (RotatingFileHandler) y un ring buffer en memoria con
+  las últimas líneas para /health/logs.
+
+ENV:
+    LOG_LEVEL            (default INFO)
+    LOG_FILE             (default app.log; vacío = sin archivo)
+    LOG_FILE_MAX_MB      (default 10)
+    LOG_FILE_BACKUPS     (default 3)
+    LOG_RING_SIZE        (default 500) líneas en memoria para /health/logs
+    LOG_ACCESS_SAMPLE    (default 0.1) fracción de requests 2xx/3xx rápidos logueados
+    LOG_SLOW_MS          (default 1000) requests más lentos se loguean siempre
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import List, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "app.log")
+LOG_FILE_MAX_BYTES = int(float(os.getenv("LOG_FILE_MAX_MB", "10")) * 1024 * 1024)
+LOG_FILE_BACKUPS = int(os.getenv("LOG_FILE_BACKUPS", "3"))
+RING_SIZE = int(os.getenv("LOG_RING_SIZE", "500"))
+ACCESS_SAMPLE = float(os.getenv("LOG_ACCESS_SAMPLE", "0.1"))
+SLOW_MS = float(os.getenv("LOG_SLOW_MS", "1000"))
+
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+access_logger = logging.getLogger("access")
+
+# Campos extra (logger.info(..., extra={...})) que se copian al JSON
+_EXTRA_FIELDS = ("method", "path", "status", "duration_ms", "client", "queries", "db_ms")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_ring: "deque[str]" = deque(maxlen=RING_SIZE)
+_ring_lock = threading.Lock()
+
+
+class RequestIdFilter(logging.Filter):
+    """Copia el request id del contexto al registro (corre en el hilo que loguea)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        rid = getattr(record, "request_id", None)
+        if rid:
+            data["request_id"] = rid
+        for field in _EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class RingBufferHandler(logging.Handler):
+    """Últimas N líneas formateadas, en memoria."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        with _ring_lock:
+            _ring.append(line)
+
+
+def configure() -> None:
+    """Instala QueueHandler en el root logger y arranca el QueueListener (idempotente)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter()
+    handlers: List[logging.Handler] = [logging.StreamHandler(), RingBufferHandler()]
+    if LOG_FILE:
+        try:
+            handlers.append(logging.handlers.RotatingFileHandler(
+                LOG_FILE, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8",
+            ))
+        except OSError as e:  # FS de sólo lectura (Vercel): sigue sin archivo
+            logging.getLogger(__name__).warning(f"[logging] sin archivo de log: {e}")
+    for h in handlers:
+        h.setFormatter(formatter)
+
+    q: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(q)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    # uvicorn trae sus propios handlers: que también pasen por la cola
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        lg = logging.getLogger(name)
+        lg.handlers[:] = []
+        lg.propagate = True
+    # El access log lo escribe RequestLogMiddleware (muestreado, con request id)
+    logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown() -> None:
+    """Vacía la cola y detiene el hilo del listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def should_log_access(status: int, duration_ms: float) -> bool:
+    if status >= 400 or duration_ms >= SLOW_MS:
+        return True
+    return ACCESS_SAMPLE >= 1.0 or random.random() < ACCESS_SAMPLE
+
+
+def recent(limit: int = 50) -> List[dict]:
+    """Últimas `limit` líneas del ring buffer (ya parseadas)."""
+    with _ring_lock:
+        lines = list(_ring)[-limit:] if limit > 0 else []
+    return [json.loads(line) for line in lines]
@@ -8,7 +8,7 @@ Ordenado y comentado:
 - App + CORS
 - Sesión DB y helpers
 - Supabase (opcional)
-- Bootstrap de tablas y ping a DB
+- Verificación de migraciones de esquema (migrations.py)
 - Registro de Routers
 - Endpoints de health
 """
@@ -18,35 +18,36 @@ load_dotenv()
 
 import os
 import logging
-import time
 from datetime import datetime
-from fastapi import FastAPI, Depends, Request
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 # from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
 from sqlalchemy import text
 from sqlalchemy.orm import Session as _Session
-from collections import defaultdict
 
 
-from database import engine, SessionLocal, Base
+from database import engine, async_engine, get_db, POOL_PROFILE
+import catalog_cache
+import pdf_cache
+import signed_urls
+import logging_setup
+import migrations
+import rate_limit
+import asgi_middleware
+import request_metrics
 
 # ----------------------------
 # CONFIGURACIÓN DE LOGGING
 # ----------------------------
-# Configurar logging estructurado
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('app.log')
-    ]
-)
+# JSON por una cola (QueueHandler/QueueListener), request id, access log
+# muestreado, archivo rotado y ring buffer para /health/logs: ver logging_setup.py
+logging_setup.configure()
 
 logger = logging.getLogger(__name__)
 
+# Cantidad de queries y ms de DB por request (Server-Timing, /health/metrics)
+request_metrics.install_db_hooks(engine, async_engine.sync_engine)
+
 # ----------------------------
 # Routers
 # ----------------------------
@@ -71,6 +72,11 @@ from routers import (
 
 from routers import codigos_facturacion   # /facturacion/*
 from routers import procedimientosFotosCx   # /procedimientos/*/fotos
+from routers import pacientes_search        # /pacientes/search
+from routers import historia_clinica        # /pacientes/{id}/historia-completa
+from routers import pdf_render_pool         # pool de procesos para renderizar PDFs
+from routers import storage_http            # cliente async de Supabase Storage
+from routers import photo_index             # /fotos/reconciliar (índice de fotos en DB)
 
 from routers.PlantillasTecnicas import router_catalogos as plantillas_tecnicas_router  # /plantillas/*
 # from routers.PlantillasTecnicasSimple import router_simple as plantillas_tecnicas_router  # /plantillas/*
@@ -132,90 +138,46 @@ if _frontends:
     additional_origins = [o.strip() for o in _frontends.split(",") if o.strip()]
     origins.extend(additional_origins)
 
-# CORS SEGURO - Solo métodos y headers necesarios
+# ----------------------------
+# MIDDLEWARE (ASGI puro, ver asgi_middleware.py)
+# ----------------------------
+# Starlette: el último agregado queda más afuera. De afuera hacia adentro:
+#   RequestLog -> CORS -> RateLimit -> Timing -> GZip -> app
+# Un request rechazado por rate limit corta antes de GZip y de la app, pero
+# igual lleva headers CORS y queda en el log.
+
+# 1. GZIP Compression (salvo PDF / ZIP, ver asgi_middleware.GZipMiddleware)
+app.add_middleware(asgi_middleware.GZipMiddleware, minimum_size=1000)
+
+# 2. Queries / DB / PDF / Storage por request -> Server-Timing (ver request_metrics.py)
+app.add_middleware(asgi_middleware.TimingMiddleware)
+
+# 3. Rate Limiting por cliente y por ruta (ver rate_limit.py)
+app.add_middleware(asgi_middleware.RateLimitMiddleware)
+
+# 4. CORS SEGURO - Solo métodos y headers necesarios
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=False,  # Cambiado a False - no necesitamos cookies
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["Content-Type", "Authorization", "Accept", "X-Requested-With"],
+    allow_headers=["Content-Type", "Authorization", "Accept", "X-Requested-With", "If-None-Match", "X-Request-ID"],
+    expose_headers=["ETag", "Retry-After", "X-Request-ID", "Server-Timing"],
 )
 
-# ----------------------------
-# MIDDLEWARE DE SEGURIDAD
-# ----------------------------
-
-# 1. GZIP Compression
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+# 5. Request id + access log + X-Process-Time
+app.add_middleware(asgi_middleware.RequestLogMiddleware)
 
-# 2. Trusted Host (completamente eliminado)
+# Trusted Host (completamente eliminado)
 # logger.info("TrustedHostMiddleware deshabilitado completamente")
 
 # Configuración para Render
 logger.info("Render configurado - CORS manejado en sección principal")
 
-# 3. Rate Limiting básico
-rate_limit_storage = defaultdict(list)
-
-@app.middleware("http")
-async def rate_limit_middleware(request, call_next):
-    client_ip = request.client.host
-    now = time.time()
-    
-    # Limpiar requests antiguos (últimos 60 segundos)
-    rate_limit_storage[client_ip] = [
-        req_time for req_time in rate_limit_storage[client_ip] 
-        if now - req_time < 60
-    ]
-    
-    # Verificar límite (100 requests por minuto)
-    if len(rate_limit_storage[client_ip]) >= 100:
-        logger.warning(f"Rate limit exceeded for IP: {client_ip}")
-        return JSONResponse(
-            status_code=429, 
-            content={"detail": "Rate limit exceeded"}
-        )
-    
-    # Agregar request actual
-    rate_limit_storage[client_ip].append(now)
-    
-    response = await call_next(request)
-    return response
-
-# Middleware de logging de requests
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    
-    # Log del request
-    logger.info(f"Request: {request.method} {request.url.path} from {request.client.host}")
-    
-    # Procesar request
-    response = await call_next(request)
-    
-    # Calcular tiempo de procesamiento
-    process_time = time.time() - start_time
-    
-    # Log de la respuesta
-    logger.info(f"Response: {response.status_code} in {process_time:.3f}s")
-    
-    # Agregar header de tiempo de procesamiento
-    response.headers["X-Process-Time"] = str(process_time)
-    
-    return response
-
 # ----------------------------
 # DB dependency
 # ----------------------------
-def get_db():
-    """
-    Dependency de sesión de DB para inyectar en endpoints.
-    """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# `get_db` vive en database.py; se reexporta acá (ver __all__) por compatibilidad.
 
 # ----------------------------
 # Supabase (opcional, seguro)
@@ -227,23 +189,31 @@ try:
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise RuntimeError("Faltan SUPABASE_URL/SUPABASE_KEY")
     supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-    print("🧰 Supabase OK")
+    logger.info("🧰 Supabase OK")
 except Exception as e:
     supabase = None
-    print(f"⚠️ Supabase no inicializado: {e}")
+    logger.warning(f"⚠️ Supabase no inicializado: {e}")
 
 # ----------------------------
-# Bootstrap de DB
+# Esquema de DB
 # ----------------------------
-try:
-    with engine.begin() as conn:
-        # Crea/actualiza metadatos de SQLAlchemy si existen modelos declarativos
-        Base.metadata.create_all(conn)
-        # Ping simple
-        conn.execute(text("SELECT 1"))
-    print("📦 Tablas OK")
-except Exception as e:
-    print(f"⚠️ Error al crear/verificar tablas: {e}")
+# El DDL se aplica en el deploy (`python migrations.py`); acá sólo se verifica la versión
+migrations.check(engine)
+
+# ----------------------------
+# Pool de render de PDFs (workers calientes)
+# ----------------------------
+@app.on_event("startup")
+def _start_pdf_render_pool():
+    pdf_render_pool.start()
+
+@app.on_event("shutdown")
+def _stop_pdf_render_pool():
+    pdf_render_pool.shutdown()
+
+@app.on_event("shutdown")
+async def _close_storage_http():
+    await storage_http.close()
 
 # ----------------------------
 # Registro de Routers
@@ -252,6 +222,8 @@ except Exception as e:
 # Mantenemos lo que venía funcionando antes.
 
 app.include_router(pacientes.router)  # /pacientes/*
+app.include_router(pacientes_search.router)  # /pacientes/search
+app.include_router(historia_clinica.router)  # /pacientes/{id}/historia-completa
 app.include_router(derivadores.router)
 app.include_router(turnos.router)
 app.include_router(BasesSelect.router)  # /bases/*
@@ -262,6 +234,7 @@ app.include_router(examenes_complementarios.router)  # /examenes/*
 app.include_router(interconsultas.router, prefix="/interconsultas", tags=["interconsultas"])
 app.include_router(procedimientos.router)
 app.include_router(procedimientosFotosCx.router)
+app.include_router(photo_index.router)  # /fotos/reconciliar
 app.include_router(codigos_facturacion.router, prefix="/facturacion", tags=["Códigos Facturación"])
 app.include_router(patologia.router)
 app.include_router(profesionales.router, tags=["Profesionales"])
@@ -314,9 +287,9 @@ def health_db():
     try:
         with engine.connect() as conn:
             conn.execute(text("SELECT 1"))
-        return {"db": "ok"}
+        return {"db": "ok", "pool_profile": POOL_PROFILE, "pool": engine.pool.status()}
     except Exception as e:
-        return {"db": "error", "detail": str(e)}
+        return {"db": "error", "pool_profile": POOL_PROFILE, "detail": str(e)}
 
 @app.get("/health/storage")
 def health_storage():
@@ -344,8 +317,12 @@ def health_metrics():
                 "disk_percent": psutil.disk_usage('/').percent
             },
             "app": {
-                "rate_limit_ips": len(rate_limit_storage),
-                "total_requests": sum(len(requests) for requests in rate_limit_storage.values())
+                "rate_limit": rate_limit.stats(),
+                "catalog_cache": catalog_cache.stats(),
+                "pdf_cache": pdf_cache.stats(),
+                "signed_urls": signed_urls.stats(),
+                "pdf_render": pdf_render_pool.metrics(),
+                "requests": request_metrics.stats(),
             }
         }
     except ImportError:
@@ -355,20 +332,9 @@ def health_metrics():
         return {"error": str(e)}
 
 @app.get("/health/logs")
-def health_logs():
-    """Endpoint para ver logs recientes"""
-    try:
-        if os.path.exists('app.log'):
-            with open('app.log', 'r') as f:
-                lines = f.readlines()
-                # Últimas 50 líneas
-                recent_logs = lines[-50:] if len(lines) > 50 else lines
-                return {"logs": recent_logs}
-        else:
-            return {"logs": "No log file found"}
-    except Exception as e:
-        logger.error(f"Error reading logs: {e}")
-        return {"error": str(e)}
+def health_logs(limit: int = 50):
+    """Últimas líneas de log (ring buffer en memoria, ver logging_setup)"""
+    return {"logs": logging_setup.recent(min(max(limit, 0), logging_setup.RING_SIZE))}
 
 # Export explícito (útil para import de uvicorn/gunicorn)
 __all__ = ["app", "supabase", "get_db"]# Force redeploy Tue Sep 30 11:45:47 -03 2025
@@ -11,6 +11,9 @@ from pathlib import Path
 # Agregar el directorio actual al path
 sys.path.insert(0, str(Path(__file__).parent))
 
+# Render: proceso largo -> pool persistente (ver POOL_PROFILES en database.py)
+os.environ.setdefault("DB_POOL_PROFILE", "render")
+
 # Importar la aplicación principal
 from main import app
 
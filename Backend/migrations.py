@@ -0,0 +1,243 @@
+"""
+Migraciones de esquema versionadas (runner propio, sin Alembic).
+
+El DDL del arranque (create_all, ALTER TABLE ... ADD COLUMN IF NOT EXISTS,
+CREATE INDEX IF NOT EXISTS) corría en cada cold start, y ensure_patologia_columns
+en cada request de patologías: round-trips extra y locks ACCESS EXCLUSIVE sobre
+tablas en uso. Ahora el DDL se aplica una sola vez, en el deploy:
+
+    python migrations.py            # aplica las pendientes (preDeployCommand de Render)
+    python migrations.py status     # versión actual y pendientes
+
+La tabla `schema_version` registra cada versión aplicada. Cada migración
+corre en su propia transacción, junto con el INSERT de su versión, bajo
+pg_advisory_xact_lock: dos deploys simultáneos no aplican lo mismo dos veces.
+Se usa el lock de transacción (no el de sesión) porque DATABASE_URL suele
+ser el pooler de Neon (PgBouncer en modo transacción).
+
+- `optional`: cada sentencia corre en un SAVEPOINT y, si falla (p. ej. el
+  rol no puede crear la extensión pg_trgm), se registra un warning y la
+  versión igual se marca aplicada.
+- `concurrent_indexes`: índices sobre tablas con datos, creados con
+  CREATE INDEX CONCURRENTLY (fuera de transacción, sin bloquear escrituras).
+  Como no puede ir dentro de la transacción, esa fase se serializa con un
+  pg_advisory_lock de sesión (otra clave): un segundo deploy espera y
+  encuentra los índices hechos. Ese lock sólo es confiable en una conexión
+  directa (host sin "-pooler"); detrás de PgBouncer en modo transacción
+  puede no sostenerse entre sentencias.
+
+Agregar una migración = agregar un Migration al final de MIGRATIONS con el
+número siguiente. Nunca editar una que ya se aplicó.
+
+En runtime la app sólo consulta la versión (`check()`); con
+DB_MIGRATE_ON_STARTUP=1 (default en ENV=dev) aplica las pendientes al arrancar.
+
+ENV:
+    DB_MIGRATE_ON_STARTUP       (default 1 si ENV=dev, si no 0)
+    MIGRATIONS_LOCK_TIMEOUT     (default 10s) espera máxima por locks de tabla
+"""
+import logging
+import os
+import sys
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+LOCK_TIMEOUT = os.getenv("MIGRATIONS_LOCK_TIMEOUT", "10s")
+_ADVISORY_LOCK_KEY = 482_113_907  # arbitrario, fijo para esta app
+# Distinta de la anterior: una sesión con este lock no choca con el xact_lock de _apply
+_INDEX_LOCK_KEY = _ADVISORY_LOCK_KEY + 1
+
+SQL_CREATE_VERSION_TABLE = text("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version     INTEGER PRIMARY KEY,
+        name        TEXT NOT NULL,
+        applied_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+""")
+SQL_CURRENT_VERSION = text("SELECT coalesce(max(version), 0) FROM schema_version")
+SQL_IS_APPLIED = text("SELECT 1 FROM schema_version WHERE version = :v")
+SQL_RECORD_VERSION = text("INSERT INTO schema_version (version, name) VALUES (:v, :name)")
+# Un CREATE INDEX CONCURRENTLY interrumpido deja el índice INVALID y
+# IF NOT EXISTS lo saltearía: se borra antes de reintentar.
+SQL_INVALID_INDEX = text("""
+    SELECT 1
+      FROM pg_index i
+      JOIN pg_class c ON c.oid = i.indexrelid
+     WHERE c.relname = :name AND NOT i.indisvalid
+""")
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    statements: Sequence[str] = ()
+    run: Optional[Callable] = None          # run(conn) para pasos en Python (create_all)
+    optional: bool = False
+    # (nombre_indice, tabla, columna) creados con CONCURRENTLY
+    concurrent_indexes: Sequence[Tuple[str, str, str]] = field(default_factory=tuple)
+
+
+def _create_all(conn) -> None:
+    # Tablas nuevas en una base vacía; no altera tablas existentes.
+    # Los modelos viven en el Base propio de models.py (no en database.Base)
+    import models
+    models.Base.metadata.create_all(conn)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "tablas base (create_all)", run=_create_all),
+    Migration(2, "patologias: columnas de procedimiento", statements=[
+        "ALTER TABLE patologias ADD COLUMN IF NOT EXISTS id_procedimiento_paciente BIGINT",
+        "ALTER TABLE patologias ADD COLUMN IF NOT EXISTS fecha_procedimiento DATE",
+        "ALTER TABLE patologias ADD COLUMN IF NOT EXISTS tipo_registro VARCHAR(32)",
+    ]),
+    Migration(3, "índices de listados: pacientes por nombre, turnos por fecha", statements=[
+        # Paginación por cursor de /pacientes/ (orden lower(nombre), id)
+        "CREATE INDEX IF NOT EXISTS ix_pacientes_lower_nombre_id ON pacientes (lower(nombre), id_paciente)",
+        # Agenda por rango de fechas en /turnos/?desde=&hasta=
+        "CREATE INDEX IF NOT EXISTS ix_turnos_fecha ON turnos (fecha)",
+    ]),
+    Migration(4, "búsqueda de pacientes: pg_trgm", optional=True, statements=[
+        # Sin la extensión la búsqueda sigue funcionando (cae a seq scan)
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS ix_pacientes_nombre_trgm ON pacientes USING gin (lower(nombre) gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS ix_pacientes_dni_trgm ON pacientes USING gin (dni gin_trgm_ops)",
+    ]),
+    Migration(5, "fotos: columnas de variantes (miniatura / pantalla)", statements=[
+        "ALTER TABLE fotos_partes_cx ADD COLUMN IF NOT EXISTS thumb_url TEXT",
+        "ALTER TABLE fotos_partes_cx ADD COLUMN IF NOT EXISTS display_url TEXT",
+        "ALTER TABLE fotos_patologia ADD COLUMN IF NOT EXISTS thumb_url TEXT",
+        "ALTER TABLE fotos_patologia ADD COLUMN IF NOT EXISTS display_url TEXT",
+    ]),
+    Migration(6, "índices de foreign keys por paciente / consulta", concurrent_indexes=[
+        ("ix_consultas_id_paciente", "consultas", "id_paciente"),
+        ("ix_evoluciones_id_consulta", "evoluciones", "id_consulta"),
+        ("ix_interconsultas_id_paciente", "interconsultas", "id_paciente"),
+        ("ix_laboratorios_pacientes_id_paciente", "laboratorios_pacientes", "id_paciente"),
+        ("ix_imagenes_pacientes_id_paciente", "imagenes_pacientes", "id_paciente"),
+        ("ix_otros_estudios_pacientes_id_paciente", "otros_estudios_pacientes", "id_paciente"),
+    ]),
+    Migration(7, "fotos: una fila por objeto del bucket (unique storage_key / file_key)", statements=[
+        # Duplicados previos (reconciliación concurrente con una subida): queda la fila más vieja
+        """DELETE FROM fotos_partes_cx a USING fotos_partes_cx b
+            WHERE a.storage_key = b.storage_key AND a.id_foto > b.id_foto""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_fotos_partes_cx_storage_key ON fotos_partes_cx (storage_key)",
+        """DELETE FROM fotos_patologia a USING fotos_patologia b
+            WHERE a.file_key = b.file_key AND a.id > b.id""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_fotos_patologia_file_key ON fotos_patologia (file_key)",
+    ]),
+]
+
+
+def _ensure_version_table(engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(SQL_CREATE_VERSION_TABLE)
+
+
+def current_version(engine) -> int:
+    """Versión aplicada (0 si la tabla schema_version todavía no existe)."""
+    with engine.connect() as conn:
+        exists = conn.execute(text("SELECT to_regclass('schema_version') IS NOT NULL")).scalar()
+        return int(conn.execute(SQL_CURRENT_VERSION).scalar() or 0) if exists else 0
+
+
+def pending(engine) -> List[Migration]:
+    version = current_version(engine)
+    return [m for m in MIGRATIONS if m.version > version]
+
+
+def _build_concurrent_indexes(engine, migration: Migration) -> None:
+    # CONCURRENTLY no puede correr dentro de una transacción
+    # Lock de sesión: otro deploy no construye (ni borra por INVALID) un índice
+    # que este proceso todavía está creando
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": _INDEX_LOCK_KEY})
+        try:
+            if conn.execute(SQL_IS_APPLIED, {"v": migration.version}).first():
+                return
+            for name, table, column in migration.concurrent_indexes:
+                if conn.execute(SQL_INVALID_INDEX, {"name": name}).first():
+                    logger.warning(f"[migrations] {name} quedó INVALID; se vuelve a crear")
+                    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({column})"))
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _INDEX_LOCK_KEY})
+
+
+def _apply(engine, migration: Migration) -> bool:
+    """Aplica una migración. Devuelve False si otro proceso ya la había aplicado."""
+    if migration.concurrent_indexes:
+        _build_concurrent_indexes(engine, migration)
+
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _ADVISORY_LOCK_KEY})
+        if conn.execute(SQL_IS_APPLIED, {"v": migration.version}).first():
+            return False
+        # No quedar encolado detrás de una transacción larga con la tabla bloqueada
+        conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+        if migration.run is not None:
+            migration.run(conn)
+        for ddl in migration.statements:
+            if not migration.optional:
+                conn.execute(text(ddl))
+                continue
+            try:
+                with conn.begin_nested():
+                    conn.execute(text(ddl))
+            except Exception as e:
+                logger.warning(f"[migrations] v{migration.version}: no se pudo aplicar '{ddl}': {e}")
+        conn.execute(SQL_RECORD_VERSION, {"v": migration.version, "name": migration.name})
+    return True
+
+
+def upgrade(engine=None, target: Optional[int] = None) -> List[int]:
+    """Aplica en orden las migraciones pendientes (hasta `target`). Devuelve las versiones aplicadas."""
+    if engine is None:
+        from database import engine
+    _ensure_version_table(engine)
+    aplicadas = []
+    for migration in pending(engine):
+        if target is not None and migration.version > target:
+            break
+        if _apply(engine, migration):
+            logger.info(f"[migrations] v{migration.version} aplicada: {migration.name}")
+            aplicadas.append(migration.version)
+    return aplicadas
+
+
+def check(engine) -> None:
+    """
+    Arranque de la app: un SELECT para avisar si hay migraciones pendientes.
+    Con DB_MIGRATE_ON_STARTUP=1 las aplica (pensado para desarrollo local).
+    """
+    default = "1" if os.getenv("ENV", "prod").lower() == "dev" else "0"
+    try:
+        if os.getenv("DB_MIGRATE_ON_STARTUP", default).lower() in ("1", "true", "yes"):
+            upgrade(engine)
+            return
+        faltan = pending(engine)
+        if faltan:
+            logger.warning(
+                f"[migrations] esquema desactualizado: faltan {[m.version for m in faltan]} "
+                f"(correr `python migrations.py`)"
+            )
+    except Exception as e:
+        logger.warning(f"[migrations] no se pudo verificar el esquema: {e}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    from database import engine as _engine
+
+    if sys.argv[1:2] == ["status"]:
+        version = current_version(_engine)
+        print(f"schema_version: {version}")
+        for m in MIGRATIONS:
+            print(f"  {'x' if m.version <= version else ' '} {m.version:>3}  {m.name}")
+    else:
+        print(f"aplicadas: {upgrade(_engine) or 'ninguna'}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, BigInteger, SmallInteger, Text, Date, ForeignKey, String, Boolean, DateTime, text
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, Text, Date, ForeignKey, String, Boolean, DateTime, Index, text
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import date
 from sqlalchemy.sql import func
@@ -81,7 +81,7 @@ class Turno(Base):
     __tablename__ = "turnos"
     id_turno = Column(Integer, primary_key=True)
     nombre = Column(Text, nullable=False)  # Nombre del paciente
-    fecha = Column(Date, nullable=False)  # Fecha del turno
+    fecha = Column(Date, nullable=False, index=True)  # Fecha del turno (índice ix_turnos_fecha para rangos)
     motivo = Column(Text)  # Motivo de la consulta
     derivador = Column(Integer, ForeignKey("derivadores.id_derivador"), nullable=True)  # ID del derivador
 
@@ -133,7 +133,7 @@ class Antecedente(Base):
 class Consulta(Base):
     __tablename__ = "consultas"
     id_consulta = Column(BigInteger, primary_key=True, index=True)
-    id_paciente = Column(Integer, ForeignKey("pacientes.id_paciente"))
+    id_paciente = Column(Integer, ForeignKey("pacientes.id_paciente"), index=True)
     motivo = Column(Integer, ForeignKey("motivos_consulta.id_motivo"))
     fecha_consulta = Column(Date)
 
@@ -141,7 +141,7 @@ class Consulta(Base):
 class Evolucion(Base):
     __tablename__ = "evoluciones"
     id_evolucion = Column(Integer, primary_key=True, index=True)
-    id_consulta = Column(Integer, ForeignKey("consultas.id_consulta"), nullable=False)
+    id_consulta = Column(Integer, ForeignKey("consultas.id_consulta"), nullable=False, index=True)
     fecha_evolucion = Column(Date, nullable=False, default=date.today)
     contenido = Column(Text, nullable=False)
 
@@ -150,7 +150,7 @@ class Interconsulta(Base):
     __tablename__ = "interconsultas"
 
     id_interconsulta = Column(Integer, primary_key=True, index=True)
-    id_paciente       = Column(Integer, ForeignKey("pacientes.id_paciente"), nullable=False)
+    id_paciente       = Column(Integer, ForeignKey("pacientes.id_paciente"), nullable=False, index=True)
     fecha             = Column(Date, nullable=False)
     id_especialidad = Column("especialidad", Integer, ForeignKey("especialidad.id"), nullable=False)
     especialidad_rel = relationship("Especialidad", lazy="joined")
@@ -165,7 +165,7 @@ class LaboratorioPaciente(Base):
     __tablename__ = "laboratorios_pacientes"
 
     id = Column(Integer, primary_key=True, index=True)
-    id_paciente = Column(BigInteger, ForeignKey("pacientes.id_paciente"), nullable=False)
+    id_paciente = Column(BigInteger, ForeignKey("pacientes.id_paciente"), nullable=False, index=True)
     fecha = Column(Date, nullable=False)
     id_laboratorio = Column(Integer, ForeignKey("laboratorio.id"), nullable=False)
     descripcion = Column(Text)
@@ -176,7 +176,7 @@ class ImagenPaciente(Base):
     __tablename__ = "imagenes_pacientes"
 
     id = Column(Integer, primary_key=True, index=True)
-    id_paciente = Column(BigInteger, ForeignKey("pacientes.id_paciente"), nullable=False)
+    id_paciente = Column(BigInteger, ForeignKey("pacientes.id_paciente"), nullable=False, index=True)
     fecha = Column(Date, nullable=False)
     id_imagen = Column(Integer, ForeignKey("imagenes.id"), nullable=False)
     descripcion = Column(Text)
@@ -187,7 +187,7 @@ class OtroEstudioPaciente(Base):
     __tablename__ = "otros_estudios_pacientes"
 
     id = Column(Integer, primary_key=True, index=True)
-    id_paciente = Column(BigInteger, ForeignKey("pacientes.id_paciente"), nullable=False)
+    id_paciente = Column(BigInteger, ForeignKey("pacientes.id_paciente"), nullable=False, index=True)
     fecha = Column(Date, nullable=False)
     id_otro = Column(Integer, ForeignKey("otros_estudios.id"), nullable=False)
     descripcion = Column(Text)
@@ -313,6 +313,8 @@ class ParteQuirurgico(Base):
 # ----------------------------------
 class FotoParteCx(Base):
     __tablename__ = "fotos_partes_cx"
+    # Una fila por objeto del bucket (migración 7)
+    __table_args__ = (Index("ux_fotos_partes_cx_storage_key", "storage_key", unique=True),)
 
     id_foto = Column(Integer, primary_key=True, index=True, autoincrement=True)
     id_procedimiento_paciente = Column(
@@ -327,6 +329,8 @@ class FotoParteCx(Base):
     filename = Column(Text, nullable=False)      # nombre original
     content_type = Column(String, nullable=True)
     size_bytes = Column(BigInteger, nullable=True)
+    thumb_url = Column(Text, nullable=True)      # miniatura (ver routers/image_variants.py)
+    display_url = Column(Text, nullable=True)    # versión pantalla
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     # Relación útil
@@ -377,11 +381,14 @@ class PatologiaVCC(Base):
 # ----------------------------------
 class FotosPatologia(Base):
     __tablename__ = "fotos_patologia"
+    __table_args__ = (Index("ux_fotos_patologia_file_key", "file_key", unique=True),)
 
     id            = Column(Integer, primary_key=True, index=True)
     id_patologia  = Column(Integer, ForeignKey("patologias.id_patologia", ondelete="CASCADE"), nullable=False)
     file_key      = Column(Text, nullable=False)
     file_url      = Column(Text, nullable=False)
+    thumb_url     = Column(Text, nullable=True)
+    display_url   = Column(Text, nullable=True)
     uploaded_at   = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     patologia_rel = relationship("Patologia", back_populates="fotos")
@@ -0,0 +1,291 @@
+"""
+Cache de PDFs ya renderizados, direccionado por contenido.
+
+La clave es `<tipo>__<id>__<sha256>`: el sha256 del dict de datos que recibe
+el builder (build_pdf_hzb_bytes / build_resumen_hc_bytes) más el tipo de
+documento y PDF_RENDER_VERSION, precedido por el documento al que pertenece.
+Si los datos no cambiaron, el PDF tampoco: la reimpresión del mismo protocolo
+se sirve sin pasar por ReportLab.
+
+Niveles:
+- Memoria: LRU acotado por bytes (PDF_CACHE_MAX_BYTES, default 64 MB).
+- Disco (opcional): si se define PDF_CACHE_DIR, cada PDF se guarda como
+  <clave>.pdf. Sobrevive reinicios en Render; en Vercel se puede apuntar a /tmp.
+  Se poda cada PDF_CACHE_DISK_PRUNE_SECONDS: primero lo que no se leyó en
+  PDF_CACHE_DISK_MAX_AGE_DAYS, después los menos usados hasta quedar bajo
+  PDF_CACHE_DISK_MAX_MB (un hit en disco renueva el mtime del archivo).
+  Desde get_or_render el disco se lee y escribe en el threadpool; la poda y
+  los borrados de `invalidate` corren en un hilo de mantenimiento aparte.
+
+Invalidación: como la clave depende del contenido, un dato editado genera otra
+clave sola. Igual, los endpoints que editan un parte o la historia llaman a
+`invalidate(tipo, id)` para liberar enseguida las versiones viejas. Se busca
+por prefijo de clave, en memoria y en el directorio: también borra lo que
+escribieron otros workers o procesos anteriores.
+
+ENV:
+    PDF_CACHE_MAX_BYTES             (default 64 MB) tope en memoria
+    PDF_CACHE_DIR                   (sin default) directorio del nivel disco
+    PDF_CACHE_DISK_MAX_MB           (default 512)
+    PDF_CACHE_DISK_MAX_AGE_DAYS     (default 30)
+    PDF_CACHE_DISK_PRUNE_SECONDS    (default 600) intervalo mínimo entre podas
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# Subir este número cuando cambie el layout de Services_pdf: invalida todo lo cacheado
+PDF_RENDER_VERSION = "2"
+
+MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_DIR = os.getenv("PDF_CACHE_DIR") or None
+DISK_MAX_BYTES = int(float(os.getenv("PDF_CACHE_DISK_MAX_MB", "512")) * 1024 * 1024)
+DISK_MAX_AGE = float(os.getenv("PDF_CACHE_DISK_MAX_AGE_DAYS", "30")) * 86400
+DISK_PRUNE_INTERVAL = float(os.getenv("PDF_CACHE_DISK_PRUNE_SECONDS", "600"))
+# Un .tmp más viejo que esto quedó de una escritura interrumpida
+_TMP_MAX_AGE = 3600
+
+_lock = threading.Lock()
+_entries: "OrderedDict[str, bytes]" = OrderedDict()
+_total_bytes = 0
+_last_prune = 0.0
+_maintenance_executor: Optional[ThreadPoolExecutor] = None
+_stats = {"hits_memory": 0, "hits_disk": 0, "misses": 0, "evictions": 0, "disk_pruned": 0}
+
+if CACHE_DIR:
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+    except OSError as e:
+        logger.warning(f"PDF_CACHE_DIR no utilizable ({CACHE_DIR}): {e}")
+        CACHE_DIR = None
+
+
+def _doc_prefix(kind: str, doc_id: object = None) -> str:
+    # Prefijo de las claves de un documento; con doc_id=None, el de todo el tipo.
+    # Sólo [A-Za-z0-9-]: la clave también es nombre de archivo.
+    prefix = re.sub(r"[^A-Za-z0-9-]", "-", kind) + "__"
+    if doc_id is not None:
+        prefix += re.sub(r"[^A-Za-z0-9-]", "-", str(doc_id)) + "__"
+    return prefix
+
+
+def cache_key(kind: str, data: dict, doc_id: object = None) -> str:
+    raw = json.dumps(data, sort_keys=True, default=str, ensure_ascii=False).encode("utf-8")
+    h = hashlib.sha256()
+    h.update(f"{kind}:{PDF_RENDER_VERSION}:".encode("ascii"))
+    h.update(raw)
+    return _doc_prefix(kind, "-" if doc_id is None else doc_id) + h.hexdigest()
+
+
+def _disk_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}.pdf")
+
+
+def _store_memory(key: str, pdf: bytes) -> None:
+    global _total_bytes
+    if len(pdf) > MAX_BYTES:
+        return
+    with _lock:
+        old = _entries.pop(key, None)
+        if old is not None:
+            _total_bytes -= len(old)
+        _entries[key] = pdf
+        _total_bytes += len(pdf)
+        while _total_bytes > MAX_BYTES and _entries:
+            _, evicted = _entries.popitem(last=False)
+            _total_bytes -= len(evicted)
+            _stats["evictions"] += 1
+
+
+def _get_memory(key: str) -> Optional[bytes]:
+    with _lock:
+        pdf = _entries.get(key)
+        if pdf is not None:
+            _entries.move_to_end(key)
+            _stats["hits_memory"] += 1
+        return pdf
+
+
+def _read_disk(key: str) -> Optional[bytes]:
+    try:
+        with open(_disk_path(key), "rb") as f:
+            pdf = f.read()
+        # mtime = último uso: la poda saca primero lo que no se lee
+        os.utime(_disk_path(key))
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"Error leyendo PDF cacheado {key}: {e}")
+        return None
+    with _lock:
+        _stats["hits_disk"] += 1
+    _store_memory(key, pdf)
+    return pdf
+
+
+def _write_disk(key: str, pdf: bytes) -> None:
+    # Escritura atómica: otro request nunca ve un PDF a medio escribir
+    tmp = _disk_path(key) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(pdf)
+        os.replace(tmp, _disk_path(key))
+    except OSError as e:
+        logger.warning(f"No se pudo guardar PDF en disco {key}: {e}")
+    _maybe_prune_disk()
+
+
+def get(key: str) -> Optional[bytes]:
+    """Versión bloqueante (lee disco en el hilo actual); desde async usar get_or_render."""
+    pdf = _get_memory(key)
+    if pdf is None and CACHE_DIR:
+        pdf = _read_disk(key)
+    if pdf is None:
+        with _lock:
+            _stats["misses"] += 1
+    return pdf
+
+
+def put(key: str, pdf: bytes) -> None:
+    """Versión bloqueante (escribe disco en el hilo actual); desde async usar get_or_render."""
+    _store_memory(key, pdf)
+    if CACHE_DIR:
+        _write_disk(key, pdf)
+
+
+def invalidate(kind: str, doc_id: object = None) -> None:
+    """
+    Borra los PDFs de un documento (kind, doc_id). Con doc_id=None borra todos
+    los de ese tipo (por ej. cuando no se conoce el paciente de una evolución).
+    La memoria se libera enseguida; los archivos los borra el hilo de mantenimiento.
+    """
+    global _total_bytes
+    prefix = _doc_prefix(kind, doc_id)
+    with _lock:
+        for key in [k for k in _entries if k.startswith(prefix)]:
+            _total_bytes -= len(_entries.pop(key))
+
+    if CACHE_DIR:
+        _maintenance().submit(_remove_prefix, prefix)
+
+
+def _remove_prefix(prefix: str) -> None:
+    try:
+        with os.scandir(CACHE_DIR) as it:
+            names = [e.name for e in it if e.name.startswith(prefix) and e.name.endswith(".pdf")]
+    except OSError as e:
+        logger.warning(f"No se pudo listar PDF_CACHE_DIR para invalidar {prefix}: {e}")
+        return
+    for name in names:
+        try:
+            os.remove(os.path.join(CACHE_DIR, name))
+        except OSError:
+            pass
+
+
+def _maintenance() -> ThreadPoolExecutor:
+    # Un solo hilo para borrados y poda del nivel disco: no compiten entre sí
+    # ni con el event loop
+    global _maintenance_executor
+    with _lock:
+        if _maintenance_executor is None:
+            _maintenance_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-cache")
+        return _maintenance_executor
+
+
+def prune_disk() -> int:
+    """Aplica la antigüedad máxima y el tope de tamaño del nivel disco. Devuelve los archivos borrados."""
+    if not CACHE_DIR:
+        return 0
+    now = time.time()
+    files = []  # (mtime, tamaño, path)
+    try:
+        with os.scandir(CACHE_DIR) as it:
+            for e in it:
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                if e.name.endswith(".pdf"):
+                    files.append((st.st_mtime, st.st_size, e.path))
+                elif e.name.endswith(".tmp") and now - st.st_mtime > _TMP_MAX_AGE:
+                    files.append((0.0, 0, e.path))
+    except OSError as e:
+        logger.warning(f"No se pudo listar PDF_CACHE_DIR para podar: {e}")
+        return 0
+
+    files.sort()  # más viejo primero
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for mtime, size, path in files:
+        if now - mtime <= DISK_MAX_AGE and total <= DISK_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+        total -= size
+    if removed:
+        with _lock:
+            _stats["disk_pruned"] += removed
+        logger.info(f"[pdf_cache] poda de disco: {removed} archivos, quedan {total // 1024} KB")
+    return removed
+
+
+def _maybe_prune_disk() -> None:
+    global _last_prune
+    now = time.monotonic()
+    with _lock:
+        if _last_prune and now - _last_prune < DISK_PRUNE_INTERVAL:
+            return
+        _last_prune = now
+    _maintenance().submit(prune_disk)
+
+
+async def get_or_render(
+    kind: str,
+    doc_id: object,
+    data: dict,
+    render: Callable[[dict], Awaitable[bytes]],
+) -> bytes:
+    """
+    Devuelve el PDF cacheado para `data` o lo genera con `render(data)` y lo guarda.
+    La lectura / escritura en disco va al threadpool: no frena el event loop.
+    """
+    key = cache_key(kind, data, doc_id)
+    pdf = _get_memory(key)
+    if pdf is None and CACHE_DIR:
+        pdf = await run_in_threadpool(_read_disk, key)
+    if pdf is not None:
+        return pdf
+    with _lock:
+        _stats["misses"] += 1
+    pdf = await render(data)
+    _store_memory(key, pdf)
+    if CACHE_DIR:
+        await run_in_threadpool(_write_disk, key, pdf)
+    return pdf
+
+
+def stats() -> dict:
+    with _lock:
+        return {
+            **_stats,
+            "entries": len(_entries),
+            "bytes": _total_bytes,
+            "max_bytes": MAX_BYTES,
+            "disk_dir": CACHE_DIR,
+            "disk_max_bytes": DISK_MAX_BYTES if CACHE_DIR else None,
+        }
@@ -0,0 +1,96 @@
+"""
+Respuestas de PDF / ZIP en streaming.
+
+Antes cada endpoint armaba un `Response(content=bytes)`: Starlette manda el
+cuerpo de una sola vez y, para los ZIP en lote, el archivo completo vivía en
+un BytesIO además de los PDFs que contiene. Acá:
+
+- `spool()`: archivo temporal que queda en memoria hasta PDF_SPOOL_MAX_BYTES
+  (default 4 MB) y después pasa a disco. Lo usan los ZIP en lote.
+- `temp_path()`: archivo temporal con nombre, para que un worker de
+  pdf_render_pool escriba ahí un resultado grande (PDF unido) en lugar de
+  devolverlo como bytes por pickle.
+- `file_response(f, ...)`: StreamingResponse por bloques desde un archivo /
+  spool, con Content-Length, que cierra (y borra) el temporal al terminar.
+- `bytes_response(pdf, ...)`: igual para un PDF que ya está en memoria (el que
+  devuelve pdf_render_pool o pdf_cache), recorriendo un memoryview sin copiar.
+  Un PDF individual pesa decenas o cientos de KB y ya está en pdf_cache; lo
+  que puede crecer sin tope (lotes) va por archivo.
+"""
+import os
+import tempfile
+from typing import BinaryIO, Iterator
+
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+SPOOL_MAX_BYTES = int(os.getenv("PDF_SPOOL_MAX_BYTES", str(4 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+
+
+def spool() -> BinaryIO:
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode="w+b")
+
+
+def temp_path(suffix: str = ".pdf") -> str:
+    fd, path = tempfile.mkstemp(prefix="pdf_", suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def open_temp(path: str) -> BinaryIO:
+    """Abre `path` y lo borra del directorio: se libera al cerrar el archivo (file_response)."""
+    f = open(path, "rb")
+    os.unlink(path)
+    return f
+
+
+def _headers(filename: str, size: int, inline: bool) -> dict:
+    disposition = "inline" if inline else "attachment"
+    return {
+        "Content-Disposition": f'{disposition}; filename="{filename}"',
+        # Se conserva: asgi_middleware.GZipMiddleware no comprime PDF / ZIP
+        "Content-Length": str(size),
+    }
+
+
+def _iter_bytes(data: bytes) -> Iterator[memoryview]:
+    view = memoryview(data)
+    for start in range(0, len(view), CHUNK_SIZE):
+        yield view[start:start + CHUNK_SIZE]
+
+
+def _iter_file(f: BinaryIO) -> Iterator[bytes]:
+    try:
+        f.seek(0)
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
+
+
+def bytes_response(data: bytes, filename: str, *, media_type: str = "application/pdf", inline: bool = True) -> StreamingResponse:
+    return StreamingResponse(
+        _iter_bytes(data),
+        media_type=media_type,
+        headers=_headers(filename, len(data), inline),
+    )
+
+
+def file_response(f: BinaryIO, filename: str, *, media_type: str = "application/pdf", inline: bool = False) -> StreamingResponse:
+    """
+    Transmite `f` desde el principio; el archivo se cierra al terminar el envío.
+    El cierre va también como background task: corre aunque el cliente se
+    desconecte antes de que el generador arranque (close() es idempotente).
+    """
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    return StreamingResponse(
+        _iter_file(f),
+        media_type=media_type,
+        headers=_headers(filename, size, inline),
+        background=BackgroundTask(f.close),
+    )
@@ -0,0 +1,237 @@
+"""
+Rate limiting por cliente con ventana deslizante aproximada (sliding window counter).
+
+Antes se guardaba una lista con el timestamp de cada request por IP: O(n) por
+request y sin expulsar nunca las IPs inactivas. Ahora cada (regla, cliente)
+ocupa un estado fijo: índice de ventana + contador de la ventana anterior +
+contador de la actual. La estimación es
+
+    anterior * (1 - fracción transcurrida de la ventana actual) + actual
+
+que suaviza el salto de una ventana fija sin guardar timestamps.
+
+Presupuestos por ruta (`RULES`, se usa la primera que coincide):
+
+    auth     POST /auth/*   RATE_LIMIT_AUTH     (default 10/60)   login y credenciales
+    pdf      /pdf/*         RATE_LIMIT_PDF      (default 30/60)   render de PDFs
+    default  resto          RATE_LIMIT_DEFAULT  (default 100/60)
+
+Formato: "<requests>/<segundos>". Un límite 0 desactiva la regla.
+
+Backends (RATE_LIMIT_BACKEND):
+    memory  (default) estado en el proceso; expulsa claves inactivas (LRU).
+            Con varios workers cada uno cuenta por su lado.
+    redis   compartido entre workers/instancias (RATE_LIMIT_REDIS_URL);
+            requiere el paquete `redis`. Si no está, cae a memory.
+Cualquier objeto con `async hit(key, limit, window, now)` sirve de backend
+(ver `set_backend`).
+
+ENV:
+    RATE_LIMIT_MAX_KEYS        (default 50000) tope de claves del backend memory
+    RATE_LIMIT_TRUST_FORWARDED (default 0) usar X-Forwarded-For como IP del
+                               cliente (detrás del proxy de Render)
+"""
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "50000"))
+TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "0").lower() in ("1", "true", "yes")
+
+
+def _parse_budget(env: str, default: str) -> Tuple[int, float]:
+    raw = os.getenv(env, default)
+    try:
+        limit, window = raw.split("/", 1)
+        return int(limit), float(window)
+    except ValueError:
+        logger.warning(f"[rate_limit] {env}={raw!r} inválido; se usa {default}")
+        limit, window = default.split("/", 1)
+        return int(limit), float(window)
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    prefix: str
+    limit: int
+    window: float
+    methods: Optional[frozenset] = None  # None = todos
+
+    def matches(self, method: str, path: str) -> bool:
+        return path.startswith(self.prefix) and (self.methods is None or method in self.methods)
+
+
+RULES: List[Rule] = [
+    Rule("auth", "/auth/", *_parse_budget("RATE_LIMIT_AUTH", "10/60"), methods=frozenset({"POST"})),
+    Rule("pdf", "/pdf/", *_parse_budget("RATE_LIMIT_PDF", "30/60")),
+    Rule("default", "/", *_parse_budget("RATE_LIMIT_DEFAULT", "100/60")),
+]
+
+
+@dataclass(frozen=True)
+class Decision:
+    allowed: bool
+    rule: str
+    limit: int
+    remaining: int
+    retry_after: float  # segundos hasta poder reintentar (0 si allowed)
+
+
+def _estimate(prev: int, curr: int, frac: float) -> float:
+    return prev * (1.0 - frac) + curr
+
+
+def _retry_after(prev: int, curr: int, limit: int, window: float, frac: float) -> float:
+    # Cuándo la estimación deja lugar para un request más
+    if curr + 1 > limit or prev == 0:
+        return window * (1.0 - frac)
+    frac_ok = 1.0 - (limit - 1 - curr) / prev
+    return max(0.0, (frac_ok - frac) * window)
+
+
+class MemoryBackend:
+    """Estado en el proceso: OrderedDict por último acceso, expulsión O(1) amortizada."""
+
+    name = "memory"
+
+    def __init__(self, max_keys: int = MAX_KEYS):
+        self.max_keys = max_keys
+        # key -> [índice de ventana, anterior, actual, ventana (s), último acceso]
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+
+    async def hit(self, key: str, limit: int, window: float, now: float) -> Tuple[bool, float, float]:
+        """Registra un request. Devuelve (permitido, estimación, retry_after)."""
+        idx = int(now // window)
+        frac = (now % window) / window
+        st = self._entries.get(key)
+        if st is None:
+            st = [idx, 0, 0, window, now]
+            self._entries[key] = st
+        elif st[0] != idx:
+            st[1] = st[2] if st[0] == idx - 1 else 0
+            st[0], st[2] = idx, 0
+        st[4] = now
+        self._entries.move_to_end(key)
+        self._evict(now)
+
+        est = _estimate(st[1], st[2], frac)
+        if est + 1 > limit:
+            return False, est, _retry_after(st[1], st[2], limit, window, frac)
+        st[2] += 1
+        return True, est + 1, 0.0
+
+    def _evict(self, now: float) -> None:
+        # El más viejo está al principio: se corta en la primera clave todavía activa
+        while self._entries:
+            key, st = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_keys and now - st[4] < 2 * st[3]:
+                break
+            self._entries.popitem(last=False)
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Contadores por ventana en Redis (INCR + EXPIRE atómico vía Lua)."""
+
+    name = "redis"
+
+    _SCRIPT = """
+    local curr = redis.call('INCR', KEYS[1])
+    if curr == 1 then redis.call('PEXPIRE', KEYS[1], ARGV[1]) end
+    local prev = tonumber(redis.call('GET', KEYS[2]) or '0')
+    local est = prev * tonumber(ARGV[2]) + curr
+    if est > tonumber(ARGV[3]) then
+        redis.call('DECR', KEYS[1])
+        return {0, prev, curr - 1}
+    end
+    return {1, prev, curr}
+    """
+
+    def __init__(self, url: str):
+        import redis.asyncio as aioredis
+        self._redis = aioredis.from_url(url)
+        self._script = self._redis.register_script(self._SCRIPT)
+
+    async def hit(self, key: str, limit: int, window: float, now: float) -> Tuple[bool, float, float]:
+        idx = int(now // window)
+        frac = (now % window) / window
+        ok, prev, curr = await self._script(
+            keys=[f"rl:{key}:{idx}", f"rl:{key}:{idx - 1}"],
+            args=[int(window * 2000), 1.0 - frac, limit],
+        )
+        prev, curr = int(prev), int(curr)
+        if ok:
+            return True, _estimate(prev, curr, frac), 0.0
+        return False, _estimate(prev, curr, frac), _retry_after(prev, curr, limit, window, frac)
+
+    def size(self) -> Optional[int]:
+        return None  # vive en Redis
+
+
+def _make_backend():
+    kind = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+    if kind == "redis":
+        try:
+            return RedisBackend(os.environ["RATE_LIMIT_REDIS_URL"])
+        except Exception as e:
+            logger.warning(f"[rate_limit] backend redis no disponible ({e}); se usa memory")
+    return MemoryBackend()
+
+
+_backend = _make_backend()
+_stats: Dict[str, Dict[str, int]] = {r.name: {"allowed": 0, "rejected": 0} for r in RULES}
+_stats["errors"] = {"backend": 0}
+
+
+def set_backend(backend) -> None:
+    global _backend
+    _backend = backend
+
+
+def rule_for(method: str, path: str) -> Optional[Rule]:
+    for rule in RULES:
+        if rule.matches(method, path):
+            return rule
+    return None
+
+
+def client_ip(headers, client) -> str:
+    """IP del cliente. `headers` es un mapping de headers en minúscula; `client` el (host, port) de ASGI."""
+    if TRUST_FORWARDED:
+        forwarded = headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",", 1)[0].strip()
+    return client[0] if client else "unknown"
+
+
+async def check(method: str, path: str, ip: str) -> Optional[Decision]:
+    """Cuenta el request contra el presupuesto de su ruta. None si ninguna regla aplica."""
+    rule = rule_for(method, path)
+    if rule is None or rule.limit <= 0:
+        return None
+    try:
+        allowed, est, retry_after = await _backend.hit(f"{rule.name}:{ip}", rule.limit, rule.window, time.time())
+    except Exception as e:
+        # Un backend caído no debe tumbar la API: se deja pasar
+        _stats["errors"]["backend"] += 1
+        logger.warning(f"[rate_limit] backend falló: {e}")
+        return None
+    _stats[rule.name]["allowed" if allowed else "rejected"] += 1
+    return Decision(allowed, rule.name, rule.limit, max(0, int(rule.limit - est)), retry_after)
+
+
+def stats() -> dict:
+    return {
+        "backend": getattr(_backend, "name", type(_backend).__name__),
+        "keys": _backend.size() if hasattr(_backend, "size") else None,
+        "rules": {r.name: f"{r.limit}/{int(r.window)}s" for r in RULES},
+        **_stats,
+    }
@@ -0,0 +1,171 @@
+"""
+Instrumentación por request: tiempo de DB, cantidad de queries y tramos
+(render de PDF, Storage).
+
+- Hooks before/after_cursor_execute sobre `database.engine` y sobre el motor
+  sync de `database.async_engine`: cada query suma 1 y sus ms al request en
+  curso (ContextVar; también llega al threadpool de los endpoints sync y a los
+  greenlets de SQLAlchemy async).
+- `span(name)`: suma el tiempo de un tramo (`with request_metrics.span("pdf"):`).
+  Tramos concurrentes del mismo request se suman (pueden superar el total).
+- TimingMiddleware (asgi_middleware.py) abre las métricas del request, agrega
+  `Server-Timing` (visible en la pestaña Network del navegador) y alimenta un
+  histograma de latencia por ruta, con el promedio de queries y de ms de DB:
+  un N+1 se ve como una ruta con muchas queries por request.
+
+Un request que supera REQUEST_QUERY_WARN queries deja un warning en el log.
+
+ENV:
+    REQUEST_QUERY_WARN     (default 50)
+    REQUEST_METRICS_ROUTES (default 300) tope de rutas en el histograma
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+QUERY_WARN = int(os.getenv("REQUEST_QUERY_WARN", "50"))
+MAX_ROUTES = int(os.getenv("REQUEST_METRICS_ROUTES", "300"))
+
+# Límites superiores de cada bucket (ms); el último es +inf
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class RequestStats:
+    __slots__ = ("start", "queries", "db_ms", "spans")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.spans: Dict[str, float] = {}
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+    def server_timing(self) -> str:
+        parts = [f"app;dur={self.elapsed_ms():.1f}"]
+        if self.queries:
+            parts.append(f'db;dur={self.db_ms:.1f};desc="{self.queries} queries"')
+        parts.extend(f"{name};dur={ms:.1f}" for name, ms in self.spans.items())
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_metrics", default=None)
+
+
+def begin() -> RequestStats:
+    stats = RequestStats()
+    _current.set(stats)
+    return stats
+
+
+def current() -> Optional[RequestStats]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str):
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.spans[name] = stats.spans.get(name, 0.0) + (time.perf_counter() - t0) * 1000
+
+
+# ======================
+# Hooks de SQLAlchemy
+# ======================
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_t0 = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    t0 = getattr(context, "_metrics_t0", None)
+    if stats is not None and t0 is not None:
+        stats.queries += 1
+        stats.db_ms += (time.perf_counter() - t0) * 1000
+
+
+def install_db_hooks(*engines) -> None:
+    """Registra los hooks en cada engine sync (para AsyncEngine pasar `.sync_engine`)."""
+    for engine in engines:
+        if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ======================
+# Histogramas por ruta
+# ======================
+_lock = threading.Lock()
+# "GET /turnos/" -> {"buckets": [...], "count", "total_ms", "queries", "db_ms", "max_ms"}
+_routes: Dict[str, dict] = {}
+
+
+def record(route: str, stats: RequestStats, status: int) -> None:
+    total_ms = stats.elapsed_ms()
+    if stats.queries > QUERY_WARN:
+        logger.warning(f"[metrics] {route}: {stats.queries} queries en un request ({stats.db_ms:.0f} ms de DB)")
+    with _lock:
+        h = _routes.get(route)
+        if h is None:
+            if len(_routes) >= MAX_ROUTES:
+                route, h = "(otras)", _routes.get("(otras)")
+            if h is None:
+                h = _routes[route] = {
+                    "buckets": [0] * (len(BUCKETS_MS) + 1),
+                    "count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "queries": 0, "db_ms": 0.0,
+                }
+        h["buckets"][bisect.bisect_left(BUCKETS_MS, total_ms)] += 1
+        h["count"] += 1
+        h["errors"] += status >= 500
+        h["total_ms"] += total_ms
+        h["max_ms"] = max(h["max_ms"], total_ms)
+        h["queries"] += stats.queries
+        h["db_ms"] += stats.db_ms
+
+
+def _percentile(buckets: List[int], count: int, q: float) -> Optional[float]:
+    # Límite superior del bucket que contiene el percentil (None si cae en +inf)
+    target = q * count
+    acc = 0
+    for i, n in enumerate(buckets):
+        acc += n
+        if acc >= target:
+            return BUCKETS_MS[i] if i < len(BUCKETS_MS) else None
+    return None
+
+
+def stats() -> dict:
+    with _lock:
+        routes = {k: {**v, "buckets": list(v["buckets"])} for k, v in _routes.items()}
+    out = {}
+    for route, h in sorted(routes.items(), key=lambda kv: -kv[1]["total_ms"]):
+        n = h["count"]
+        out[route] = {
+            "count": n,
+            "errors": h["errors"],
+            "avg_ms": round(h["total_ms"] / n, 1),
+            "p50_ms": _percentile(h["buckets"], n, 0.50),
+            "p95_ms": _percentile(h["buckets"], n, 0.95),
+            "max_ms": round(h["max_ms"], 1),
+            "avg_queries": round(h["queries"] / n, 1),
+            "avg_db_ms": round(h["db_ms"] / n, 1),
+            "histogram": dict(zip([f"<={b}" for b in BUCKETS_MS] + ["+inf"], h["buckets"])),
+        }
+    return {"buckets_ms": list(BUCKETS_MS), "routes": out}
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from typing import List
 from database import get_db
@@ -13,7 +14,9 @@ from schemas import (
 )
 from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError
-import traceback
+import catalog_cache
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/bases", tags=["BasesSelect"])
 
@@ -32,11 +35,14 @@ def _norm_text(s: str) -> str:
 
 ##########Endpoint laboratorio:
 @router.get("/laboratorio/", response_model=List[LaboratorioOut])
-def listar_laboratorios(db: Session = Depends(get_db)):
+def listar_laboratorios(request: Request, db: Session = Depends(get_db)):
     try:
-        return db.query(Laboratorio).order_by(Laboratorio.laboratorio).all()
+        return catalog_cache.cached_response(request, "laboratorio", lambda: [
+            LaboratorioOut.model_validate(x).model_dump(mode="json")
+            for x in db.query(Laboratorio).order_by(Laboratorio.laboratorio).all()
+        ])
     except Exception as e:
-        print("[laboratorio] ERROR:", e)
+        logger.error(f"[laboratorio] ERROR: {e}")
         return []
 
 @router.post("/laboratorio/", response_model=LaboratorioOut)
@@ -47,6 +53,7 @@ def crear_laboratorio(item: LaboratorioCreate, db: Session = Depends(get_db)):
     nuevo = Laboratorio(**item.dict())
     db.add(nuevo)
     db.commit()
+    catalog_cache.invalidate("laboratorio")
     db.refresh(nuevo)
     return nuevo
 
@@ -58,6 +65,7 @@ def borrar_laboratorio(id: int, db: Session = Depends(get_db)):
     try:
         db.delete(item)
         db.commit()
+        catalog_cache.invalidate("laboratorio")
     except IntegrityError:
         db.rollback()
         raise HTTPException(
@@ -73,14 +81,18 @@ def actualizar_laboratorio(id: int, item: LaboratorioCreate, db: Session = Depen
         raise HTTPException(status_code=404, detail="No encontrado.")
     existente.laboratorio = item.laboratorio
     db.commit()
+    catalog_cache.invalidate("laboratorio")
     db.refresh(existente)
     return existente
 
 
 ###########Endopoint Imagenes:
 @router.get("/imagenes/", response_model=List[ImagenOut])
-def listar_imagenes(db: Session = Depends(get_db)):
-    return db.query(Imagen).order_by(Imagen.imagen).all()
+def listar_imagenes(request: Request, db: Session = Depends(get_db)):
+    return catalog_cache.cached_response(request, "imagenes", lambda: [
+        ImagenOut.model_validate(x).model_dump(mode="json")
+        for x in db.query(Imagen).order_by(Imagen.imagen).all()
+    ])
 
 @router.post("/imagenes/", response_model=ImagenOut)
 def crear_imagen(item: ImagenCreate, db: Session = Depends(get_db)):
@@ -90,6 +102,7 @@ def crear_imagen(item: ImagenCreate, db: Session = Depends(get_db)):
     nuevo = Imagen(**item.dict())
     db.add(nuevo)
     db.commit()
+    catalog_cache.invalidate("imagenes")
     db.refresh(nuevo)
     return nuevo
 
@@ -100,6 +113,7 @@ def actualizar_imagen(id: int, item: ImagenCreate, db: Session = Depends(get_db)
         raise HTTPException(status_code=404, detail="No encontrado.")
     existente.imagen = item.imagen
     db.commit()
+    catalog_cache.invalidate("imagenes")
     db.refresh(existente)
     return existente
 
@@ -111,6 +125,7 @@ def borrar_imagen(id: int, db: Session = Depends(get_db)):
     try:
         db.delete(item)
         db.commit()
+        catalog_cache.invalidate("imagenes")
     except IntegrityError:
         db.rollback()
         raise HTTPException(
@@ -122,14 +137,18 @@ def borrar_imagen(id: int, db: Session = Depends(get_db)):
 
 ########Endpoint otros estudios:
 @router.get("/otros/", response_model=List[OtroEstudio])
-def get_otros(db: Session = Depends(get_db)):
-    return db.query(OtrosEstudios).all()
+def get_otros(request: Request, db: Session = Depends(get_db)):
+    return catalog_cache.cached_response(request, "otros", lambda: [
+        OtroEstudio.model_validate(x).model_dump(mode="json")
+        for x in db.query(OtrosEstudios).all()
+    ])
 
 @router.post("/otros/", response_model=OtroEstudio)
 def crear_otro(item: OtroEstudioCreate, db: Session = Depends(get_db)):
     nuevo = OtrosEstudios(**item.dict())
     db.add(nuevo)
     db.commit()
+    catalog_cache.invalidate("otros")
     db.refresh(nuevo)
     return nuevo
 
@@ -141,6 +160,7 @@ def editar_otro(id: int, item: OtroEstudioUpdate, db: Session = Depends(get_db))
         raise HTTPException(status_code=404, detail="No encontrado")
     existente.estudio = item.estudio
     db.commit()
+    catalog_cache.invalidate("otros")
     db.refresh(existente)
     return existente
 
@@ -152,6 +172,7 @@ def borrar_otro(id: int, db: Session = Depends(get_db)):
     try:
         db.delete(item)
         db.commit()
+        catalog_cache.invalidate("otros")
     except IntegrityError:
         db.rollback()
         raise HTTPException(
@@ -162,8 +183,11 @@ def borrar_otro(id: int, db: Session = Depends(get_db)):
 
 ########Endpoint Especialidad:
 @router.get("/especialidad/", response_model=List[EspecialidadOut])
-def listar_especialidades(db: Session = Depends(get_db)):
-    return db.query(Especialidad).order_by(Especialidad.especialidad).all()
+def listar_especialidades(request: Request, db: Session = Depends(get_db)):
+    return catalog_cache.cached_response(request, "especialidad", lambda: [
+        EspecialidadOut.model_validate(x).model_dump(mode="json")
+        for x in db.query(Especialidad).order_by(Especialidad.especialidad).all()
+    ])
 
 @router.post("/especialidad/", response_model=EspecialidadOut)
 def crear_especialidad(item: EspecialidadCreate, db: Session = Depends(get_db)):
@@ -173,6 +197,7 @@ def crear_especialidad(item: EspecialidadCreate, db: Session = Depends(get_db)):
     nuevo = Especialidad(**item.dict())
     db.add(nuevo)
     db.commit()
+    catalog_cache.invalidate("especialidad")
     db.refresh(nuevo)
     return nuevo
 
@@ -194,6 +219,7 @@ def borrar_especialidad(id: int, db: Session = Depends(get_db)):
 
     db.delete(item)
     db.commit()
+    catalog_cache.invalidate("especialidad")
     return {"mensaje": "Especialidad eliminada correctamente"}
 
 @router.put("/especialidad/{id}", response_model=EspecialidadOut)
@@ -206,14 +232,17 @@ def actualizar_especialidad(id: int, item: EspecialidadCreate, db: Session = Dep
     
     especialidad.especialidad = item.especialidad
     db.commit()
+    catalog_cache.invalidate("especialidad")
     db.refresh(especialidad)
     return especialidad
 
 ####### Endpoint Motivo consulta:
 @router.get("/motivos_consulta/", response_model=List[MotivoConsultaOut])
-def listar_motivos(db: Session = Depends(get_db)):
-    print("✅ Entró al endpoint de motivos_consulta")
-    return db.query(MotivoConsulta).order_by(MotivoConsulta.motivo_consulta).all()
+def listar_motivos(request: Request, db: Session = Depends(get_db)):
+    return catalog_cache.cached_response(request, "motivos_consulta", lambda: [
+        MotivoConsultaOut.model_validate(x).model_dump(mode="json")
+        for x in db.query(MotivoConsulta).order_by(MotivoConsulta.motivo_consulta).all()
+    ])
 
 
 @router.delete("/motivos_consulta/{id_motivo}")
@@ -230,6 +259,7 @@ def borrar_motivo(id_motivo: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Motivo no encontrado.")
     db.delete(motivo)
     db.commit()
+    catalog_cache.invalidate("motivos_consulta")
     return {"mensaje": "Motivo eliminado"}
 
 @router.post("/motivos_consulta/", response_model=MotivoConsultaOut)
@@ -237,6 +267,7 @@ def crear_motivo(motivo: MotivoConsultaCreate, db: Session = Depends(get_db)):
     nuevo_motivo = MotivoConsulta(motivo_consulta=motivo.motivo_consulta)
     db.add(nuevo_motivo)
     db.commit()
+    catalog_cache.invalidate("motivos_consulta")
     db.refresh(nuevo_motivo)
     return nuevo_motivo
 
@@ -247,6 +278,7 @@ def editar_motivo(id: int, motivo: MotivoConsultaBase, db: Session = Depends(get
         raise HTTPException(status_code=404, detail="Motivo no encontrado")
     db_motivo.motivo_consulta = motivo.motivo_consulta
     db.commit()
+    catalog_cache.invalidate("motivos_consulta")
     db.refresh(db_motivo)
     return db_motivo
 
@@ -271,7 +303,7 @@ def listar_cirujanos(db: Session = Depends(get_db)):
             for r in rows
         ]
     except Exception as e:
-        print("[cirujanos] ERROR SQL:", e)
+        logger.error(f"[cirujanos] ERROR SQL: {e}")
         return []
 
 @router.post("/cirujanos/", status_code=201)
@@ -313,6 +345,7 @@ def crear_cirujano(payload: dict, db: Session = Depends(get_db)):
             )
             r2 = db.execute(sql_reactivate, {"cid": row["id"]}).mappings().first()
             db.commit()
+            catalog_cache.invalidate("cirujanos")
             return {"id": r2["id"], "nombre": r2["nombre"]}
 
         # No existe → insertar
@@ -326,6 +359,7 @@ def crear_cirujano(payload: dict, db: Session = Depends(get_db)):
         try:
             created = db.execute(sql_insert, {"nombre": nombre}).mappings().first()
             db.commit()
+            catalog_cache.invalidate("cirujanos")
         except IntegrityError as ie:
             db.rollback()
             # En caso de carrera, si otro lo creó mientras tanto
@@ -339,8 +373,7 @@ def crear_cirujano(payload: dict, db: Session = Depends(get_db)):
         raise
     except Exception as e:
         db.rollback()
-        print("[POST /bases/cirujanos] ERROR SQL:", e)
-        traceback.print_exc()
+        logger.exception(f"[POST /bases/cirujanos] ERROR SQL: {e}")
         raise HTTPException(status_code=500, detail="Error interno al crear cirujano")
 
 @router.put("/cirujanos/{cid}")
@@ -395,6 +428,7 @@ def actualizar_cirujano(cid: str, payload: dict, db: Session = Depends(get_db)):
             {"nombre": nombre, "cid": cid},
         ).mappings().first()
         db.commit()
+        catalog_cache.invalidate("cirujanos")
         if not row_upd:
             raise HTTPException(status_code=404, detail="Cirujano no encontrado")
         return {"id": row_upd["id"], "nombre": row_upd["nombre"]}
@@ -406,8 +440,7 @@ def actualizar_cirujano(cid: str, payload: dict, db: Session = Depends(get_db)):
         raise HTTPException(status_code=409, detail="El cirujano ya existe") from ie
     except Exception as e:
         db.rollback()
-        print("[PUT /bases/cirujanos/{cid}] ERROR SQL:", e)
-        traceback.print_exc()
+        logger.exception(f"[PUT /bases/cirujanos/{{cid}}] ERROR SQL: {e}")
         raise HTTPException(status_code=500, detail="Error interno al actualizar cirujano")
 
 @router.delete("/cirujanos/{cid}")
@@ -428,6 +461,7 @@ def borrar_cirujano(cid: str, db: Session = Depends(get_db)):
             {"cid": cid},
         ).mappings().first()
         db.commit()
+        catalog_cache.invalidate("cirujanos")
         if not res:
             raise HTTPException(status_code=404, detail="Cirujano no encontrado")
         return {"ok": True}
@@ -435,8 +469,7 @@ def borrar_cirujano(cid: str, db: Session = Depends(get_db)):
         raise
     except Exception as e:
         db.rollback()
-        print("[DELETE /bases/cirujanos/{cid}] ERROR SQL:", e)
-        traceback.print_exc()
+        logger.exception(f"[DELETE /bases/cirujanos/{{cid}}] ERROR SQL: {e}")
         raise HTTPException(status_code=500, detail="Error interno al eliminar cirujano")
 
 @router.get("/anestesiologos/")
@@ -457,7 +490,7 @@ def listar_anestesiologos(db: Session = Depends(get_db)):
             for r in rows
         ]
     except Exception as e:
-        print("[anestesiologos] ERROR SQL:", e)
+        logger.error(f"[anestesiologos] ERROR SQL: {e}")
         return []
 
 
@@ -488,6 +521,7 @@ def crear_anestesiologo(payload: dict, db: Session = Depends(get_db)):
          RETURNING id, nombre
         """), {"id": row["id"]}).mappings().first()
         db.commit()
+        catalog_cache.invalidate("anestesiologos")
         return {"id": r2["id"], "nombre": r2["nombre"]}
 
     try:
@@ -497,6 +531,7 @@ def crear_anestesiologo(payload: dict, db: Session = Depends(get_db)):
         RETURNING id, nombre
         """), {"n": nombre}).mappings().first()
         db.commit()
+        catalog_cache.invalidate("anestesiologos")
         return {"id": created["id"], "nombre": created["nombre"]}
     except IntegrityError:
         db.rollback()
@@ -531,6 +566,7 @@ def actualizar_anestesiologo(aid: str, payload: dict, db: Session = Depends(get_
      RETURNING id, nombre
     """), {"n": nombre, "id": aid}).mappings().first()
     db.commit()
+    catalog_cache.invalidate("anestesiologos")
     return {"id": r["id"], "nombre": r["nombre"]}
 
 @router.delete("/anestesiologos/{aid}")
@@ -542,6 +578,7 @@ def borrar_anestesiologo(aid: str, db: Session = Depends(get_db)):
      RETURNING id
     """), {"id": aid}).mappings().first()
     db.commit()
+    catalog_cache.invalidate("anestesiologos")
     if not r:
         raise HTTPException(status_code=404, detail="Anestesiólogo no encontrado")
     return {"ok": True}
@@ -567,7 +604,7 @@ def listar_instrumentadores(db: Session = Depends(get_db)):
             for r in rows
         ]
     except Exception as e:
-        print("[instrumentadores] ERROR SQL:", e)
+        logger.error(f"[instrumentadores] ERROR SQL: {e}")
         return []
 
 
@@ -597,6 +634,7 @@ def crear_instrumentador(payload: dict, db: Session = Depends(get_db)):
          RETURNING id_instrumentador AS id, nombre
         """), {"id": row["id_instrumentador"]}).mappings().first()
         db.commit()
+        catalog_cache.invalidate("instrumentadores")
         return {"id": r2["id"], "nombre": r2["nombre"]}
 
     try:
@@ -606,6 +644,7 @@ def crear_instrumentador(payload: dict, db: Session = Depends(get_db)):
         RETURNING id_instrumentador AS id, nombre
         """), {"n": nombre}).mappings().first()
         db.commit()
+        catalog_cache.invalidate("instrumentadores")
         return {"id": created["id"], "nombre": created["nombre"]}
     except IntegrityError:
         db.rollback()
@@ -644,6 +683,7 @@ def actualizar_instrumentador(iid: int, payload: dict, db: Session = Depends(get
      RETURNING id_instrumentador AS id, nombre
     """), {"n": nombre, "id": iid}).mappings().first()
     db.commit()
+    catalog_cache.invalidate("instrumentadores")
     return {"id": r["id"], "nombre": r["nombre"]}
 
 @router.delete("/instrumentadores/{iid}")
@@ -655,6 +695,7 @@ def borrar_instrumentador(iid: int, db: Session = Depends(get_db)):
      RETURNING id_instrumentador
     """), {"id": iid}).mappings().first()
     db.commit()
+    catalog_cache.invalidate("instrumentadores")
     if not r:
         raise HTTPException(status_code=404, detail="Instrumentador no encontrado")
     return {"ok": True}
@@ -681,12 +722,10 @@ def listar_procedimientos(db: Session = Depends(get_db)):
             """)
         ).mappings().all()
         result = [dict(r) for r in rows]
-        print(f"[procedimientos][GET] Devolviendo {len(result)} técnicas:", result)
+        logger.debug("[procedimientos][GET] Devolviendo %d técnicas", len(result))
         return result
     except Exception as e:
-        print("[procedimientos][GET] ERROR SQL:", e)
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"[procedimientos][GET] ERROR SQL: {e}")
         return []
 
 
@@ -755,7 +794,7 @@ def crear_procedimiento(payload: dict, db: Session = Depends(get_db)):
         raise HTTPException(status_code=409, detail="La técnica ya existe")
     except Exception as e:
         db.rollback()
-        print("[procedimientos][POST] ERROR SQL:", e)
+        logger.error(f"[procedimientos][POST] ERROR SQL: {e}")
         raise HTTPException(status_code=500, detail="Error interno al crear procedimiento")
 
 @router.put("/procedimientos/{pid}")
@@ -824,7 +863,7 @@ def actualizar_procedimiento(pid: int, payload: dict, db: Session = Depends(get_
         raise HTTPException(status_code=409, detail="La técnica ya existe")
     except Exception as e:
         db.rollback()
-        print("[procedimientos][PUT] ERROR SQL:", e)
+        logger.error(f"[procedimientos][PUT] ERROR SQL: {e}")
         raise HTTPException(status_code=500, detail="Error interno al actualizar procedimiento")
 
 
@@ -851,7 +890,7 @@ def borrar_procedimiento(pid: int, db: Session = Depends(get_db)):
         raise
     except Exception as e:
         db.rollback()
-        print("[procedimientos][DELETE] ERROR SQL:", e)
+        logger.error(f"[procedimientos][DELETE] ERROR SQL: {e}")
         raise HTTPException(status_code=500, detail="Error interno al borrar procedimiento")
 
 
@@ -882,23 +921,26 @@ def listar_tipos_anestesia(db: Session = Depends(get_db)):
     })
 
 @router.get("/diagnosticos/")
-def listar_diagnosticos(db: Session = Depends(get_db)):
+def listar_diagnosticos(request: Request, db: Session = Depends(get_db)):
     """
     Lista diagnósticos ACTIVOS ordenados por nombre.
     Devuelve [{id, nombre, id_diagnostico, nombre_diagnostico}]
     """
-    rows = db.execute(text(
-        """
-        SELECT id_diagnostico AS id,
-               nombre_diagnostico AS nombre,
-               id_diagnostico,
-               nombre_diagnostico
-          FROM diagnosticos
-         WHERE activo = TRUE
-         ORDER BY LOWER(nombre_diagnostico)
-        """
-    )).mappings().all()
-    return [dict(r) for r in rows]
+    def _load():
+        rows = db.execute(text(
+            """
+            SELECT id_diagnostico AS id,
+                   nombre_diagnostico AS nombre,
+                   id_diagnostico,
+                   nombre_diagnostico
+              FROM diagnosticos
+             WHERE activo = TRUE
+             ORDER BY LOWER(nombre_diagnostico)
+            """
+        )).mappings().all()
+        return [dict(r) for r in rows]
+
+    return catalog_cache.cached_response(request, "diagnosticos", _load)
 
 @router.get("/diagnosticos/search")
 def buscar_diagnosticos(q: str = "", db: Session = Depends(get_db)):
@@ -955,6 +997,7 @@ def crear_diagnostico(payload: dict, db: Session = Depends(get_db)):
             """
         ), {"id": cur["id_diagnostico"]}).mappings().first()
         db.commit()
+        catalog_cache.invalidate("diagnosticos")
         return r
 
     r = db.execute(text(
@@ -965,6 +1008,7 @@ def crear_diagnostico(payload: dict, db: Session = Depends(get_db)):
         """
     ), {"n": nombre}).mappings().first()
     db.commit()
+    catalog_cache.invalidate("diagnosticos")
     return r
 
 @router.put("/diagnosticos/{did}")
@@ -1004,6 +1048,7 @@ def actualizar_diagnostico(did: int, payload: dict, db: Session = Depends(get_db
         """
     ), {"n": nombre, "id": did}).mappings().first()
     db.commit()
+    catalog_cache.invalidate("diagnosticos")
     return r
 
 @router.delete("/diagnosticos/{did}")
@@ -1018,6 +1063,7 @@ def borrar_diagnostico(did: int, db: Session = Depends(get_db)):
         """
     ), {"id": did}).mappings().first()
     db.commit()
+    catalog_cache.invalidate("diagnosticos")
     if not r:
         raise HTTPException(status_code=404, detail="Diagnóstico not found o ya inactivo")
     return {"ok": True}
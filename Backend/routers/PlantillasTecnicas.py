@@ -1,8 +1,12 @@
 # routers/PlantillasTecnicas.py
-from fastapi import APIRouter, Depends, HTTPException
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from database import get_db
+import catalog_cache
+
+logger = logging.getLogger(__name__)
 
 router_catalogos = APIRouter(prefix="/plantillas", tags=["plantillas_tecnicas"])
 
@@ -11,8 +15,8 @@ def test_endpoint():
     return {"message": "PlantillasTecnicas router funcionando"}
 
 @router_catalogos.get("/plantillas_tecnicas_cx", summary="Listar plantillas técnicas activas")
-def listar_plantillas_tecnicas(db: Session = Depends(get_db)):
-    try:
+def listar_plantillas_tecnicas(request: Request, db: Session = Depends(get_db)):
+    def _load():
         rows = db.execute(
             text("""
                 SELECT id_plantilla AS id,
@@ -23,9 +27,12 @@ def listar_plantillas_tecnicas(db: Session = Depends(get_db)):
                  ORDER BY tecnica
             """)
         ).mappings().all()
-        return rows
+        return [dict(r) for r in rows]
+
+    try:
+        return catalog_cache.cached_response(request, "plantillas_tecnicas", _load)
     except Exception as e:
-        print("[plantillas_tecnicas_cx][GET] ERROR:", e)
+        logger.error(f"[plantillas_tecnicas_cx][GET] ERROR: {e}")
         raise HTTPException(status_code=500, detail="Error al listar plantillas técnicas")
 
 @router_catalogos.post("/plantillas_tecnicas_cx", status_code=201, summary="Crear plantilla técnica")
@@ -45,11 +52,12 @@ def crear_plantilla_tecnica(payload: dict, db: Session = Depends(get_db)):
             {"tecnica": tecnica, "desarrollo": desarrollo}
         ).mappings().first()
         db.commit()
+        catalog_cache.invalidate("plantillas_tecnicas")
         return row
     except Exception as e:
         db.rollback()
         msg = "Ya existe una plantilla técnica con esa técnica" if "unique" in str(e).lower() else "No se pudo crear la plantilla técnica"
-        print("[plantillas_tecnicas_cx][POST] ERROR:", e)
+        logger.error(f"[plantillas_tecnicas_cx][POST] ERROR: {e}")
         raise HTTPException(status_code=400, detail=msg)
 
 @router_catalogos.put("/plantillas_tecnicas_cx/{id_plantilla}", summary="Actualizar plantilla técnica")
@@ -74,11 +82,12 @@ def actualizar_plantilla_tecnica(id_plantilla: int, payload: dict, db: Session =
         if not row:
             raise HTTPException(status_code=404, detail="Plantilla técnica no encontrada")
         db.commit()
+        catalog_cache.invalidate("plantillas_tecnicas")
         return row
     except Exception as e:
         db.rollback()
         msg = "Ya existe una plantilla técnica con esa técnica" if "unique" in str(e).lower() else "No se pudo actualizar la plantilla técnica"
-        print("[plantillas_tecnicas_cx][PUT] ERROR:", e)
+        logger.error(f"[plantillas_tecnicas_cx][PUT] ERROR: {e}")
         raise HTTPException(status_code=400, detail=msg)
 
 @router_catalogos.delete("/plantillas_tecnicas_cx/{id_plantilla}", status_code=204, summary="Borrar plantilla técnica")
@@ -96,10 +105,11 @@ def borrar_plantilla_tecnica(id_plantilla: int, db: Session = Depends(get_db)):
         if res.rowcount == 0:
             raise HTTPException(status_code=404, detail="Plantilla técnica no encontrada")
         db.commit()
+        catalog_cache.invalidate("plantillas_tecnicas")
         return
     except Exception as e:
         db.rollback()
-        print("[plantillas_tecnicas_cx][DELETE] ERROR:", e)
+        logger.error(f"[plantillas_tecnicas_cx][DELETE] ERROR: {e}")
         raise HTTPException(status_code=500, detail="No se pudo borrar la plantilla técnica")
 
 # Export alias so main.py can import either name
@@ -1,9 +1,12 @@
 # routers/PlantillasTecnicasSimple.py
+import logging
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from database import get_db
 
+logger = logging.getLogger(__name__)
+
 router_simple = APIRouter(prefix="/plantillas", tags=["plantillas_simple"])
 
 @router_simple.get("/test")
@@ -25,5 +28,5 @@ def listar_plantillas_simple(db: Session = Depends(get_db)):
         ).mappings().all()
         return [dict(r) for r in rows]
     except Exception as e:
-        print(f"[plantillas_simple][GET] ERROR: {e}")
+        logger.error(f"[plantillas_simple][GET] ERROR: {e}")
         return []
@@ -3,16 +3,19 @@
 Servicio de generación de PDFs de partes quirúrgicos.
 
 - Mantiene la lógica de render (presentación) separada de los routers.
-- Ofrece builders para HZB y un modo overlay para Intecnus (plantilla PDF).
+- Ofrece builders para HZB, resumen de HC y unión de PDFs (impresión en lote).
 
 Dependencias:
-  pip install reportlab PyPDF2
+  pip install reportlab pypdf   (o PyPDF2)
 """
 from __future__ import annotations
 
+import logging
 from io import BytesIO
-from typing import Dict, Any, Iterable, Tuple, Optional
+from functools import partial
+from typing import Dict, Any, BinaryIO, Iterable, Tuple, Optional
 import os
+from types import MappingProxyType
 script_dir = os.path.dirname(os.path.abspath(__file__))
 from datetime import datetime
 
@@ -30,15 +33,29 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_JUSTIFY, TA_LEFT
 from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
 # Importar Canvas base para uso en canvasmaker
 from reportlab.pdfgen import canvas as rl_canvas
 
-# Para Intecnus con overlay sobre PDF pre-hecho (opcional)
-try:
-    from PyPDF2 import PdfReader, PdfWriter  # type: ignore[reportMissingImports]
-    _HAS_PYPDF2 = True
-except Exception:
-    _HAS_PYPDF2 = False
+logger = logging.getLogger(__name__)
+
+# Para unir PDFs (impresión en lote; opcional).
+# PDF_LIB elige la librería: "pypdf" (writer más rápido, sucesor de PyPDF2) o
+# "PyPDF2". Sin definir, se usa pypdf si está instalado.
+_PDF_LIB = None
+for _lib in ((os.getenv("PDF_LIB"),) if os.getenv("PDF_LIB") else ("pypdf", "PyPDF2")):
+    try:
+        if _lib == "pypdf":
+            from pypdf import PdfReader, PdfWriter  # type: ignore[reportMissingImports]
+        elif _lib == "PyPDF2":
+            from PyPDF2 import PdfReader, PdfWriter  # type: ignore[reportMissingImports]
+        else:
+            continue
+        _PDF_LIB = _lib
+        break
+    except Exception:
+        continue
+_HAS_PYPDF2 = _PDF_LIB is not None  # nombre histórico: "hay librería para leer/escribir PDFs"
 
 # ---------------------------------------------------------------------
 # Helpers comunes
@@ -125,6 +142,96 @@ def _styles():
     ))
     return styles
 
+# ---------------------------------------------------------------------
+# Contexto de render (una vez por proceso)
+# ---------------------------------------------------------------------
+# Todo lo que no depende de los datos del documento: estilos, logo ya
+# decodificado y coordenadas del encabezado / pie. Se arma en el primer uso
+# (o en warm_up) y lo comparten todos los builders y todas las páginas.
+
+_PAGE_W, _PAGE_H = A4
+_MARGIN_X = 16 * mm
+_TITLE_Y = _PAGE_H - 15 * mm
+_SEPARATOR_Y = _PAGE_H - 25 * mm
+_PAGE_NUMBER_Y = 10 * mm
+_SIGNATURE_Y = 30 * mm
+# Borde superior de la zona de firma (línea + leyenda "Firma" + aire)
+_SIGNATURE_TOP = _SIGNATURE_Y + 6 * mm
+_SIGNATURE_W = 50 * mm
+_LOGO_BOX_W = 25 * mm
+_LOGO_BOX_H = 15 * mm
+
+
+class _RenderContext:
+    __slots__ = ("styles", "logo", "logo_rect", "signature_x1", "signature_x2", "_title_x")
+
+    def __init__(self):
+        sheet = _styles()
+        # Estilos congelados: mapping de sólo lectura, nadie puede alterarlos entre renders
+        self.styles = MappingProxyType({name: sheet[name] for name in sheet.byName})
+
+        self.logo = None
+        self.logo_rect = None
+        logo_path = _find_logo()
+        if logo_path:
+            try:
+                self.logo = ImageReader(logo_path)
+                iw, ih = self.logo.getSize()
+                # Mismo cálculo que preserveAspectRatio + anchor 'nw' de drawImage
+                scale = min(_LOGO_BOX_W / iw, _LOGO_BOX_H / ih)
+                w, h = iw * scale, ih * scale
+                box_y = _TITLE_Y - (_LOGO_BOX_H / 2)
+                self.logo_rect = (_MARGIN_X, box_y + _LOGO_BOX_H - h, w, h)
+            except Exception as e:
+                logger.warning(f"Error cargando logo: {e}")
+                self.logo = None
+
+        self.signature_x1 = (_PAGE_W - _SIGNATURE_W) / 2.0
+        self.signature_x2 = (_PAGE_W + _SIGNATURE_W) / 2.0
+        self._title_x: Dict[str, float] = {}
+
+    def title_x(self, title: str) -> float:
+        """x de inicio del título centrado (el ancho se mide una sola vez por título)."""
+        x = self._title_x.get(title)
+        if x is None:
+            x = (_PAGE_W - pdfmetrics.stringWidth(title, "Helvetica-Bold", 16)) / 2.0
+            self._title_x[title] = x
+        return x
+
+
+def _find_logo() -> Optional[str]:
+    # Buscar logo en ambas ubicaciones (raíz en producción, static en local)
+    for candidate in ("logo_hzb.jpg", os.path.join("static", "logo_hzb.jpg")):
+        logo_path = os.path.join(script_dir, "..", candidate)
+        if os.path.exists(logo_path):
+            return logo_path
+    return None
+
+
+_render_ctx: Optional[_RenderContext] = None
+
+
+def _ctx() -> _RenderContext:
+    global _render_ctx
+    if _render_ctx is None:
+        _render_ctx = _RenderContext()
+    return _render_ctx
+
+
+def warm_up() -> None:
+    """
+    Pre-carga lo que pagaría el primer render de un proceso: contexto de render
+    (estilos, logo), módulos de ReportLab y métricas de las fuentes base.
+    La llama el initializer de los workers de pdf_render_pool.
+    """
+    ctx = _ctx()
+    buf = BytesIO()
+    c = rl_canvas.Canvas(buf, pagesize=A4)
+    for font in ("Helvetica", "Helvetica-Bold", "Times-Roman"):
+        c.setFont(font, 10)
+    Paragraph("warm up", ctx.styles["FieldValue"]).wrap(100 * mm, 20 * mm)
+    c.save()
+
 # Helper para respetar saltos de línea del textarea (\n -> <br/>)
 
 def _fmt(value: Any) -> str:
@@ -217,105 +324,102 @@ def _kv_table(pairs: Iterable[Tuple[str, Any]], styles) -> Table:
     return tbl
 
 # ---------------------------------------------------------------------
-# Header / Footer comunes (logo + fecha + nro de página)
+# Header / Footer comunes (logo + nro de página X/Y + firma)
 # ---------------------------------------------------------------------
 
 def _draw_header_footer(canvas, doc, *, title: str = "Resumen de Historia Clínica"):
-    """Dibuja encabezado y pie con fecha/hora y numeración de página."""
-    width, height = A4
+    """Dibuja el encabezado (título + logo) y el separador."""
+    ctx = _ctx()
     canvas.saveState()
 
     canvas.setFont("Helvetica-Bold", 16)
-    # Título centrado
-    canvas.drawCentredString(width / 2.0, height - 15 * mm, title)
+    # Título centrado (x precalculada por título)
+    canvas.drawString(ctx.title_x(title), _TITLE_Y, title)
 
-    # Logo del hospital a la izquierda, centrado con el título
-    try:
-        # Buscar logo en ambas ubicaciones (local y producción)
-        logo_path = os.path.join(script_dir, "..", "logo_hzb.jpg")
-        if not os.path.exists(logo_path):
-            # Si no existe en la raíz, buscar en static (entorno local)
-            logo_path = os.path.join(script_dir, "..", "static", "logo_hzb.jpg")
-        
-        if os.path.exists(logo_path):
-            # Redimensionar logo a un tamaño más pequeño
-            logo_width = 25 * mm
-            logo_height = 15 * mm
-            # Centrar verticalmente con el título (height - 15mm es la posición del título)
-            logo_y = height - 15 * mm - (logo_height / 2)
-            canvas.drawImage(logo_path, 16 * mm, logo_y, 
-                           width=logo_width, height=logo_height, 
-                           preserveAspectRatio=True, anchor='nw')
-    except Exception as e:
-        print(f"Error cargando logo: {e}")
+    # Logo del hospital a la izquierda, centrado con el título (ya decodificado)
+    if ctx.logo is not None:
+        x, y, w, h = ctx.logo_rect
+        canvas.drawImage(ctx.logo, x, y, width=w, height=h)
 
     # Separador fino (más abajo para dar espacio al logo)
     canvas.setLineWidth(0.5)
-    canvas.line(16 * mm, height - 25 * mm, width - 16 * mm, height - 25 * mm)
-
-    # Pie de página
-    canvas.setFont("Helvetica", 9)
-    # Solo numeración a la derecha (sin fecha de emisión para partes quirúrgicos)
-    # Numeración a la derecha (formato: 1/2, 2/2, 1/3, 2/3, 3/3)
-    current_page = canvas.getPageNumber()
-    
-    # Numeración simple: mostrar solo el número de página actual
-    # Para el formato "1/5, 2/5, etc." necesitaríamos una estrategia de dos pasadas
-    canvas.drawRightString(width - 16 * mm, 10 * mm, f"{current_page}")
-
-    # Línea de firma en páginas 1 y 2 (fija), no en la última
-    current_page = canvas.getPageNumber()
-    total_pages = getattr(doc, 'pageCount', None)
-    
-    # Dibujar firma fija en páginas 1 y 2, no en la última
-    if current_page == 1 or current_page == 2:
-        # Páginas 1 y 2: Firma fija a 30mm del borde
-        sig_line_w = 50 * mm
-        sig_x1 = (width - sig_line_w) / 2.0
-        sig_x2 = (width + sig_line_w) / 2.0
-        sig_y = 30 * mm  # Posición fija desde abajo
-        
-        canvas.setLineWidth(0.3)
-        canvas.line(sig_x1, sig_y, sig_x2, sig_y)
-        canvas.setFont("Helvetica", 10)
-        canvas.drawCentredString(width / 2.0, sig_y - 4 * mm, "Firma")
+    canvas.line(_MARGIN_X, _SEPARATOR_Y, _PAGE_W - _MARGIN_X, _SEPARATOR_Y)
 
+    # La numeración "X/Y" y la firma del pie las escribe _NumberedCanvas al
+    # guardar, cuando ya se conoce el total de páginas.
     canvas.restoreState()
 
-def _draw_footer_with_signature(canvas, doc):
-    """Dibuja pie de página con línea de firma solo en la última página."""
-    width, height = A4
-    canvas.saveState()
-
-    # Firma centrada al pie (solo en la última página)
-    sig_line_w = 50 * mm
-    sig_y = 30 * mm
-    sig_x1 = (width - sig_line_w) / 2.0
-    sig_x2 = (width + sig_line_w) / 2.0
-
+def _draw_signature_line(canvas, ctx: _RenderContext):
     canvas.setLineWidth(0.3)
-    canvas.line(sig_x1, sig_y, sig_x2, sig_y)
+    canvas.line(ctx.signature_x1, _SIGNATURE_Y, ctx.signature_x2, _SIGNATURE_Y)
     canvas.setFont("Helvetica", 10)
-    canvas.drawCentredString(width / 2.0, sig_y - 4 * mm, "Firma")
+    canvas.drawCentredString(_PAGE_W / 2.0, _SIGNATURE_Y - 4 * mm, "Firma")
 
-    canvas.restoreState()
+
+class _NumberedCanvas(rl_canvas.Canvas):
+    """
+    Canvas de páginas diferidas: showPage() sólo guarda el estado de la página
+    y save() recorre las páginas guardadas escribiendo "X/Y" y la firma del pie,
+    ya con el total real. El layout de Platypus corre una sola vez.
+
+    signature:
+      "last"        -> firma sólo en la última página (resumen de HC)
+      "except_last" -> firma en todas menos la última (HZB: la última ya trae
+                       la firma dentro del bloque del equipo quirúrgico)
+      None          -> sin firma
+    """
+
+    def __init__(self, *args, signature: Optional[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._signature = signature
+        self._saved_pages = []
+
+    def showPage(self):
+        self._saved_pages.append(dict(self.__dict__))
+        self._startPage()
+
+    def save(self):
+        total = len(self._saved_pages)
+        ctx = _ctx()
+        for state in self._saved_pages:
+            self.__dict__.update(state)
+            self._draw_page_footer(ctx, total)
+            super().showPage()
+        super().save()
+
+    def _draw_page_footer(self, ctx: _RenderContext, total: int):
+        page = self._pageNumber
+        self.saveState()
+        self.setFont("Helvetica", 9)
+        self.drawRightString(_PAGE_W - _MARGIN_X, _PAGE_NUMBER_Y, f"{page}/{total}")
+        is_last = page == total
+        if (self._signature == "last" and is_last) or (self._signature == "except_last" and not is_last):
+            _draw_signature_line(self, ctx)
+        self.restoreState()
 
 # ---------------------------------------------------------------------
 # HZB: builder Platypus
 # ---------------------------------------------------------------------
 
 def build_pdf_hzb_bytes(data: Dict[str, Any]) -> bytes:
-    """Arma el PDF HZB (layout limpio con Platypus)."""
+    """Arma el PDF HZB y lo devuelve como bytes (lo que viaja desde pdf_render_pool)."""
     buf = BytesIO()
+    write_pdf_hzb(data, buf)
+    # getvalue() no copia: BytesIO entrega su buffer interno si nadie más lo usa
+    return buf.getvalue()
+
+
+def write_pdf_hzb(data: Dict[str, Any], out: BinaryIO) -> None:
+    """Escribe el PDF HZB (layout limpio con Platypus) en `out` (BytesIO, archivo, spool)."""
     doc = SimpleDocTemplate(
-        buf,
+        out,
         pagesize=A4,
         leftMargin=16*mm,
         rightMargin=16*mm,
         topMargin=28*mm,    # más espacio por header
         bottomMargin=60*mm, # más espacio para la firma en página 1
     )
-    styles = _styles()
+    styles = _ctx().styles
 
     story = []
 
@@ -513,86 +617,45 @@ def build_pdf_hzb_bytes(data: Dict[str, Any]) -> bytes:
     def _on_page(c, d):
         _draw_header_footer(c, d, title="Parte Quirúrgico - HZB")
 
-    # Para poder mostrar total de páginas, asignamos pageCount a doc
-    # ReportLab no provee directamente el total de páginas antes de build,
-    # pero podemos usar onLaterPages y onFirstPage para asignar número de página
-    # y hacer un dos-pasadas o usar doc.afterFlowable para contar páginas.
-    # Aquí hacemos una solución simple con build con canvas que actualiza doc.page y doc.pageCount.
-
-    # Decorar canvas para guardar pageCount al final, usando rl_canvas.Canvas
-    class NumberedCanvas(rl_canvas.Canvas):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-            self._page_count = 0
-
-        def showPage(self):
-            self._page_count += 1
-            super().showPage()
-
-        def save(self):
-            # Al guardar, exponemos el total al doc para el footer "Página X de Y"
-            try:
-                self._doc.pageCount = self._page_count + 1 if self._page_count == self._pageNumber else self._page_count
-            except Exception:
-                self._doc.pageCount = self._page_count
-            super().save()
-
-    doc.build(story, onFirstPage=_on_page, onLaterPages=_on_page, canvasmaker=NumberedCanvas)
-    out = buf.getvalue()
-    buf.close()
-    return out
-
+    doc.build(
+        story,
+        onFirstPage=_on_page,
+        onLaterPages=_on_page,
+        canvasmaker=partial(_NumberedCanvas, signature="except_last"),
+    )
 
-# ---------------------------------------------------------------------
-# Intecnus (opcional): overlay sobre PDF plantilla
-# ---------------------------------------------------------------------
 
-def build_pdf_intecnus_overlay_bytes(background_pdf: bytes, fields: Dict[str, Tuple[float, float, str]]) -> bytes:
+def merge_pdfs_bytes(pdfs: Iterable[bytes]) -> bytes:
     """
-    Crea un PDF para Intecnus escribiendo texto en posiciones absolutas (overlay) sobre
-    un PDF de plantilla existente (background).
-
-    Parámetros:
-      - background_pdf: bytes del PDF de plantilla (1 o más páginas)
-      - fields: dict { nombre_campo: (x_mm, y_mm, valor_str) }
-                Coordenadas en milímetros desde la esquina inferior izquierda.
-
-    Requiere PyPDF2.
+    Une varios PDFs en uno solo, en el orden recibido (impresión en lote).
+    Requiere pypdf o PyPDF2.
     """
     if not _HAS_PYPDF2:
-        raise RuntimeError("PyPDF2 no instalado. Instalá con: pip install PyPDF2")
+        raise RuntimeError("pypdf / PyPDF2 no instalado. Instalá con: pip install pypdf")
 
-    # Preparamos un PDF con el texto en las posiciones pedidas
-    overlay_buf = BytesIO()
-    from reportlab.pdfgen import canvas as _canvas
-    c = _canvas.Canvas(overlay_buf, pagesize=A4)
-    c.setFont("Helvetica", 10)
+    out = BytesIO()
+    _write_merged(pdfs, out)
+    return out.getvalue()
 
-    for _, (x_mm_pos, y_mm_pos, value) in fields.items():
-        x = float(x_mm_pos) * mm
-        y = float(y_mm_pos) * mm
-        c.drawString(x, y, str(value or ""))
 
-    c.save()
-    overlay_pdf = overlay_buf.getvalue()
-    overlay_buf.close()
+def merge_pdfs_to_file(pdfs: Iterable[bytes], path: str) -> str:
+    """Como merge_pdfs_bytes, pero escribe en `path` (lotes grandes: no vuelve por pickle)."""
+    if not _HAS_PYPDF2:
+        raise RuntimeError("pypdf / PyPDF2 no instalado. Instalá con: pip install pypdf")
 
-    # Mezclar overlay con background
-    reader_bg = PdfReader(BytesIO(background_pdf))
-    reader_ov = PdfReader(BytesIO(overlay_pdf))
-    writer = PdfWriter()
+    # r+b y no wb: si el request ya lo abandonó (y borró el path), no se recrea
+    with open(path, "r+b") as out:
+        out.truncate()
+        _write_merged(pdfs, out)
+    return path
 
-    num_pages = len(reader_bg.pages)
-    for i in range(num_pages):
-        page_bg = reader_bg.pages[i]
-        # Si overlay tiene 1 página, la reutilizamos; si tiene igual cantidad, usamos la i
-        page_ov = reader_ov.pages[min(i, len(reader_ov.pages) - 1)]
-        page_bg.merge_page(page_ov)  # mezcla
-        writer.add_page(page_bg)
 
-    out = BytesIO()
+def _write_merged(pdfs: Iterable[bytes], out: BinaryIO) -> None:
+    writer = PdfWriter()
+    for pdf in pdfs:
+        for page in PdfReader(BytesIO(pdf)).pages:
+            writer.add_page(page)
     writer.write(out)
-    return out.getvalue()
 
 
 # ---------------------------------------------------------------------
@@ -600,17 +663,23 @@ def build_pdf_intecnus_overlay_bytes(background_pdf: bytes, fields: Dict[str, Tu
 # ---------------------------------------------------------------------
 
 def build_resumen_hc_bytes(data: Dict[str, Any]) -> bytes:
-    """Arma el PDF del resumen de historia clínica."""
+    """Arma el PDF del resumen de historia clínica y lo devuelve como bytes."""
     buf = BytesIO()
+    write_resumen_hc(data, buf)
+    return buf.getvalue()
+
+
+def write_resumen_hc(data: Dict[str, Any], out: BinaryIO) -> None:
+    """Escribe el PDF del resumen de historia clínica en `out`."""
     doc = SimpleDocTemplate(
-        buf,
+        out,
         pagesize=A4,
         leftMargin=16*mm,
         rightMargin=16*mm,
         topMargin=28*mm,
         bottomMargin=18*mm,
     )
-    styles = _styles()
+    styles = _ctx().styles
 
     story = []
 
@@ -827,16 +896,17 @@ def build_resumen_hc_bytes(data: Dict[str, Any]) -> bytes:
             story.append(Paragraph(f"<b>Descripción:</b> {_fmt(descripcion)}", styles["FieldValue"]))
             story.append(Spacer(1, 6))
 
-    def _on_first_page(c, d):
-        _draw_header_footer(c, d, title="Resumen de Historia Clínica")
-    
-    def _on_later_pages(c, d):
+    def _on_page(c, d):
         _draw_header_footer(c, d, title="Resumen de Historia Clínica")
-        # Agregar firma solo en la última página
-        if hasattr(d, 'page') and hasattr(d, 'pageCount') and d.page == d.pageCount:
-            _draw_footer_with_signature(c, d)
-
-    doc.build(story, onFirstPage=_on_first_page, onLaterPages=_on_later_pages)
-    out = buf.getvalue()
-    buf.close()
-    return out
\ No newline at end of file
+
+    # La firma de la última página se dibuja sobre el margen inferior: este
+    # espacio final la deja libre (si no entra, la firma queda en una página nueva)
+    story.append(Spacer(1, _SIGNATURE_TOP - doc.bottomMargin))
+
+    # Firma sólo en la última página real (la decide el canvas al guardar)
+    doc.build(
+        story,
+        onFirstPage=_on_page,
+        onLaterPages=_on_page,
+        canvasmaker=partial(_NumberedCanvas, signature="last"),
+    )
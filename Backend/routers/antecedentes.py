@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from database import get_db
 import models
 import schemas
+import pdf_cache
 
 router = APIRouter(prefix="/antecedentes", tags=["Antecedentes"])
 
@@ -15,6 +16,7 @@ def crear_antecedente(antecedente: schemas.AntecedenteCreate, db: Session = Depe
     db_antecedente = models.Antecedente(**antecedente.dict())
     db.add(db_antecedente)
     db.commit()
+    pdf_cache.invalidate("resumen_hc", antecedente.id_paciente)
     db.refresh(db_antecedente)
     return db_antecedente
 
@@ -42,6 +44,7 @@ def actualizar_antecedentes(id_paciente: int, antecedentes: schemas.AntecedenteC
         nuevo_antecedente = models.Antecedente(id_paciente=id_paciente, **data)
         db.add(nuevo_antecedente)
         db.commit()
+        pdf_cache.invalidate("resumen_hc", id_paciente)
         db.refresh(nuevo_antecedente)
         return nuevo_antecedente
 
@@ -51,5 +54,6 @@ def actualizar_antecedentes(id_paciente: int, antecedentes: schemas.AntecedenteC
         setattr(antecedentes_existentes, key, value)
 
     db.commit()
+    pdf_cache.invalidate("resumen_hc", id_paciente)
     db.refresh(antecedentes_existentes)
     return antecedentes_existentes
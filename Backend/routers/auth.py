@@ -5,7 +5,7 @@ import jwt
 import os
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from database import SessionLocal
+from database import get_db
 from models_login_neon import LoginNeon
 from password_utils import hash_password, verify_password, is_hashed
 
@@ -20,14 +20,6 @@ class LoginResponse(BaseModel):
     token: str
     user: dict
 
-# Función para obtener sesión de base de datos
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # Configuración JWT
 JWT_SECRET = os.getenv("JWT_SECRET_KEY", "tu_clave_secreta_muy_larga_y_segura_para_produccion")
 JWT_ALGORITHM = "HS256"
@@ -52,7 +44,7 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
         return {"username": username}
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expirado")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:  # PyJWT 2.x (jwt.JWTError es de python-jose)
         raise HTTPException(status_code=401, detail="Token inválido")
 
 @router.post("/login", response_model=LoginResponse)
@@ -1,4 +1,5 @@
 # routers/CodigosFacturacion.py
+import logging
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import text
@@ -44,6 +45,8 @@ class CodigoItem(BaseModel):
         return v
 
 # ====== Router ======
+logger = logging.getLogger(__name__)
+
 router_codfac = APIRouter(prefix="/procedimientos", tags=["codigos_facturacion"])
 
 @router_codfac.get("/{id_procedimiento}/codigos", summary="Listar códigos de facturación de un procedimiento")
@@ -67,7 +70,7 @@ def listar_codigos(id_procedimiento: int, db: Session = Depends(get_db)):
         ).mappings().all()
         return rows
     except Exception as e:
-        print("[codigos_facturacion][GET] ERROR:", e)
+        logger.error(f"[codigos_facturacion][GET] ERROR: {e}")
         raise HTTPException(status_code=500, detail="Error al listar códigos de facturación")
 
 @router_codfac.put("/{id_procedimiento}/codigos", summary="Reemplazar todos los códigos de un procedimiento")
@@ -144,7 +147,7 @@ def reemplazar_codigos(id_procedimiento: int, payload: List[CodigoItem], db: Ses
         raise
     except Exception as e:
         db.rollback()
-        print("[codigos_facturacion][PUT] ERROR:", e)
+        logger.error(f"[codigos_facturacion][PUT] ERROR: {e}")
         raise HTTPException(status_code=500, detail="No se pudieron guardar los códigos de facturación")
 
 @router_codfac.post("/{id_procedimiento}/codigos", summary="Crear un código de facturación (una fila)")
@@ -186,7 +189,7 @@ def crear_codigo(id_procedimiento: int, item: CodigoItem, db: Session = Depends(
         return row
     except Exception as e:
         db.rollback()
-        print("[codigos_facturacion][POST] ERROR:", e)
+        logger.error(f"[codigos_facturacion][POST] ERROR: {e}")
         raise HTTPException(status_code=400, detail="No se pudo crear el código de facturación")
 
 
@@ -236,7 +239,7 @@ def actualizar_codigo(id_procedimiento: int, id_codigo: int, item: CodigoItem, d
         raise
     except Exception as e:
         db.rollback()
-        print("[codigos_facturacion][PATCH] ERROR:", e)
+        logger.error(f"[codigos_facturacion][PATCH] ERROR: {e}")
         raise HTTPException(status_code=400, detail="No se pudo actualizar el código de facturación")
 
 
@@ -259,7 +262,7 @@ def eliminar_codigo(id_procedimiento: int, id_codigo: int, db: Session = Depends
         raise
     except Exception as e:
         db.rollback()
-        print("[codigos_facturacion][DELETE one] ERROR:", e)
+        logger.error(f"[codigos_facturacion][DELETE one] ERROR: {e}")
         raise HTTPException(status_code=500, detail="No se pudo eliminar el código de facturación")
 
 
@@ -274,7 +277,7 @@ def eliminar_todos_codigos(id_procedimiento: int, db: Session = Depends(get_db))
         return
     except Exception as e:
         db.rollback()
-        print("[codigos_facturacion][DELETE all] ERROR:", e)
+        logger.error(f"[codigos_facturacion][DELETE all] ERROR: {e}")
         raise HTTPException(status_code=500, detail="No se pudieron eliminar los códigos de facturación")
 
 # Export alias
@@ -3,10 +3,21 @@ from sqlalchemy.orm import Session
 from database import get_db
 from models import Consulta, Evolucion, MotivoConsulta
 from schemas import ConsultaCreate, ConsultaOut, ConsultaUpdate, EvolucionCreate, EvolucionOut, EvolucionUpdate
+import pdf_cache
 
 router = APIRouter()
 
 
+def invalidar_resumen_por_consulta(db: Session, *ids_consulta) -> None:
+    """Invalida el resumen de HC de los pacientes de esas consultas (las evoluciones no guardan el paciente)."""
+    ids = {i for i in ids_consulta if i is not None}
+    if not ids:
+        return
+    filas = db.query(Consulta.id_paciente).filter(Consulta.id_consulta.in_(ids)).distinct()
+    for (id_paciente,) in filas:
+        pdf_cache.invalidate("resumen_hc", id_paciente)
+
+
 # ------------------------------------------
 # CONSULTAS
 # ------------------------------------------
@@ -16,6 +27,7 @@ def crear_consulta(consulta: ConsultaCreate, db: Session = Depends(get_db)):
     nueva = Consulta(**consulta.dict())
     db.add(nueva)
     db.commit()
+    pdf_cache.invalidate("resumen_hc", nueva.id_paciente)
     db.refresh(nueva)
     return nueva
 
@@ -47,6 +59,7 @@ def actualizar_consulta(id_consulta: int, datos: ConsultaUpdate, db: Session = D
     for key, value in datos.dict(exclude_unset=True).items():
         setattr(consulta, key, value)
     db.commit()
+    pdf_cache.invalidate("resumen_hc", consulta.id_paciente)
     db.refresh(consulta)
     return consulta
 
@@ -61,8 +74,10 @@ def eliminar_consulta(id_consulta: int, db: Session = Depends(get_db)):
     db.query(Evolucion).filter(Evolucion.id_consulta == id_consulta).delete()
 
     # Borrar la consulta
+    id_paciente = consulta.id_paciente
     db.delete(consulta)
     db.commit()
+    pdf_cache.invalidate("resumen_hc", id_paciente)
     return {"mensaje": "Consulta y evoluciones eliminadas"}
 
 
@@ -75,6 +90,7 @@ def crear_evolucion(evolucion: EvolucionCreate, db: Session = Depends(get_db)):
     nueva = Evolucion(**evolucion.dict())
     db.add(nueva)
     db.commit()
+    invalidar_resumen_por_consulta(db, nueva.id_consulta)
     db.refresh(nueva)
     return nueva
 
@@ -89,9 +105,11 @@ def actualizar_evolucion(id_evolucion: int, datos: EvolucionUpdate, db: Session
     evo = db.query(Evolucion).filter(Evolucion.id == id_evolucion).first()
     if not evo:
         raise HTTPException(status_code=404, detail="Evolución no encontrada")
+    id_consulta_anterior = evo.id_consulta
     for key, value in datos.dict(exclude_unset=True).items():
         setattr(evo, key, value)
     db.commit()
+    invalidar_resumen_por_consulta(db, id_consulta_anterior, evo.id_consulta)
     db.refresh(evo)
     return evo
 
@@ -4,6 +4,7 @@ from database import get_db
 import models, schemas
 from models import Evolucion
 from schemas import EvolucionCreate  # or use EvolucionBase if preferred
+from .consultas import invalidar_resumen_por_consulta
 
 router = APIRouter(prefix="/evoluciones", tags=["Evoluciones"])
 
@@ -14,6 +15,7 @@ def crear_evolucion(evolucion: schemas.EvolucionCreate, db: Session = Depends(ge
     nueva_evolucion = models.Evolucion(**evolucion.dict())
     db.add(nueva_evolucion)
     db.commit()
+    invalidar_resumen_por_consulta(db, nueva_evolucion.id_consulta)
     db.refresh(nueva_evolucion)
     return nueva_evolucion
 
@@ -34,8 +36,10 @@ def eliminar_evolucion(id_evolucion: int, db: Session = Depends(get_db)):
     evolucion = db.query(Evolucion).filter(Evolucion.id_evolucion == id_evolucion).first()
     if not evolucion:
         raise HTTPException(status_code=404, detail="Evolución no encontrada")
+    id_consulta = evolucion.id_consulta
     db.delete(evolucion)
     db.commit()
+    invalidar_resumen_por_consulta(db, id_consulta)
     return {"mensaje": "Evolución eliminada correctamente"}
 
 
@@ -46,11 +50,13 @@ def actualizar_evolucion(id_evolucion: int, evolucion_in: schemas.EvolucionCreat
     evolucion = db.query(models.Evolucion).filter(models.Evolucion.id_evolucion == id_evolucion).first()
     if not evolucion:
         raise HTTPException(status_code=404, detail="Evolución no encontrada")
+    id_consulta_anterior = evolucion.id_consulta
     # Actualizar campos
     evolucion.id_consulta = evolucion_in.id_consulta
     evolucion.fecha_evolucion = evolucion_in.fecha_evolucion
     evolucion.contenido = evolucion_in.contenido
     db.commit()
+    invalidar_resumen_por_consulta(db, id_consulta_anterior, evolucion.id_consulta)
     db.refresh(evolucion)
     return evolucion
 
@@ -1,18 +1,20 @@
+import logging
 from fastapi import APIRouter, Depends, UploadFile, File, Form
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from database import get_db
+import pdf_cache
 from models import LaboratorioPaciente, ImagenPaciente, OtroEstudioPaciente, Laboratorio
 # Importar base de datos de "otros estudios"
 from models import OtrosEstudios
 from schemas import LaboratorioPacienteOut, ImagenPacienteOut, OtroEstudioPacienteOut
 from datetime import datetime, date
-import tempfile
 import requests
 from fastapi import HTTPException
 from os import getenv
 import unicodedata
 import re
+from . import storage_http
 
 def normalizar_nombre(nombre: str) -> str:
     nombre = unicodedata.normalize('NFKD', nombre).encode('ASCII', 'ignore').decode('utf-8')
@@ -58,38 +60,24 @@ async def upload_to_supabase(file: UploadFile, subfolder: str, custom_filename:
     }
     mime = file.content_type or mime_map.get(ext, "application/octet-stream")
 
-    # Guardar temporalmente
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=f".{ext}")
-    try:
-        contents = await file.read()
-        tmp.write(contents)
-        tmp.flush()
-        tmp_path = tmp.name
-    finally:
-        tmp.close()
-
     # Generar clave
     from datetime import datetime
     timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
     key = custom_filename or (f"{timestamp}_{file.filename}")
 
-    # Subir vía REST
-    url = f"{SUPABASE_URL}/storage/v1/object/{subfolder}/{key}"
-    headers = {
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-        "Content-Type": mime,
-        "x-upsert": "true",
-    }
-    with open(tmp_path, "rb") as f:
-        res = requests.post(url, headers=headers, data=f)
-    # Limpiar temporal
-    import os
-    os.remove(tmp_path)
-
-    if res.status_code not in (200, 201):
-        raise HTTPException(status_code=500, detail=f"Error al subir archivo: {res.text}")
+    # Subir por bloques directo a Storage (sin temporal ni copia en memoria)
+    try:
+        await storage_http.StorageClient(SUPABASE_URL, SUPABASE_KEY, subfolder).upload_stream(
+            key, file, mime, upsert=True,
+        )
+    except storage_http.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except storage_http.StorageError as e:
+        raise HTTPException(status_code=500, detail=f"Error al subir archivo: {e}")
     return key
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/examenes", tags=["Exámenes Complementarios"])
 
 @router.post("/laboratorio", response_model=LaboratorioPacienteOut)
@@ -132,8 +120,7 @@ async def crear_laboratorio(
         ruta_archivo   = f"{SUPABASE_URL}/storage/v1/object/public/laboratorios/{key}"
 
         # DEBUG: imprimir a consola si quieres verificar
-        print(f"[crear_laboratorio] key={key}, nombre_archivo={nombre_archivo}")
-        print ("El filename es:", filename)
+        logger.debug(f"[crear_laboratorio] key={key}, nombre_archivo={nombre_archivo}")
     # 6) Persistir en Neon
     nuevo = LaboratorioPaciente(
         id_paciente    = id_paciente,
@@ -143,10 +130,11 @@ async def crear_laboratorio(
         nombre_archivo = nombre_archivo,
         ruta_archivo   = ruta_archivo,
     )
-    print("NOMBRE_ARCHIVO ANTES DE GUARDAR:", nombre_archivo)
+    logger.debug(f"NOMBRE_ARCHIVO ANTES DE GUARDAR: {nombre_archivo}")
     db.add(nuevo)
     db.commit()
     db.refresh(nuevo)
+    pdf_cache.invalidate("resumen_hc", nuevo.id_paciente)
     return nuevo
 
 
@@ -235,6 +223,7 @@ async def actualizar_laboratorio(
     # 4. Guardar en la base de datos
     db.commit()
     db.refresh(estudio)
+    pdf_cache.invalidate("resumen_hc", estudio.id_paciente)
     return estudio
 
 @router.delete("/laboratorio/{id_estudio}", response_model=dict)
@@ -251,7 +240,7 @@ def eliminar_laboratorio(id_estudio: int, db: Session = Depends(get_db)):
     # ───────────── BORRAR ARCHIVO EN SUPABASE ─────────────
     if estudio.nombre_archivo:
         key = f"{estudio.id_paciente}/{estudio.nombre_archivo}"
-        print(f"[DELETE] Borrando archivo Supabase con key: {key}")
+        logger.debug(f"[DELETE] Borrando archivo Supabase con key: {key}")
         try:
             if supabase_client is not None:
                 res = supabase_client.storage.from_(SUPABASE_BUCKET_LABS).remove([key])
@@ -265,8 +254,10 @@ def eliminar_laboratorio(id_estudio: int, db: Session = Depends(get_db)):
             raise HTTPException(status_code=500, detail=f"Error inesperado al eliminar archivo: {e}")
 
     # ───────────── BORRAR DE NEON ─────────────
+    id_paciente = estudio.id_paciente
     db.delete(estudio)
     db.commit()
+    pdf_cache.invalidate("resumen_hc", id_paciente)
 
     return {"detail": "Estudio de laboratorio eliminado correctamente"}
 
@@ -317,6 +308,7 @@ async def crear_imagen(
     db.add(estudio)
     db.commit()
     db.refresh(estudio)
+    pdf_cache.invalidate("resumen_hc", estudio.id_paciente)
     return estudio
 
 
@@ -384,6 +376,7 @@ async def actualizar_imagen(
 
     db.commit()
     db.refresh(estudio)
+    pdf_cache.invalidate("resumen_hc", estudio.id_paciente)
     return estudio
 
 
@@ -409,8 +402,10 @@ def eliminar_imagen(id_estudio: int, db: Session = Depends(get_db)):
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error inesperado al eliminar imagen: {e}")
 
+    id_paciente = estudio.id_paciente
     db.delete(estudio)
     db.commit()
+    pdf_cache.invalidate("resumen_hc", id_paciente)
     return {"detail": "Estudio de imagen eliminado correctamente"}
 
 
@@ -457,6 +452,7 @@ async def crear_otro(
     db.add(estudio)
     db.commit()
     db.refresh(estudio)
+    pdf_cache.invalidate("resumen_hc", estudio.id_paciente)
     return estudio
 
 
@@ -525,6 +521,7 @@ async def actualizar_otro(
 
     db.commit()
     db.refresh(estudio)
+    pdf_cache.invalidate("resumen_hc", estudio.id_paciente)
     return estudio
 
 
@@ -554,6 +551,8 @@ def eliminar_otro(id_estudio: int, db: Session = Depends(get_db)):
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error inesperado al eliminar otro estudio: {e}")
 
+    id_paciente = estudio.id_paciente
     db.delete(estudio)
     db.commit()
+    pdf_cache.invalidate("resumen_hc", id_paciente)
     return {"detail": "Otro estudio eliminado correctamente"}
\ No newline at end of file
@@ -0,0 +1,209 @@
+# routers/historia_clinica.py
+"""
+Capa de acceso a datos de la historia clínica completa de un paciente.
+
+Una sola sentencia (CTEs + json_agg por sección) trae datos personales,
+antecedentes, exámenes, procedimientos, interconsultas y consultas con sus
+evoluciones: un único round-trip a Neon en lugar de seis.
+
+La usan el PDF de resumen (/pdf/resumen-hc/{id}) y el endpoint JSON
+/pacientes/{id}/historia-completa.
+"""
+import logging
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_async_db
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["Pacientes"])
+
+SQL_HISTORIA_COMPLETA = text("""
+    WITH
+    datos_personales AS (
+        SELECT
+            p.id_paciente,
+            p.nombre,
+            p.dni,
+            p.fecha_nacimiento,
+            EXTRACT(YEAR FROM age(p.fecha_nacimiento)) AS edad,
+            s.sexo AS sexo,
+            c.nombre_cobertura AS cobertura,
+            p.beneficio,
+            n.nombre_nacionalidad AS nacionalidad,
+            l.nombre_localidad AS localidad,
+            p.telefono,
+            p.email,
+            p.anexo,
+            p.activo
+        FROM pacientes p
+        LEFT JOIN sexo s ON p.sexo = s.id_sexo
+        LEFT JOIN coberturas c ON p.cobertura = c.id_cobertura
+        LEFT JOIN nacionalidades n ON p.nacionalidad = n.id_nacionalidad
+        LEFT JOIN localidades l ON p.localidad = l.id_localidad
+        WHERE p.id_paciente = :id_paciente
+    ),
+    antecedentes AS (
+        SELECT
+            a.id_paciente,
+            a.medicos,
+            a.quirurgicos,
+            a.alergicos,
+            a.toxicos,
+            a.familiares,
+            a.ginecoobstetricos
+        FROM antecedentes a
+        WHERE a.id_paciente = :id_paciente
+        LIMIT 1
+    ),
+    examenes AS (
+        -- Laboratorios
+        SELECT
+            'laboratorio'::text AS tipo_examen,
+            l.id,
+            l.fecha,
+            lab.laboratorio AS tipo_estudio,
+            l.descripcion
+        FROM laboratorios_pacientes l
+        LEFT JOIN laboratorio lab ON l.id_laboratorio = lab.id
+        WHERE l.id_paciente = :id_paciente
+
+        UNION ALL
+
+        -- Imágenes
+        SELECT
+            'imagen'::text AS tipo_examen,
+            i.id,
+            i.fecha,
+            img.imagen AS tipo_estudio,
+            i.descripcion
+        FROM imagenes_pacientes i
+        LEFT JOIN imagenes img ON i.id_imagen = img.id
+        WHERE i.id_paciente = :id_paciente
+
+        UNION ALL
+
+        -- Otros estudios
+        SELECT
+            'otro'::text AS tipo_examen,
+            o.id,
+            o.fecha,
+            oe.estudio AS tipo_estudio,
+            o.descripcion
+        FROM otros_estudios_pacientes o
+        LEFT JOIN otros_estudios oe ON o.id_otro = oe.id
+        WHERE o.id_paciente = :id_paciente
+    ),
+    procedimientos AS (
+        SELECT
+            pp.id_procedimiento_paciente,
+            pp.fecha,
+            t.nombre_tecnica as procedimiento_base,
+            tc.nombre as tipo_cirugia,
+            pp.patologia,
+            pp.cultivo,
+            d.nombre_diagnostico as diagnostico_pre,
+            pq.anexo_diagnostico,
+            pq.anexo_procedimiento,
+            t2.nombre_tecnica as procedimiento_quirurgico
+        FROM procedimientos_pacientes pp
+        LEFT JOIN tecnicas t ON pp.id_procedimiento_base = t.id_tecnica
+        LEFT JOIN tipos_cirugia tc ON pp.tipo_cirugia = tc.id_tipo
+        LEFT JOIN partes_quirurgicos pq ON pp.id_procedimiento_paciente = pq.id_procedimiento_paciente
+        LEFT JOIN diagnosticos d ON pq.id_diagnostico_pre = d.id_diagnostico
+        LEFT JOIN tecnicas t2 ON pq.id_procedimiento = t2.id_tecnica
+        WHERE pp.id_paciente = :id_paciente
+    ),
+    interconsultas AS (
+        SELECT
+            ic.id_interconsulta,
+            ic.fecha,
+            e.especialidad,
+            ic.descripcion
+        FROM interconsultas ic
+        LEFT JOIN especialidad e ON ic.especialidad = e.id
+        WHERE ic.id_paciente = :id_paciente
+    ),
+    consultas AS (
+        SELECT
+            c.id_consulta,
+            c.fecha_consulta,
+            mc.motivo_consulta,
+            c.motivo as id_motivo,
+            COALESCE(
+                json_agg(
+                    json_build_object(
+                        'id_evolucion', e.id_evolucion,
+                        'fecha_evolucion', e.fecha_evolucion,
+                        'contenido', e.contenido
+                    )
+                ) FILTER (WHERE e.id_evolucion IS NOT NULL),
+                '[]'::json
+            ) as evoluciones
+        FROM consultas c
+        LEFT JOIN motivos_consulta mc ON c.motivo = mc.id_motivo
+        LEFT JOIN evoluciones e ON c.id_consulta = e.id_consulta
+        WHERE c.id_paciente = :id_paciente
+        GROUP BY c.id_consulta, c.fecha_consulta, mc.motivo_consulta, c.motivo
+    )
+    SELECT
+        (SELECT row_to_json(dp) FROM datos_personales dp) AS datos_personales,
+        (SELECT row_to_json(a) FROM antecedentes a) AS antecedentes,
+        COALESCE((SELECT json_agg(x ORDER BY x.fecha DESC) FROM examenes x), '[]'::json) AS examenes,
+        COALESCE((SELECT json_agg(x ORDER BY x.fecha DESC) FROM procedimientos x), '[]'::json) AS procedimientos,
+        COALESCE((SELECT json_agg(x ORDER BY x.fecha DESC) FROM interconsultas x), '[]'::json) AS interconsultas,
+        COALESCE((SELECT json_agg(x ORDER BY x.fecha_consulta DESC) FROM consultas x), '[]'::json) AS consultas
+""")
+
+SECCIONES = ("antecedentes", "examenes", "procedimientos", "interconsultas", "consultas")
+
+
+def _json(value):
+    # psycopg2/asyncpg ya decodifican json; por las dudas aceptamos texto
+    if isinstance(value, (str, bytes)):
+        return json.loads(value)
+    return value
+
+
+async def fetch_historia_completa(db: AsyncSession, id_paciente: int) -> Optional[dict]:
+    """
+    Devuelve {datos_personales, antecedentes, examenes, procedimientos,
+    interconsultas, consultas} o None si el paciente no existe.
+    Las fechas vienen como texto ISO (salen de json_agg).
+    """
+    row = (await db.execute(SQL_HISTORIA_COMPLETA, {"id_paciente": id_paciente})).mappings().first()
+    datos_personales = _json(row["datos_personales"]) if row else None
+    if not datos_personales:
+        return None
+
+    historia = {"datos_personales": datos_personales}
+    for seccion in SECCIONES:
+        historia[seccion] = _json(row[seccion])
+    return historia
+
+
+def historia_a_datos_pdf(historia: dict) -> dict:
+    """Aplana la historia al dict que espera build_resumen_hc_bytes."""
+    data = dict(historia["datos_personales"])
+    if historia.get("antecedentes"):
+        data.update(historia["antecedentes"])
+    for seccion in ("examenes", "procedimientos", "interconsultas", "consultas"):
+        data[seccion] = historia[seccion]
+    return data
+
+
+@router.get("/pacientes/{id_paciente}/historia-completa", summary="Historia clínica completa (JSON)")
+async def obtener_historia_completa(id_paciente: int, db: AsyncSession = Depends(get_async_db)):
+    try:
+        historia = await fetch_historia_completa(db, id_paciente)
+    except Exception as e:
+        logger.error(f"[historia-completa] ERROR SQL: {e}")
+        raise HTTPException(status_code=500, detail="Error obteniendo la historia clínica")
+    if historia is None:
+        raise HTTPException(status_code=404, detail="Paciente no encontrado")
+    return historia
@@ -0,0 +1,112 @@
+# routers/image_variants.py
+"""
+Variantes livianas de las fotos (miniatura + tamaño pantalla) con Pillow.
+
+Las cámaras del quirófano suben originales de varios MB; la galería sólo
+necesita una miniatura y una versión para ver en pantalla. Al subir una foto
+se generan, junto al original, dos archivos hermanos:
+
+    {id}/abcd.jpg               original (sin tocar: es el registro clínico)
+    {id}/abcd.thumb.webp        miniatura   (IMAGE_THUMB_SIZE,   default 320 px)
+    {id}/abcd.display.webp      pantalla    (IMAGE_DISPLAY_SIZE, default 1600 px)
+
+Las variantes se re-codifican sin EXIF (ni GPS ni datos de la cámara) y con
+la orientación ya aplicada. Formato WebP si Pillow lo soporta; si no, JPEG.
+
+`make_variants()` es CPU puro: los endpoints async la llaman con
+run_in_threadpool para no frenar el event loop.
+"""
+import logging
+import os
+from io import BytesIO
+from typing import Dict, Iterable, Optional, Tuple
+
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+THUMB_SIZE = int(os.getenv("IMAGE_THUMB_SIZE", "320"))
+DISPLAY_SIZE = int(os.getenv("IMAGE_DISPLAY_SIZE", "1600"))
+
+if features.check("webp"):
+    VARIANT_EXT, VARIANT_CONTENT_TYPE, _FORMAT = "webp", "image/webp", "WEBP"
+else:  # pragma: no cover - Pillow sin libwebp
+    VARIANT_EXT, VARIANT_CONTENT_TYPE, _FORMAT = "jpg", "image/jpeg", "JPEG"
+
+# nombre -> (lado máximo en px, calidad)
+VARIANTS = {
+    "thumb": (THUMB_SIZE, 75),
+    "display": (DISPLAY_SIZE, 82),
+}
+
+_IMAGE_EXTS = {"jpg", "jpeg", "png", "webp", "bmp", "tif", "tiff", "heic"}
+
+
+def is_image(filename: Optional[str], content_type: Optional[str]) -> bool:
+    if content_type and content_type.startswith("image/"):
+        return True
+    ext = (filename or "").rsplit(".", 1)[-1].lower() if "." in (filename or "") else ""
+    return ext in _IMAGE_EXTS
+
+
+def variant_key(key: str, variant: str) -> str:
+    """'12/abcd.jpg' -> '12/abcd.thumb.webp'"""
+    base = key.rsplit(".", 1)[0] if "." in key.rsplit("/", 1)[-1] else key
+    return f"{base}.{variant}.{VARIANT_EXT}"
+
+
+def variant_keys(key: str) -> Dict[str, str]:
+    return {name: variant_key(key, name) for name in VARIANTS}
+
+
+def is_variant_name(name: str) -> bool:
+    """True si el nombre de archivo es una variante (para ocultarla en los listados)."""
+    return any(name.endswith(f".{v}.{VARIANT_EXT}") for v in VARIANTS)
+
+
+def _encode(img: Image.Image, max_side: int, quality: int) -> bytes:
+    out = img.copy()
+    out.thumbnail((max_side, max_side), Image.LANCZOS)
+    buf = BytesIO()
+    # Sin exif=...: Pillow no copia metadatos al re-codificar
+    if _FORMAT == "WEBP":
+        out.save(buf, "WEBP", quality=quality, method=4)
+    else:
+        out.save(buf, "JPEG", quality=quality, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def make_variants(data: bytes) -> Dict[str, Tuple[bytes, str]]:
+    """
+    Devuelve {"thumb": (bytes, content_type), "display": (bytes, content_type)}.
+    Si `data` no es una imagen que Pillow pueda abrir, devuelve {} (se sube sólo el original).
+    """
+    try:
+        img = Image.open(BytesIO(data))
+        # JPEG: decodifica directamente a una escala reducida (mucho más rápido para 12+ MP)
+        img.draft("RGB", (DISPLAY_SIZE, DISPLAY_SIZE))
+        img = ImageOps.exif_transpose(img)
+        keep_alpha = _FORMAT == "WEBP" and "A" in img.getbands()
+        if img.mode != ("RGBA" if keep_alpha else "RGB"):
+            img = img.convert("RGBA" if keep_alpha else "RGB")
+        return {
+            name: (_encode(img, max_side, quality), VARIANT_CONTENT_TYPE)
+            for name, (max_side, quality) in VARIANTS.items()
+        }
+    except Exception as e:
+        logger.warning(f"[image_variants] no se pudieron generar variantes: {e}")
+        return {}
+
+
+def variant_urls(key: str, url_for, existing: Optional[Iterable[str]] = None) -> Dict[str, Optional[str]]:
+    """
+    {"thumb_url", "display_url"} para `key`. Con `existing` (nombres de archivo
+    del listado del bucket) sólo devuelve URL de las variantes que existen;
+    fotos viejas sin variantes quedan en None y el front usa el original.
+    """
+    names = set(existing) if existing is not None else None
+    urls: Dict[str, Optional[str]] = {}
+    for name, vkey in variant_keys(key).items():
+        present = names is None or vkey.rsplit("/", 1)[-1] in names
+        urls[f"{name}_url"] = url_for(vkey) if present else None
+    return urls
@@ -4,6 +4,8 @@ from sqlalchemy.orm import Session
 from typing import List
 import os
 from database import get_db
+import pdf_cache
+import signed_urls
 import models
 import schemas
 import unicodedata
@@ -12,6 +14,7 @@ from storage3.exceptions import StorageApiError
 from pathlib import Path
 from mimetypes import guess_type
 import requests
+from . import storage_http
 
 # inicia Supabase storage (robusto y tolerante a claves faltantes)
 from dotenv import load_dotenv
@@ -25,6 +28,7 @@ SUPABASE_KEY = (
     or os.getenv("SUPABASE_ANON_KEY", "")
 )
 SUPABASE_BUCKET_INTERCONSULTAS = os.getenv("SUPABASE_BUCKET_INTERCONSULTAS", "interconsultas")
+ARCHIVO_URL_TTL = 300  # segundos de validez de las URLs firmadas de adjuntos
 
 try:
     from supabase import create_client
@@ -32,6 +36,12 @@ try:
 except Exception:
     supabase = None
 
+# Subidas por streaming (httpx async) al bucket de interconsultas
+_storage = (
+    storage_http.StorageClient(SUPABASE_URL, SUPABASE_KEY, SUPABASE_BUCKET_INTERCONSULTAS)
+    if (SUPABASE_URL and SUPABASE_KEY) else None
+)
+
 
 router = APIRouter(
     tags=["interconsultas"],
@@ -94,6 +104,19 @@ def _detect_mime(filename: str, fallback: str = "application/octet-stream") -> s
     mime, _ = guess_type(filename)
     return mime or fallback
 
+async def _subir_archivo(archivo: UploadFile, key: str, mime: str) -> None:
+    """Sube el adjunto por bloques (upsert) y traduce los errores a HTTPException."""
+    if _storage is None:
+        raise HTTPException(status_code=500, detail="Supabase no configurado")
+    try:
+        await _storage.upload_stream(key, archivo, mime, upsert=True)
+    except storage_http.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except storage_http.StorageError as e:
+        raise HTTPException(status_code=500, detail=f"Error al subir archivo directo a Supabase: {e}")
+    # Mismo path, contenido nuevo: que el próximo pedido firme de nuevo
+    signed_urls.invalidate(SUPABASE_BUCKET_INTERCONSULTAS, key)
+
 # -------------------------------------------------
 # Endpoint para crear interconsulta (create)
 # -------------------------------------------------
@@ -113,9 +136,8 @@ async def create_interconsulta(
     1) Valida que la especialidad exista.
     2) Si se adjunta un archivo:
         - Normaliza el nombre del archivo con la especialidad y fecha.
-        - Guarda temporalmente el archivo con la extensión correcta.
         - Detecta el tipo MIME correcto.
-        - Sube el archivo a Supabase Storage usando requests.post.
+        - Sube el archivo por bloques a Supabase Storage (async, sin temporal).
     3) Guarda la información de la interconsulta en la base de datos.
     """
     nombre_archivo = None
@@ -141,37 +163,15 @@ async def create_interconsulta(
         nombre_archivo_local = f"ic_{tag}_{fecha.isoformat()}{ext}"
         key = f"{id_paciente}/{nombre_archivo_local}"
 
-        import tempfile
-
-        # Guardar archivo temporalmente con la extensión correcta
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            tmp.write(await archivo.read())
-            tmp_path = tmp.name
-
         # Detectar MIME correcto basándose en la extensión
         mime = _detect_mime(archivo.filename)
 
-        # Subir archivo a Supabase Storage usando requests.post
-        try:
-            url = f"{SUPABASE_URL}/storage/v1/object/interconsultas/{key}"
-            headers = {
-                "Authorization": f"Bearer {SUPABASE_KEY}",
-                "Content-Type": mime,
-                "x-upsert": "true",
-            }
-            with open(tmp_path, "rb") as f:
-                res = requests.post(url, headers=headers, data=f)
-                if res.status_code not in (200, 201):
-                    raise HTTPException(status_code=500, detail=f"Error al subir archivo (HTTP {res.status_code}): {res.text}")
-        except Exception as e:
-            os.remove(tmp_path)
-            raise HTTPException(status_code=500, detail=f"Error al subir archivo directo a Supabase: {e}")
+        # Subir el archivo por bloques directo a Supabase Storage (sin temporal)
+        await _subir_archivo(archivo, key, mime)
 
         # Guardar el nombre normalizado para la DB
         nombre_archivo = nombre_archivo_local
 
-        os.remove(tmp_path)
-
         # Si se desea guardar la URL pública, se puede descomentar este bloque:
         # public_url = supabase.storage.from_("interconsultas").get_public_url(key)
         # ruta_archivo = public_url.get("publicUrl") if isinstance(public_url, dict) else None
@@ -188,6 +188,7 @@ async def create_interconsulta(
     db.add(db_item)
     db.commit()
     db.refresh(db_item)
+    pdf_cache.invalidate("resumen_hc", db_item.id_paciente)
     return db_item
 
 # -------------------------------------------------
@@ -197,7 +198,7 @@ async def create_interconsulta(
 def get_archivo_url(id_interconsulta: int, db: Session = Depends(get_db)):
     """
     Genera un enlace temporal (URL firmada) para acceder al archivo de la interconsulta.
-    La URL tiene una duración limitada (300 segundos).
+    La URL tiene una duración limitada (ARCHIVO_URL_TTL, 300 segundos).
     """
     item = (
         db.query(models.Interconsulta)
@@ -207,18 +208,39 @@ def get_archivo_url(id_interconsulta: int, db: Session = Depends(get_db)):
     if not item or not item.nombre_archivo:
         raise HTTPException(status_code=404, detail="Archivo no encontrado para esta interconsulta")
 
+    if supabase is None:
+        raise HTTPException(status_code=500, detail="Supabase no configurado")
+
     key = f"{item.id_paciente}/{item.nombre_archivo}"
     try:
-        signed = supabase.storage.from_("interconsultas").create_signed_url(key, 300)
+        # Reutiliza la URL firmada mientras no esté por vencer (ver signed_urls.py)
+        url = signed_urls.get(supabase, SUPABASE_BUCKET_INTERCONSULTAS, key, ARCHIVO_URL_TTL)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"No se pudo generar URL firmada: {e}")
 
-    # Supabase suele devolver un dict con 'signedURL' (camelCase)
-    url = signed.get("signedURL") if isinstance(signed, dict) else (signed if isinstance(signed, str) else None)
-    if not url:
-        raise HTTPException(status_code=500, detail="Respuesta inesperada al generar URL firmada")
-
     return {"url": url}
+
+
+@router.get("/archivo-urls/{id_paciente}")
+def get_archivo_urls_paciente(id_paciente: int, db: Session = Depends(get_db)):
+    """
+    URLs firmadas de todos los adjuntos de interconsultas de un paciente, en un
+    solo request a Supabase (create_signed_urls) para las que no estén en cache.
+    Respuesta: {"urls": {id_interconsulta: url | null}}
+    """
+    if supabase is None:
+        raise HTTPException(status_code=500, detail="Supabase no configurado")
+
+    items = (
+        db.query(models.Interconsulta.id_interconsulta, models.Interconsulta.nombre_archivo)
+        .filter(models.Interconsulta.id_paciente == id_paciente)
+        .filter(models.Interconsulta.nombre_archivo.isnot(None))
+        .all()
+    )
+    keys = {it.id_interconsulta: f"{id_paciente}/{it.nombre_archivo}" for it in items}
+    urls = signed_urls.get_many(supabase, SUPABASE_BUCKET_INTERCONSULTAS, keys.values(), ARCHIVO_URL_TTL)
+    return {"urls": {id_ic: urls.get(key) for id_ic, key in keys.items()}}
+
 # -------------------------------------------------
 # Endpoint para borrar interconsulta (Delete)
 # -------------------------------------------------
@@ -256,8 +278,13 @@ def delete_interconsulta(id_interconsulta: int, db: Session = Depends(get_db)):
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error inesperado al eliminar archivo: {e}")
 
+    if db_item.nombre_archivo:
+        signed_urls.invalidate(SUPABASE_BUCKET_INTERCONSULTAS, f"{db_item.id_paciente}/{db_item.nombre_archivo}")
+
+    id_paciente = db_item.id_paciente
     db.delete(db_item)
     db.commit()
+    pdf_cache.invalidate("resumen_hc", id_paciente)
     return {"mensaje": "Interconsulta eliminada correctamente"}
 
 # -------------------------------------------------
@@ -307,29 +334,9 @@ async def update_interconsulta(
         nombre_archivo_local = f"ic_{tag}_{fecha.isoformat()}{ext}"
         key = f"{db_item.id_paciente}/{nombre_archivo_local}"
 
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            tmp.write(await archivo.read())
-            tmp_path = tmp.name
-
         mime = _detect_mime(archivo.filename)
 
-        try:
-            url = f"{SUPABASE_URL}/storage/v1/object/interconsultas/{key}"
-            headers = {
-                "Authorization": f"Bearer {SUPABASE_KEY}",
-                "Content-Type": mime,
-                "x-upsert": "true",
-            }
-            with open(tmp_path, "rb") as f:
-                res = requests.post(url, headers=headers, data=f)
-                if res.status_code not in (200, 201):
-                    raise HTTPException(status_code=500, detail=f"Error al subir archivo (HTTP {res.status_code}): {res.text}")
-        except Exception as e:
-            os.remove(tmp_path)
-            raise HTTPException(status_code=500, detail=f"Error al subir archivo directo a Supabase: {e}")
-
-        os.remove(tmp_path)
+        await _subir_archivo(archivo, key, mime)
 
         # Eliminar archivo anterior si cambió el nombre
         if db_item.nombre_archivo and db_item.nombre_archivo != nombre_archivo_local:
@@ -338,9 +345,11 @@ async def update_interconsulta(
                 supabase.storage.from_("interconsultas").remove([old_key])
             except Exception:
                 pass  # No romper si falla la eliminación
+            signed_urls.invalidate(SUPABASE_BUCKET_INTERCONSULTAS, old_key)
 
         db_item.nombre_archivo = nombre_archivo_local
 
     db.commit()
     db.refresh(db_item)
+    pdf_cache.invalidate("resumen_hc", db_item.id_paciente)
     return db_item
\ No newline at end of file
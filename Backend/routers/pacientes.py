@@ -1,11 +1,11 @@
 """Este archivo contiene los endpoints relacionados a PACIENTES y ENTIDADES AUXILIARES (Coberturas, Nacionalidades, Localidades, Sexo)."""
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_
-from database import get_db
-from models import Sexo, Paciente, Cobertura, Nacionalidad, Localidad, Turno
-from schemas import TurnoCreateSchema, TurnoSchema
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, or_, select, tuple_
+from database import get_db, get_async_db
+from models import Sexo, Paciente, Cobertura, Nacionalidad, Localidad
 from schemas import (
     PacienteConCobertura,
     PacienteCreate,
@@ -13,7 +13,12 @@ from schemas import (
     CoberturaSchema, NacionalidadSchema, LocalidadSchema,
     CoberturaCreateSchema, NacionalidadCreateSchema, LocalidadCreateSchema,SexoSchema
 )
-from typing import List
+from typing import List, Optional
+import base64
+import json
+import catalog_cache
+from conditional import etag_response
+import pdf_cache
 
 
 router = APIRouter()
@@ -27,6 +32,7 @@ def crear_paciente(paciente: PacienteCreate, db: Session = Depends(get_db)):
     nuevo = Paciente(**paciente.dict())
     db.add(nuevo)
     db.commit()
+    catalog_cache.invalidate("pacientes_count")
     db.refresh(nuevo)
 
     return {
@@ -67,38 +73,126 @@ def _mapear_paciente(paciente: Paciente) -> PacienteConCobertura:
     )
 
 
+# ----------------------------------
+# Paginación por cursor (keyset)
+# ----------------------------------
+# El cursor es opaco para el front: base64url de [lower(nombre), id_paciente]
+# de la última fila entregada. La página siguiente arranca con
+# (lower(nombre), id_paciente) > cursor, que usa el índice
+# ix_pacientes_lower_nombre_id y cuesta lo mismo en la página 1 que en la 500.
+
+PACIENTES_COUNT_TTL = 60  # segundos
+
+
+def _encode_cursor(orden: str, id_paciente: int) -> str:
+    raw = json.dumps([orden, id_paciente], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        orden, id_paciente = json.loads(raw)
+        return str(orden), int(id_paciente)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+async def _contar_pacientes(db: AsyncSession, filtros, include_inactivos: bool, termino: str) -> int:
+    """
+    COUNT(*) de pacientes. Sin búsqueda el resultado se cachea con TTL corto
+    (se invalida al crear / borrar / restaurar), así el listado no paga un
+    COUNT por cada página.
+    """
+    stmt = select(func.count()).select_from(Paciente).where(*filtros)
+    if termino:
+        return (await db.execute(stmt)).scalar_one()
+
+    async def _contar():
+        return (await db.execute(stmt)).scalar_one()
+
+    # get_or_load: un COUNT que corrió durante un alta / baja no queda cacheado
+    key = f"pacientes_count:{'todos' if include_inactivos else 'activos'}"
+    return await catalog_cache.get_or_load_async(key, _contar, ttl=PACIENTES_COUNT_TTL)
+
+
 @router.get("/pacientes/", response_model=PacientePaginatedResponse)
-def obtener_pacientes(
+async def obtener_pacientes(
     include_inactivos: bool = False,
     page: int = Query(1, ge=1),
     page_size: int = Query(25, ge=1, le=200),
     search: str = Query("", min_length=0),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(
+        None,
+        description="Modo cursor: vacío para la primera página, luego el next_cursor recibido. "
+                    "Si se omite se usa la paginación por page/offset.",
+    ),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    query = db.query(Paciente)
+    filtros = []
     if not include_inactivos:
-        query = query.filter(Paciente.activo.is_(True))
+        filtros.append(Paciente.activo.is_(True))
 
     termino = search.strip().lower()
     if termino:
         like_term = f"%{termino}%"
-        query = query.filter(
+        filtros.append(
             or_(
                 func.lower(Paciente.nombre).ilike(like_term),
                 Paciente.dni.ilike(f"%{search.strip()}%"),
             )
         )
 
-    total = query.count()
+    orden = func.lower(Paciente.nombre)
+
+    # --- Modo cursor ---
+    if cursor is not None:
+        filtros_pagina = list(filtros)
+        if cursor:
+            ultimo_orden, ultimo_id = _decode_cursor(cursor)
+            filtros_pagina.append(tuple_(orden, Paciente.id_paciente) > tuple_(ultimo_orden, ultimo_id))
+
+        result = await db.execute(
+            select(Paciente, orden.label("orden"))
+            .where(*filtros_pagina)
+            .order_by(orden, Paciente.id_paciente)
+            .limit(page_size + 1)  # una fila extra para saber si hay página siguiente
+        )
+        rows = result.unique().all()
+        hay_mas = len(rows) > page_size
+        rows = rows[:page_size]
+
+        next_cursor = None
+        if hay_mas:
+            ultimo = rows[-1]
+            next_cursor = _encode_cursor(ultimo.orden, ultimo.Paciente.id_paciente)
+
+        # El total sólo se calcula en la primera página (o sale del cache si no hay búsqueda)
+        total = None
+        if not cursor or not termino:
+            total = await _contar_pacientes(db, filtros, include_inactivos, termino)
+
+        return PacientePaginatedResponse(
+            items=[_mapear_paciente(r.Paciente) for r in rows],
+            total=total,
+            page=page,
+            page_size=page_size,
+            next_cursor=next_cursor,
+        )
+
+    # --- Modo page/offset (compatibilidad) ---
+    total = await _contar_pacientes(db, filtros, include_inactivos, termino)
 
     offset = (page - 1) * page_size
-    pacientes = (
-        query
-        .order_by(func.lower(Paciente.nombre))
+    result = await db.execute(
+        select(Paciente)
+        .where(*filtros)
+        .order_by(orden, Paciente.id_paciente)
         .offset(offset)
         .limit(page_size)
-        .all()
     )
+    # Las relaciones de catálogo son lazy="joined": vienen en el mismo SELECT
+    pacientes = result.unique().scalars().all()
 
     items = [_mapear_paciente(p) for p in pacientes]
 
@@ -132,6 +226,7 @@ def editar_paciente(id_paciente: int, paciente: PacienteCreate, db: Session = De
         setattr(existente, key, value)
 
     db.commit()
+    pdf_cache.invalidate("resumen_hc", id_paciente)
     db.refresh(existente)
 
     return {
@@ -180,12 +275,13 @@ def obtener_pacientes_historia(db: Session = Depends(get_db)):
 
 # GET para mostrar el paciente segun el ID: Muestra los Id por si tenemos que modificar y los datos que le corresponden:
 @router.get("/pacientes/historia/{id_paciente}", response_model=PacienteConCobertura)
-def obtener_paciente_historia(id_paciente: int, db: Session = Depends(get_db)):
+def obtener_paciente_historia(id_paciente: int, request: Request, db: Session = Depends(get_db)):
     p = db.query(Paciente).filter(Paciente.id_paciente == id_paciente).first()
     if not p:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
 
-    return PacienteConCobertura(
+    # ETag por contenido: si el front ya tiene esta versión, 304 sin cuerpo
+    data = PacienteConCobertura(
         id_paciente=p.id_paciente,
         nombre=p.nombre,
         dni=p.dni,
@@ -202,6 +298,7 @@ def obtener_paciente_historia(id_paciente: int, db: Session = Depends(get_db)):
         nombre_nacionalidad=p.nacionalidad_rel.nombre_nacionalidad if p.nacionalidad_rel else None,
         nombre_localidad=p.localidad_rel.nombre_localidad if p.localidad_rel else None
     )
+    return etag_response(request, data.model_dump(mode="json"))
 
 
 @router.delete("/pacientes/{id_paciente}")
@@ -215,6 +312,7 @@ def eliminar_paciente(id_paciente: int, db: Session = Depends(get_db)):
 
     paciente.activo = False
     db.commit()
+    catalog_cache.invalidate("pacientes_count")
     return {"success": True}
 
 
@@ -229,6 +327,7 @@ def restaurar_paciente(id_paciente: int, db: Session = Depends(get_db)):
 
     paciente.activo = True
     db.commit()
+    catalog_cache.invalidate("pacientes_count")
     return {"success": True}
 
 
@@ -237,8 +336,11 @@ def restaurar_paciente(id_paciente: int, db: Session = Depends(get_db)):
 # ----------------------------------
 
 @router.get("/coberturas/", response_model=List[CoberturaSchema])
-def obtener_coberturas(db: Session = Depends(get_db)):
-    return db.query(Cobertura).order_by(Cobertura.nombre_cobertura).all()
+def obtener_coberturas(request: Request, db: Session = Depends(get_db)):
+    return catalog_cache.cached_response(request, "coberturas", lambda: [
+        CoberturaSchema.model_validate(c).model_dump(mode="json")
+        for c in db.query(Cobertura).order_by(Cobertura.nombre_cobertura).all()
+    ])
 
 @router.post("/coberturas/", response_model=CoberturaSchema)
 def crear_cobertura(cobertura: CoberturaCreateSchema, db: Session = Depends(get_db)):
@@ -250,6 +352,7 @@ def crear_cobertura(cobertura: CoberturaCreateSchema, db: Session = Depends(get_
     nueva = Cobertura(**cobertura.dict())
     db.add(nueva)
     db.commit()
+    catalog_cache.invalidate("coberturas")
     db.refresh(nueva)
     return nueva
 
@@ -268,6 +371,7 @@ def actualizar_cobertura(cobertura_id: int, cobertura: CoberturaCreateSchema, db
 
     cobertura_db.nombre_cobertura = cobertura.nombre_cobertura
     db.commit()
+    catalog_cache.invalidate("coberturas")
     db.refresh(cobertura_db)
     return cobertura_db
 
@@ -283,6 +387,7 @@ def eliminar_cobertura(cobertura_id: int, db: Session = Depends(get_db)):
 
     db.delete(cobertura_db)
     db.commit()
+    catalog_cache.invalidate("coberturas")
     return {"ok": True}
 
 
@@ -291,8 +396,11 @@ def eliminar_cobertura(cobertura_id: int, db: Session = Depends(get_db)):
 # ----------------------------------
 
 @router.get("/nacionalidades/", response_model=List[NacionalidadSchema])
-def obtener_nacionalidades(db: Session = Depends(get_db)):
-    return db.query(Nacionalidad).order_by(Nacionalidad.nombre_nacionalidad).all()
+def obtener_nacionalidades(request: Request, db: Session = Depends(get_db)):
+    return catalog_cache.cached_response(request, "nacionalidades", lambda: [
+        NacionalidadSchema.model_validate(n).model_dump(mode="json")
+        for n in db.query(Nacionalidad).order_by(Nacionalidad.nombre_nacionalidad).all()
+    ])
 
 @router.post("/nacionalidades/", response_model=NacionalidadSchema)
 def crear_nacionalidad(nacionalidad: NacionalidadCreateSchema, db: Session = Depends(get_db)):
@@ -304,6 +412,7 @@ def crear_nacionalidad(nacionalidad: NacionalidadCreateSchema, db: Session = Dep
     nueva = Nacionalidad(**nacionalidad.dict())
     db.add(nueva)
     db.commit()
+    catalog_cache.invalidate("nacionalidades")
     db.refresh(nueva)
     return nueva
 
@@ -322,6 +431,7 @@ def editar_nacionalidad(id: int, nacionalidad: NacionalidadCreateSchema, db: Ses
     
     actual.nombre_nacionalidad = nacionalidad.nombre_nacionalidad
     db.commit()
+    catalog_cache.invalidate("nacionalidades")
     db.refresh(actual)
     return actual
 
@@ -337,6 +447,7 @@ def eliminar_nacionalidad(id: int, db: Session = Depends(get_db)):
     
     db.delete(nacionalidad)
     db.commit()
+    catalog_cache.invalidate("nacionalidades")
     return {"ok": True}
 
 
@@ -345,8 +456,11 @@ def eliminar_nacionalidad(id: int, db: Session = Depends(get_db)):
 # ----------------------------------
 
 @router.get("/localidades/", response_model=List[LocalidadSchema])
-def obtener_localidades(db: Session = Depends(get_db)):
-    return db.query(Localidad).order_by(Localidad.nombre_localidad).all()
+def obtener_localidades(request: Request, db: Session = Depends(get_db)):
+    return catalog_cache.cached_response(request, "localidades", lambda: [
+        LocalidadSchema.model_validate(l).model_dump(mode="json")
+        for l in db.query(Localidad).order_by(Localidad.nombre_localidad).all()
+    ])
 
 @router.post("/localidades/", response_model=LocalidadSchema)
 def crear_localidad(localidad: LocalidadCreateSchema, db: Session = Depends(get_db)):
@@ -360,6 +474,7 @@ def crear_localidad(localidad: LocalidadCreateSchema, db: Session = Depends(get_
     nueva = Localidad(nombre_localidad=nombre_limpio)
     db.add(nueva)
     db.commit()
+    catalog_cache.invalidate("localidades")
     db.refresh(nueva)
     return nueva
 
@@ -378,6 +493,7 @@ def editar_localidad(id: int, localidad: LocalidadCreateSchema, db: Session = De
     
     loc.nombre_localidad = localidad.nombre_localidad.strip()
     db.commit()
+    catalog_cache.invalidate("localidades")
     db.refresh(loc)
     return loc
 
@@ -393,6 +509,7 @@ def eliminar_localidad(id: int, db: Session = Depends(get_db)):
     
     db.delete(loc)
     db.commit()
+    catalog_cache.invalidate("localidades")
     return {"ok": True}
 
 
@@ -401,28 +518,7 @@ def eliminar_localidad(id: int, db: Session = Depends(get_db)):
 # ----------------------------------
 
 @router.get("/sexo", response_model=List[SexoSchema])
-def get_sexos(db: Session = Depends(get_db)):
-    return db.query(Sexo).all()
-
-# ---------------------------------- # TURNOS # ----------------------------------
-
-@router.get("/turnos/", response_model=List[TurnoSchema])
-def obtener_turnos(db: Session = Depends(get_db)):
-    return db.query(Turno).order_by(Turno.fecha).all()
-
-@router.post("/turnos/", response_model=TurnoSchema)
-def crear_turno(turno: TurnoCreateSchema, db: Session = Depends(get_db)):
-    nuevo_turno = Turno(**turno.dict())
-    db.add(nuevo_turno)
-    db.commit()
-    db.refresh(nuevo_turno)
-    return nuevo_turno
-
-@router.delete("/turnos/{id_turno}")
-def eliminar_turno(id_turno: int, db: Session = Depends(get_db)):
-    turno = db.query(Turno).filter(Turno.id_turno == id_turno).first()
-    if not turno:
-        raise HTTPException(status_code=404, detail="Turno no encontrado.")
-    db.delete(turno)
-    db.commit()
-    return {"ok": True}
+def get_sexos(request: Request, db: Session = Depends(get_db)):
+    return catalog_cache.cached_response(request, "sexo", lambda: [
+        SexoSchema.model_validate(x).model_dump(mode="json") for x in db.query(Sexo).all()
+    ])
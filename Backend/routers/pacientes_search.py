@@ -0,0 +1,123 @@
+# routers/pacientes_search.py
+"""
+Búsqueda de pacientes para typeahead (nombre o DNI).
+
+Usa índices GIN de pg_trgm sobre lower(nombre) y dni: sirven tanto para
+LIKE '%term%' como para el operador de similitud `%`, así que la búsqueda no
+recorre la tabla entera. Los resultados se ordenan primero por coincidencia de
+prefijo (lo que el usuario está tipeando) y después por similitud.
+
+Los índices también aceleran el filtro `search` del listado /pacientes/.
+
+pg_trgm lo instala la migración 4 (opcional). Si la extensión no está,
+`similarity()` y `%` no existen: se usa SQL_SEARCH_LIKE (sólo LIKE, orden por
+prefijo y nombre, seq scan). Se detecta una vez por proceso.
+"""
+import logging
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_async_db
+from schemas import PacienteSearchResult
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["Pacientes"])
+
+# es_prefijo = 0 cuando el nombre o el DNI empiezan con el término.
+SQL_SEARCH = text("""
+    SELECT p.id_paciente,
+           p.nombre,
+           p.dni,
+           p.fecha_nacimiento,
+           p.activo,
+           c.nombre_cobertura,
+           CASE WHEN lower(p.nombre) LIKE :prefijo OR p.dni LIKE :prefijo THEN 0 ELSE 1 END AS es_prefijo,
+           GREATEST(similarity(lower(p.nombre), :q), similarity(coalesce(p.dni, ''), :q)) AS score
+      FROM pacientes p
+      LEFT JOIN coberturas c ON c.id_cobertura = p.cobertura
+     WHERE (:incluir_inactivos OR p.activo)
+       AND (lower(p.nombre) LIKE :contiene
+            OR p.dni LIKE :contiene
+            OR lower(p.nombre) % :q)
+     ORDER BY es_prefijo, score DESC, lower(p.nombre), p.id_paciente
+     LIMIT :limit
+""")
+
+# Sin pg_trgm: mismo resultado sin similitud (score 1 = prefijo, 0.5 = contiene)
+SQL_SEARCH_LIKE = text("""
+    SELECT p.id_paciente,
+           p.nombre,
+           p.dni,
+           p.fecha_nacimiento,
+           p.activo,
+           c.nombre_cobertura,
+           CASE WHEN lower(p.nombre) LIKE :prefijo OR p.dni LIKE :prefijo THEN 0 ELSE 1 END AS es_prefijo,
+           CASE WHEN lower(p.nombre) LIKE :prefijo OR p.dni LIKE :prefijo THEN 1.0 ELSE 0.5 END AS score
+      FROM pacientes p
+      LEFT JOIN coberturas c ON c.id_cobertura = p.cobertura
+     WHERE (:incluir_inactivos OR p.activo)
+       AND (lower(p.nombre) LIKE :contiene
+            OR p.dni LIKE :contiene)
+     ORDER BY es_prefijo, lower(p.nombre), p.id_paciente
+     LIMIT :limit
+""")
+
+SQL_HAS_TRGM = text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+
+_has_trgm: Optional[bool] = None
+
+
+async def _search_sql(db: AsyncSession):
+    global _has_trgm
+    if _has_trgm is None:
+        _has_trgm = bool((await db.execute(SQL_HAS_TRGM)).scalar())
+        if not _has_trgm:
+            logger.warning("[pacientes_search] pg_trgm no instalado: búsqueda sólo por LIKE")
+    return SQL_SEARCH if _has_trgm else SQL_SEARCH_LIKE
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@router.get("/pacientes/search", response_model=List[PacienteSearchResult])
+async def buscar_pacientes(
+    q: str = Query(..., min_length=1, description="Nombre (o parte) o DNI"),
+    limit: int = Query(10, ge=1, le=50),
+    include_inactivos: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    termino = " ".join(q.split()).lower()
+    if not termino:
+        return []
+
+    like = _escape_like(termino)
+    rows = (
+        await db.execute(
+            await _search_sql(db),
+            {
+                "q": termino,
+                "prefijo": f"{like}%",
+                "contiene": f"%{like}%",
+                "incluir_inactivos": include_inactivos,
+                "limit": limit,
+            },
+        )
+    ).mappings().all()
+
+    return [
+        PacienteSearchResult(
+            id_paciente=r["id_paciente"],
+            nombre=r["nombre"],
+            dni=r["dni"],
+            fecha_nacimiento=r["fecha_nacimiento"],
+            activo=r["activo"],
+            nombre_cobertura=r["nombre_cobertura"],
+            score=float(r["score"] or 0),
+        )
+        for r in rows
+    ]
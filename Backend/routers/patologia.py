@@ -8,8 +8,11 @@ from dotenv import load_dotenv
 import os
 from typing import List
 
+from fastapi.concurrency import run_in_threadpool
+
 from database import get_db
 import models, schemas
+from . import image_variants, storage_http
 
 # ——— Configuración de Supabase (robusta) ———
 load_dotenv()
@@ -28,6 +31,12 @@ try:
 except Exception:
     supabase = None
 
+# Fotos: subida async en paralelo (ver storage_http) junto con sus variantes
+_storage_fotos = (
+    storage_http.StorageClient(SUPABASE_URL, SUPABASE_KEY, SUPABASE_BUCKET_PATOLOGIA)
+    if (SUPABASE_URL and SUPABASE_KEY) else None
+)
+
 def _public_url(bucket: str, key: str) -> str:
     if not key:
         return ""
@@ -35,26 +44,6 @@ def _public_url(bucket: str, key: str) -> str:
     return f"{base}/storage/v1/object/public/{bucket}/{key}"
 
 
-def ensure_patologia_columns(db: Session) -> None:
-    """Garantiza columnas opcionales agregadas recientemente."""
-    try:
-        db.execute(text("""
-            ALTER TABLE patologias
-            ADD COLUMN IF NOT EXISTS id_procedimiento_paciente BIGINT
-        """))
-        db.execute(text("""
-            ALTER TABLE patologias
-            ADD COLUMN IF NOT EXISTS fecha_procedimiento DATE
-        """))
-        db.execute(text("""
-            ALTER TABLE patologias
-            ADD COLUMN IF NOT EXISTS tipo_registro VARCHAR(32)
-        """))
-        db.commit()
-    except Exception:
-        db.rollback()
-
-
 def _fill_procedimiento_metadata(pat: models.Patologia, db: Session) -> None:
     """Adjunta nombres legibles del procedimiento asociado a la patología."""
     proced_nombre = None
@@ -97,6 +86,27 @@ def _fill_procedimiento_metadata(pat: models.Patologia, db: Session) -> None:
     pat.tipo_registro = (pat.tipo_registro or "patologia").strip().lower()
 
 
+def _cargar_fotos(db: Session, patologias: list[models.Patologia]) -> None:
+    """
+    Adjunta las fotos de cada patología leyendo sólo fotos_patologia (una consulta
+    para todas). El bucket no se lista: el índice lo mantiene al día
+    /fotos/reconciliar (ver photo_index). Los cultivos no llevan fotos.
+    """
+    ids = [p.id_patologia for p in patologias if (p.tipo_registro or "patologia").lower() == "patologia"]
+    por_patologia: dict[int, list[models.FotosPatologia]] = {}
+    if ids:
+        fotos = (
+            db.query(models.FotosPatologia)
+            .filter(models.FotosPatologia.id_patologia.in_(ids))
+            .order_by(models.FotosPatologia.uploaded_at.asc(), models.FotosPatologia.id.asc())
+            .all()
+        )
+        for f in fotos:
+            por_patologia.setdefault(f.id_patologia, []).append(f)
+    for pat in patologias:
+        pat.fotos = por_patologia.get(pat.id_patologia, [])  # Inyectamos manualmente la relación
+
+
 def _bucket_for_pat(pat: models.Patologia) -> str:
     tipo = (pat.tipo_registro or "patologia").strip().lower()
     return SUPABASE_BUCKET_CULTIVOS if tipo == "cultivo" else SUPABASE_BUCKET_PATOLOGIA
@@ -162,8 +172,6 @@ async def crear_patologia(
     pdf_key = None
     pdf_url = None
 
-    ensure_patologia_columns(db)
-
     tipo_registro_norm = (tipo_registro or "patologia").strip().lower()
     if tipo_registro_norm not in ("patologia", "cultivo"):
         tipo_registro_norm = "patologia"
@@ -224,7 +232,6 @@ def obtener_patologia(id_patologia: int, db: Session = Depends(get_db)):
     """
     Devuelve un registro de patología por su ID.
     """
-    ensure_patologia_columns(db)
     item = db.get(models.Patologia, id_patologia)
     if not item:
         raise HTTPException(status_code=404, detail="Patología no encontrada")
@@ -241,7 +248,6 @@ async def actualizar_patologia(
     """
     Actualiza la patología; si se envía nuevo PDF, reemplaza el anterior.
     """
-    ensure_patologia_columns(db)
     pat = db.get(models.Patologia, id_patologia)
     if not pat:
         raise HTTPException(status_code=404, detail="Patología no encontrada")
@@ -289,7 +295,6 @@ def eliminar_patologia(id_patologia: int, db: Session = Depends(get_db)):
     Elimina una patología, su PDF (si existe) y TODAS sus fotos asociadas
     (archivos en Storage + filas en DB).
     """
-    ensure_patologia_columns(db)
     pat = db.get(models.Patologia, id_patologia)
     if not pat:
         raise HTTPException(status_code=404, detail="Patología no encontrada")
@@ -302,6 +307,8 @@ def eliminar_patologia(id_patologia: int, db: Session = Depends(get_db)):
             .all()
         )
         keys = [f.file_key for f in fotos if f.file_key]
+        # miniatura y versión pantalla de cada foto (si no existen, remove las ignora)
+        keys += [vk for k in list(keys) for vk in image_variants.variant_keys(k).values()]
         if keys:
             if supabase is None:
                 raise HTTPException(status_code=500, detail="Supabase no configurado")
@@ -345,31 +352,62 @@ async def subir_fotos_patologia(
     db: Session = Depends(get_db),
 ):
     """
-    Sube una o varias fotos macroscópicas de la patología.
+    Sube una o varias fotos macroscópicas de la patología, con miniatura y
+    versión pantalla de cada una (ver image_variants). Las subidas van en paralelo.
     """
     pat = db.get(models.Patologia, id_patologia)
     if not pat:
         raise HTTPException(status_code=404, detail="Patología no encontrada")
+    if _storage_fotos is None:
+        raise HTTPException(status_code=500, detail="Supabase no configurado")
 
-    fotos_creadas: list[models.FotosPatologia] = []
+    bucket = SUPABASE_BUCKET_PATOLOGIA
     from datetime import datetime
 
+    items: list[storage_http.UploadItem] = []
+    variant_items: list[storage_http.UploadItem] = []
     for archivo in archivos:
         ts = datetime.utcnow().strftime("%Y%m%d%H%M%S")
         filename = f"{ts}_{archivo.filename}"
         key = f"{pat.id_paciente}/fotos/{filename}"
-
-        await upload_to_supabase(archivo, bucket, key)
-        url = _public_url(bucket, key)
-
+        content = await archivo.read()
+        items.append(storage_http.UploadItem(
+            key=key,
+            data=content,
+            content_type=archivo.content_type or "application/octet-stream",
+            filename=archivo.filename,
+        ))
+        if image_variants.is_image(archivo.filename, archivo.content_type):
+            variants = await run_in_threadpool(image_variants.make_variants, content)
+            for name, (data, ct) in variants.items():
+                variant_items.append(storage_http.UploadItem(
+                    key=image_variants.variant_key(key, name), data=data, content_type=ct,
+                ))
+
+    results = await _storage_fotos.upload_many(items + variant_items)
+    uploaded_keys = {r["key"] for r in results if r["ok"]}
+    errores = [f"{r['filename']}: {r['error']}" for r in results[:len(items)] if not r["ok"]]
+
+    existing = [k.rsplit("/", 1)[-1] for k in uploaded_keys]
+    fotos_creadas: list[models.FotosPatologia] = []
+    vistas: set[str] = set()
+    for item in items:
+        # Mismo nombre dos veces en el mismo segundo = misma clave (file_key es único)
+        if item.key not in uploaded_keys or item.key in vistas:
+            continue
+        vistas.add(item.key)
         foto = models.FotosPatologia(
             id_patologia=id_patologia,
-            file_key=key,
-            file_url=url
+            file_key=item.key,
+            file_url=_public_url(bucket, item.key),
+            **image_variants.variant_urls(item.key, lambda k: _public_url(bucket, k), existing),
         )
         db.add(foto)
         fotos_creadas.append(foto)
 
+    if not fotos_creadas:
+        raise HTTPException(status_code=500, detail=f"Error al subir archivo en Supabase: {errores[0] if errores else ''}")
+
     db.commit()
     for foto in fotos_creadas:
         db.refresh(foto)
@@ -512,7 +550,6 @@ def listar_patologias_paciente(id_paciente: int, db: Session = Depends(get_db)):
     """
     Devuelve todas las patologías de un paciente, incluyendo archivos PDF y fotos.
     """
-    ensure_patologia_columns(db)
     # Traigo todos los registros de patología del paciente ordenados por fecha
     patologias = (
         db.query(models.Patologia)
@@ -521,38 +558,10 @@ def listar_patologias_paciente(id_paciente: int, db: Session = Depends(get_db)):
         .all()
     )
 
+    _cargar_fotos(db, patologias)
     for pat in patologias:
         _fill_procedimiento_metadata(pat, db)
 
-        # Cargo las fotos relacionadas
-        fotos = (
-            db.query(models.FotosPatologia)
-            .filter(models.FotosPatologia.id_patologia == pat.id_patologia)
-            .all()
-        )
-        pat.fotos = fotos  # Inyectamos manualmente la relación si no está mapeada
-
-        # --- Nuevo filtrado: dejo solo las fotos que realmente existen en Storage ---
-        existing = []
-        if (pat.tipo_registro or "patologia").lower() == "patologia" and supabase is not None:
-            try:
-                sup_res = supabase.storage.from_(SUPABASE_BUCKET_PATOLOGIA).list(f"{id_paciente}/fotos")
-                if isinstance(sup_res, dict):
-                    data_list = sup_res.get("data") or []
-                else:
-                    data_list = sup_res or []
-                existing = [ (e.get("name") if isinstance(e, dict) else str(e)) for e in data_list ]
-            except Exception:
-                existing = []
-            if existing:
-                pat.fotos = [
-                    f for f in pat.fotos
-                    if f.file_key.split("/")[-1] in existing
-                ]
-        else:
-            pat.fotos = []
-        # -------------------------------------------------------------------------
-
     return patologias
 
 
@@ -562,7 +571,6 @@ def listar_patologias_paciente_alias(id_paciente: int, db: Session = Depends(get
     """
     Alias de listar patologías: responde en /patologias/patologias/{id_paciente}.
     """
-    ensure_patologia_columns(db)
     patologias = (
         db.query(models.Patologia)
         .filter(models.Patologia.id_paciente == id_paciente)
@@ -570,14 +578,8 @@ def listar_patologias_paciente_alias(id_paciente: int, db: Session = Depends(get
         .all()
     )
 
+    _cargar_fotos(db, patologias)
     for pat in patologias:
         _fill_procedimiento_metadata(pat, db)
 
-        fotos = (
-            db.query(models.FotosPatologia)
-            .filter(models.FotosPatologia.id_patologia == pat.id_patologia)
-            .all()
-        )
-        pat.fotos = fotos
-
     return patologias
@@ -1,19 +1,28 @@
 # routers/pdf_cx.py
+import logging
+import asyncio
+import os
+import zipfile
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import Response, JSONResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-from database import get_db
-from .Services_pdf import build_pdf_hzb_bytes
+from database import get_db, get_async_db
+from schemas import PdfLoteRequest
+import pdf_cache
+import pdf_stream
+from . import pdf_render_pool, Services_pdf
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/pdf", tags=["pdf partes quirúrgicos"]) 
 
 # ======================
 # SQL base (HZB)
 # ======================
-SQL_HZB = text(
-    """
-    SELECT 
+_HZB_SELECT = """
       p.nombre                                         AS apellido_y_nombre,
       p.dni                                            AS dni,
       CAST(date_part('year', age(current_date, p.fecha_nacimiento)) AS int) AS edad,
@@ -44,7 +53,9 @@ SQL_HZB = text(
 
       CASE WHEN pp.patologia THEN 'SI' ELSE 'NO' END   AS patologia,
       CASE WHEN pp.cultivo   THEN 'SI' ELSE 'NO' END   AS cultivo
+"""
 
+_HZB_FROM = """
     FROM public.procedimientos_pacientes pp
     JOIN public.partes_quirurgicos pq 
       ON pq.id_procedimiento_paciente = pp.id_procedimiento_paciente
@@ -72,8 +83,10 @@ SQL_HZB = text(
       ON anes.id = pq.id_anestesiologo
     LEFT JOIN public.tipos_anestesia ta 
       ON ta.id_tipo_anestesia = pq.id_tipo_anestesia
-    WHERE pp.id_procedimiento_paciente = :id_pp
-    """
+"""
+
+SQL_HZB = text(
+    "SELECT " + _HZB_SELECT + _HZB_FROM + "    WHERE pp.id_procedimiento_paciente = :id_pp\n"
 )
 
 # ======================
@@ -89,26 +102,128 @@ def datos_hzb(id_pp: int, db: Session = Depends(get_db)):
     except HTTPException:
         raise
     except Exception as e:
-        print("[pdf][HZB JSON] ERROR:", e)
+        logger.error(f"[pdf][HZB JSON] ERROR: {e}")
         raise HTTPException(status_code=500, detail="Error generando datos del parte")
 
 # ======================
 # GET PDF (HZB)
 # ======================
 @router.get("/hzb/{id_pp}/pdf", summary="PDF HZB", response_class=Response)
-def pdf_hzb(id_pp: int, db: Session = Depends(get_db)):
+async def pdf_hzb(id_pp: int, db: AsyncSession = Depends(get_async_db)):
     try:
-        row = db.execute(SQL_HZB, {"id_pp": id_pp}).mappings().first()
+        row = (await db.execute(SQL_HZB, {"id_pp": id_pp})).mappings().first()
         if not row:
             raise HTTPException(status_code=404, detail="Parte no encontrado")
         data = dict(row)
     except HTTPException:
         raise
     except Exception as e:
-        print("[pdf][HZB PDF] ERROR SQL:", e)
+        logger.error(f"[pdf][HZB PDF] ERROR SQL: {e}")
         raise HTTPException(status_code=500, detail="Error obteniendo datos del parte")
 
-    pdf_bytes = build_pdf_hzb_bytes(data)
+    # Misma data => mismo PDF: se reutiliza el render si ya existe (ver pdf_cache.py)
+    pdf_bytes = await pdf_cache.get_or_render(
+        "hzb", id_pp, data, lambda d: pdf_render_pool.render("hzb", d)
+    )
+
+    return pdf_stream.bytes_response(pdf_bytes, f"parte_hzb_{id_pp}.pdf")
+
+
+# ======================
+# POST PDF en lote (HZB)
+# ======================
+# Para imprimir el día quirúrgico entero: una sola consulta trae todos los
+# partes, se renderizan en paralelo en pdf_render_pool y se devuelven en un ZIP
+# (un PDF por parte) o en un único PDF unido.
+PDF_LOTE_MAX = int(os.getenv("PDF_LOTE_MAX", "100"))
+# Unir el lote tarda según la cantidad de partes: PDF_RENDER_TIMEOUT + esto por parte
+PDF_LOTE_MERGE_SECONDS = float(os.getenv("PDF_LOTE_MERGE_SECONDS", "1"))
+
+# id_pp viaja aparte para no alterar la clave de pdf_cache respecto del endpoint individual
+SQL_HZB_LOTE_SELECT = "SELECT pp.id_procedimiento_paciente AS id_pp, " + _HZB_SELECT + _HZB_FROM
+SQL_HZB_LOTE_ORDER = "    ORDER BY pp.fecha, pq.hora_inicio, pp.id_procedimiento_paciente\n    LIMIT :limit\n"
+
+
+@router.post("/hzb/lote", summary="PDFs HZB en lote (ZIP o PDF unido)", response_class=Response)
+async def pdf_hzb_lote(filtro: PdfLoteRequest, db: AsyncSession = Depends(get_async_db)):
+    condiciones = []
+    params = {"limit": PDF_LOTE_MAX + 1}
+    if filtro.ids:
+        condiciones.append("pp.id_procedimiento_paciente = ANY(:ids)")
+        params["ids"] = list(filtro.ids)
+    if filtro.id_paciente is not None:
+        condiciones.append("pp.id_paciente = :id_paciente")
+        params["id_paciente"] = filtro.id_paciente
+    if filtro.desde is not None:
+        condiciones.append("pp.fecha >= :desde")
+        params["desde"] = filtro.desde
+    if filtro.hasta is not None:
+        condiciones.append("pp.fecha <= :hasta")
+        params["hasta"] = filtro.hasta
+    if not condiciones:
+        raise HTTPException(status_code=400, detail="Indicá ids, id_paciente o un rango de fechas")
+    if filtro.formato == "pdf" and not Services_pdf._HAS_PYPDF2:
+        raise HTTPException(status_code=501, detail="PDF unido no disponible (falta pypdf o PyPDF2); pedí formato zip")
+
+    sql = text(SQL_HZB_LOTE_SELECT + "    WHERE " + " AND ".join(condiciones) + "\n" + SQL_HZB_LOTE_ORDER)
+    try:
+        rows = (await db.execute(sql, params)).mappings().all()
+    except Exception as e:
+        logger.error(f"[pdf][HZB lote] ERROR SQL: {e}")
+        raise HTTPException(status_code=500, detail="Error obteniendo datos de los partes")
+    if not rows:
+        raise HTTPException(status_code=404, detail="No hay partes para los filtros indicados")
+    if len(rows) > PDF_LOTE_MAX:
+        raise HTTPException(status_code=413, detail=f"El lote supera el máximo de {PDF_LOTE_MAX} partes")
+
+    # Renders en paralelo, pero sin pasar la cola del pool (daría 503 al resto de los usuarios)
+    sem = asyncio.Semaphore(max(1, pdf_render_pool.WORKERS))
+
+    async def _render(row):
+        data = dict(row)
+        id_pp = data.pop("id_pp")
+        async with sem:
+            pdf = await pdf_cache.get_or_render(
+                "hzb", id_pp, data, lambda d: pdf_render_pool.render("hzb", d)
+            )
+        return id_pp, pdf
+
+    tasks = [asyncio.ensure_future(_render(r)) for r in rows]
+    try:
+        if filtro.formato == "pdf":
+            pdfs = [pdf for _, pdf in await asyncio.gather(*tasks)]
+            if len(pdfs) == 1:
+                return pdf_stream.bytes_response(pdfs[0], "partes_hzb.pdf", inline=False)
+            # El PDF unido lo escribe el worker en un temporal: no vuelve entero por pickle
+            path = pdf_stream.temp_path()
+            try:
+                await pdf_render_pool.render(
+                    "merge_file", pdfs, path,
+                    timeout=pdf_render_pool.TIMEOUT + PDF_LOTE_MERGE_SECONDS * len(pdfs),
+                )
+                merged = pdf_stream.open_temp(path)
+            except BaseException:
+                os.remove(path)
+                raise
+            return pdf_stream.file_response(merged, "partes_hzb.pdf", inline=False)
 
-    headers = {"Content-Disposition": f'inline; filename="parte_hzb_{id_pp}.pdf"'}
-    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
+        # El ZIP va a un spool (pasa a disco si es grande) y se transmite por bloques.
+        # Cada PDF se agrega apenas está, en orden: no se juntan todos en memoria.
+        zip_file = pdf_stream.spool()
+        try:
+            # ZIP_STORED: los PDF ya vienen comprimidos, deflate sólo gastaría CPU
+            zf = zipfile.ZipFile(zip_file, "w", compression=zipfile.ZIP_STORED)
+            try:
+                for task in tasks:
+                    id_pp, pdf = await task
+                    await run_in_threadpool(zf.writestr, f"parte_hzb_{id_pp}.pdf", pdf)
+            finally:
+                # close() escribe el directorio central: también fuera del event loop
+                await run_in_threadpool(zf.close)
+        except BaseException:
+            zip_file.close()
+            raise
+        return pdf_stream.file_response(zip_file, "partes_hzb.zip", media_type="application/zip")
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,215 @@
+# routers/pdf_render_pool.py
+"""
+Servicio de render de PDFs en un pool de procesos.
+
+ReportLab / PyPDF2 son CPU puro y retienen el GIL: en un thread frenan a todos
+los demás requests del worker. Acá el render corre en un ProcessPoolExecutor
+con workers "calientes" (el initializer llama a Services_pdf.warm_up()).
+
+- Cola acotada: si hay PDF_RENDER_MAX_QUEUE renders en curso/esperando, se
+  responde 503 enseguida en lugar de encolar sin límite. Un render cuenta
+  hasta que termina en el worker, aunque su request ya haya dado timeout.
+- Timeout: PDF_RENDER_TIMEOUT segundos por render (504 si se excede).
+- Métricas: profundidad de cola y tiempos de render (ver `metrics()`,
+  expuestas en /health/metrics).
+
+PDF_RENDER_WORKERS=0 desactiva el pool y renderiza en el threadpool (default
+en Vercel, donde no hay /dev/shm para los semáforos de multiprocessing).
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Optional
+
+from fastapi import HTTPException
+
+import request_metrics
+from . import Services_pdf
+
+logger = logging.getLogger(__name__)
+
+
+def _default_workers() -> int:
+    if os.getenv("VERCEL"):
+        return 0
+    return max(1, min(2, os.cpu_count() or 1))
+
+
+WORKERS = int(os.getenv("PDF_RENDER_WORKERS", str(_default_workers())))
+MAX_QUEUE = int(os.getenv("PDF_RENDER_MAX_QUEUE", str(max(WORKERS, 1) * 4)))
+TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", "30"))
+
+# Builders que puede ejecutar un worker. Los argumentos viajan por pickle.
+_BUILDERS = {
+    "hzb": Services_pdf.build_pdf_hzb_bytes,
+    "resumen_hc": Services_pdf.build_resumen_hc_bytes,
+    "merge_file": Services_pdf.merge_pdfs_to_file,
+}
+
+_executor: Optional[ProcessPoolExecutor] = None
+_thread_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+_in_flight = 0  # renders aceptados y no terminados (esperando + corriendo)
+_in_flight_lock = threading.Lock()
+_durations = deque(maxlen=200)  # segundos de los últimos renders
+_counters = {"renders": 0, "errors": 0, "timeouts": 0, "rejected": 0, "pool_restarts": 0}
+
+
+def _init_worker() -> None:
+    try:
+        Services_pdf.warm_up()
+    except Exception as e:  # un warm-up fallido no debe tumbar el worker
+        logger.warning(f"warm_up de PDF falló en worker {os.getpid()}: {e}")
+
+
+def _render_in_worker(kind: str, args: tuple) -> bytes:
+    return _BUILDERS[kind](*args)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: el worker no hereda sockets de la DB, threads ni el event loop del proceso web
+            _executor = ProcessPoolExecutor(
+                max_workers=WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _executor
+
+
+def _get_thread_executor() -> ThreadPoolExecutor:
+    # PDF_RENDER_WORKERS=0: threads propios (y no el threadpool de Starlette) para
+    # tener el Future real y liberar el lugar en la cola cuando termina
+    global _thread_executor
+    with _executor_lock:
+        if _thread_executor is None:
+            _thread_executor = ThreadPoolExecutor(max_workers=MAX_QUEUE, thread_name_prefix="pdf-render")
+        return _thread_executor
+
+
+def _reset_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+            _counters["pool_restarts"] += 1
+
+
+def start() -> None:
+    """Levanta los workers al arrancar la app (así el primer PDF no paga el fork)."""
+    if WORKERS > 0:
+        executor = _get_executor()
+        # Forzamos el arranque de todos los procesos con tareas vacías
+        for _ in range(WORKERS):
+            executor.submit(os.getpid)
+
+
+def shutdown() -> None:
+    global _executor, _thread_executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+        if _thread_executor is not None:
+            _thread_executor.shutdown(wait=False, cancel_futures=True)
+            _thread_executor = None
+
+
+def _release(_future) -> None:
+    # Corre cuando el render termina de verdad (o se cancela antes de empezar),
+    # desde el thread del executor
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+
+
+def _submit(kind: str, args: tuple) -> Future:
+    if WORKERS > 0:
+        return _get_executor().submit(_render_in_worker, kind, args)
+    return _get_thread_executor().submit(_render_in_worker, kind, args)
+
+
+async def render(kind: str, *args: Any, timeout: Optional[float] = None) -> Any:
+    """
+    Renderiza `kind` ("hzb", "resumen_hc", "merge_file") con los args del
+    builder. "merge_file" escribe en el path recibido y lo devuelve.
+    `timeout` reemplaza a PDF_RENDER_TIMEOUT (trabajos que crecen con el lote).
+    Lanza HTTPException 503 si la cola está llena y 504 si se pasa del timeout.
+
+    El lugar en la cola se libera cuando el render termina, no cuando el request
+    deja de esperarlo: un timeout no cancela un render que ya está corriendo
+    (sigue ocupando el worker), así que tampoco deja entrar otro en su lugar.
+    """
+    global _in_flight
+    if kind not in _BUILDERS:
+        raise ValueError(f"Tipo de PDF desconocido: {kind}")
+
+    with _in_flight_lock:
+        if _in_flight >= MAX_QUEUE:
+            _counters["rejected"] += 1
+            raise HTTPException(status_code=503, detail="Generador de PDF ocupado, reintentá en unos segundos")
+        _in_flight += 1
+
+    t0 = time.perf_counter()
+    try:
+        future = _submit(kind, args)
+    except BaseException as e:
+        _release(None)
+        if isinstance(e, BrokenProcessPool):
+            _counters["errors"] += 1
+            _reset_executor()
+            raise HTTPException(status_code=503, detail="Generador de PDF reiniciándose, reintentá")
+        raise
+    future.add_done_callback(_release)
+
+    try:
+        with request_metrics.span("pdf"):
+            # shield: el timeout corta la espera, no el future (que libera el lugar al terminar)
+            pdf = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=timeout or TIMEOUT)
+    except asyncio.TimeoutError:
+        _counters["timeouts"] += 1
+        future.cancel()  # sólo tiene efecto si todavía no empezó
+        raise HTTPException(status_code=504, detail="La generación del PDF tardó demasiado")
+    except BrokenProcessPool:
+        # Un worker murió (OOM, segfault): se recrea el pool para los próximos
+        _counters["errors"] += 1
+        _reset_executor()
+        raise HTTPException(status_code=503, detail="Generador de PDF reiniciándose, reintentá")
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception:
+        _counters["errors"] += 1
+        raise
+
+    _durations.append(time.perf_counter() - t0)
+    _counters["renders"] += 1
+    return pdf
+
+
+def metrics() -> dict:
+    durations = sorted(_durations)
+    n = len(durations)
+    return {
+        "workers": WORKERS,
+        "mode": "process" if WORKERS > 0 else "thread",
+        "queue_depth": _in_flight,
+        "max_queue": MAX_QUEUE,
+        "timeout_s": TIMEOUT,
+        **_counters,
+        "render_ms": {
+            "avg": round(1000 * sum(durations) / n, 1) if n else None,
+            "p95": round(1000 * durations[min(n - 1, int(n * 0.95))], 1) if n else None,
+            "max": round(1000 * durations[-1], 1) if n else None,
+        },
+    }
@@ -0,0 +1,262 @@
+# routers/photo_index.py
+"""
+Índice de fotos en la base de datos.
+
+Las galerías leían el bucket (`storage.list(...)`) en cada vista: un round-trip
+remoto a Supabase por parte / por patología. Ahora la fuente de lectura es la
+DB y el bucket sólo se toca al subir o borrar:
+
+- fotos_partes_cx  (procedimientos / partes quirúrgicos, bucket "procedimientos")
+- fotos_patologia  (fotos macroscópicas, bucket "patologias")
+
+Las altas y bajas escriben en el bucket y, a continuación, en la tabla
+(write-through). Si algo queda a medias (la DB falló después de subir, fotos
+anteriores a este índice, borrados manuales en el panel de Supabase), lo
+repara `reconciliar()`:
+
+    POST /fotos/reconciliar?dry_run=true          (requiere token: borra filas)
+    python -m routers.photo_index [--dry-run]     (cron de Render)
+
+storage_key / file_key son únicos (migración 7): las altas usan
+ON CONFLICT DO NOTHING, así una subida y una reconciliación simultáneas no
+duplican filas.
+"""
+import logging
+import re
+import sys
+from typing import Any, Dict, List
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import image_variants
+from .auth import verify_token
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/fotos", tags=["Fotos"])
+
+# ======================
+# fotos_partes_cx
+# ======================
+SQL_FOTOS_CX = text("""
+    SELECT id_foto, id_procedimiento_paciente, storage_key, url, filename,
+           content_type, size_bytes, thumb_url, display_url, created_at
+      FROM fotos_partes_cx
+     WHERE id_procedimiento_paciente = :id_pp
+     ORDER BY created_at DESC, id_foto DESC
+""")
+
+SQL_INSERT_FOTO_CX = text("""
+    INSERT INTO fotos_partes_cx
+        (id_procedimiento_paciente, storage_key, url, filename, content_type, size_bytes, thumb_url, display_url)
+    VALUES
+        (:id_pp, :storage_key, :url, :filename, :content_type, :size_bytes, :thumb_url, :display_url)
+    ON CONFLICT (storage_key) DO NOTHING
+    RETURNING id_foto, created_at
+""")
+
+SQL_FOTO_CX_BY_KEY = text("""
+    SELECT id_foto, created_at FROM fotos_partes_cx WHERE storage_key = :storage_key
+""")
+
+SQL_DELETE_FOTO_CX = text("""
+    DELETE FROM fotos_partes_cx
+     WHERE id_procedimiento_paciente = :id_pp AND storage_key = :storage_key
+""")
+
+
+def foto_cx_out(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Fila de fotos_partes_cx -> item de galería (misma forma que devolvía el listado del bucket)."""
+    key = row["storage_key"]
+    return {
+        "id_foto": row.get("id_foto"),
+        "url": row["url"],
+        "file_url": row["url"],
+        "thumb_url": row.get("thumb_url"),
+        "display_url": row.get("display_url"),
+        "file_key": key,
+        "filename": key.rsplit("/", 1)[-1],
+        "original_filename": row.get("filename"),
+        "content_type": row.get("content_type"),
+        "size_bytes": row.get("size_bytes") or 0,
+        "created_at": row.get("created_at"),
+    }
+
+
+async def listar_fotos_cx(db: AsyncSession, id_pp: int) -> List[Dict[str, Any]]:
+    rows = (await db.execute(SQL_FOTOS_CX, {"id_pp": id_pp})).mappings().all()
+    return [foto_cx_out(dict(r)) for r in rows]
+
+
+async def registrar_fotos_cx(db: AsyncSession, id_pp: int, fotos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Inserta las fotos ya subidas al bucket. Cada dict trae storage_key, url,
+    filename, content_type, size_bytes, thumb_url, display_url.
+    Devuelve los items de galería con id_foto y created_at.
+    """
+    out = []
+    for foto in fotos:
+        row = (await db.execute(SQL_INSERT_FOTO_CX, {"id_pp": id_pp, **foto})).mappings().first()
+        if row is None:
+            # Ya indexada (p. ej. por una reconciliación que corrió en paralelo)
+            row = (await db.execute(SQL_FOTO_CX_BY_KEY, {"storage_key": foto["storage_key"]})).mappings().first()
+        out.append(foto_cx_out({**foto, **dict(row)}))
+    await db.commit()
+    return out
+
+
+async def borrar_foto_cx(db: AsyncSession, id_pp: int, storage_key: str) -> None:
+    await db.execute(SQL_DELETE_FOTO_CX, {"id_pp": id_pp, "storage_key": storage_key})
+    await db.commit()
+
+
+# ======================
+# Reconciliación DB <-> bucket
+# ======================
+_LIST_PAGE = 1000
+_KEY_CX = re.compile(r"^\d+/[^/]+$")
+
+
+def _list_names(client, bucket: str, folder: str) -> List[Dict[str, Any]]:
+    """Todos los objetos de `folder` (paginado). Las subcarpetas vienen con id None."""
+    entries: List[Dict[str, Any]] = []
+    offset = 0
+    while True:
+        resp = client.storage.from_(bucket).list(folder, {"limit": _LIST_PAGE, "offset": offset})
+        page = (resp.get("data") or []) if isinstance(resp, dict) else (resp or [])
+        entries.extend(e for e in page if isinstance(e, dict))
+        if len(page) < _LIST_PAGE:
+            return entries
+        offset += _LIST_PAGE
+
+
+def _reconciliar_cx(conn, client, bucket: str, url_for, dry_run: bool) -> Dict[str, int]:
+    stats = {"insertadas": 0, "eliminadas": 0, "variantes": 0}
+    ids_validos = {r[0] for r in conn.execute(text("SELECT id_procedimiento_paciente FROM procedimientos_pacientes"))}
+    en_db: Dict[str, Dict[str, Any]] = {
+        r["storage_key"]: dict(r)
+        for r in conn.execute(text(
+            "SELECT id_foto, id_procedimiento_paciente, storage_key, thumb_url, display_url FROM fotos_partes_cx"
+        )).mappings()
+    }
+
+    carpetas = {e["name"] for e in _list_names(client, bucket, "") if e.get("id") is None}
+    en_bucket = set()
+    for carpeta in sorted(carpetas):
+        if not carpeta.isdigit():
+            continue
+        entries = _list_names(client, bucket, carpeta)
+        nombres = [e["name"] for e in entries]
+        for e in entries:
+            name = e["name"]
+            if e.get("id") is None or image_variants.is_variant_name(name):
+                continue
+            key = f"{carpeta}/{name}"
+            en_bucket.add(key)
+            variantes = image_variants.variant_urls(key, url_for, existing=nombres)
+            actual = en_db.get(key)
+            if actual is None:
+                if int(carpeta) not in ids_validos:
+                    continue  # carpeta huérfana (procedimiento borrado): no se indexa
+                if dry_run:
+                    stats["insertadas"] += 1
+                else:
+                    # ON CONFLICT: si una subida la indexó mientras tanto, no se duplica
+                    stats["insertadas"] += conn.execute(SQL_INSERT_FOTO_CX, {
+                        "id_pp": int(carpeta),
+                        "storage_key": key,
+                        "url": url_for(key),
+                        "filename": name,
+                        "content_type": (e.get("metadata") or {}).get("mimetype"),
+                        "size_bytes": (e.get("metadata") or {}).get("size"),
+                        **variantes,
+                    }).rowcount
+            elif (actual["thumb_url"], actual["display_url"]) != (variantes["thumb_url"], variantes["display_url"]):
+                stats["variantes"] += 1
+                if not dry_run:
+                    conn.execute(
+                        text("UPDATE fotos_partes_cx SET thumb_url = :thumb_url, display_url = :display_url WHERE id_foto = :id"),
+                        {"id": actual["id_foto"], **variantes},
+                    )
+
+    for key, fila in en_db.items():
+        # Sólo claves con el formato de este bucket ({id_pp}/{archivo}); otras se dejan como están
+        if key not in en_bucket and _KEY_CX.match(key):
+            stats["eliminadas"] += 1
+            if not dry_run:
+                conn.execute(text("DELETE FROM fotos_partes_cx WHERE id_foto = :id"), {"id": fila["id_foto"]})
+    return stats
+
+
+def _reconciliar_patologia(conn, client, bucket: str, url_for, dry_run: bool) -> Dict[str, int]:
+    # Los archivos de {id_paciente}/fotos/ no dicen a qué patología pertenecen:
+    # acá sólo se limpian filas sin objeto y se completan las variantes.
+    stats = {"eliminadas": 0, "variantes": 0}
+    filas = [dict(r) for r in conn.execute(text(
+        "SELECT id, file_key, thumb_url, display_url FROM fotos_patologia"
+    )).mappings()]
+    por_carpeta: Dict[str, List[Dict[str, Any]]] = {}
+    for f in filas:
+        por_carpeta.setdefault(f["file_key"].rsplit("/", 1)[0], []).append(f)
+
+    for carpeta, fotos in por_carpeta.items():
+        nombres = [e["name"] for e in _list_names(client, bucket, carpeta)]
+        existentes = set(nombres)
+        for f in fotos:
+            if f["file_key"].rsplit("/", 1)[-1] not in existentes:
+                stats["eliminadas"] += 1
+                if not dry_run:
+                    conn.execute(text("DELETE FROM fotos_patologia WHERE id = :id"), {"id": f["id"]})
+                continue
+            variantes = image_variants.variant_urls(f["file_key"], url_for, existing=nombres)
+            if (f["thumb_url"], f["display_url"]) != (variantes["thumb_url"], variantes["display_url"]):
+                stats["variantes"] += 1
+                if not dry_run:
+                    conn.execute(
+                        text("UPDATE fotos_patologia SET thumb_url = :thumb_url, display_url = :display_url WHERE id = :id"),
+                        {"id": f["id"], **variantes},
+                    )
+    return stats
+
+
+def reconciliar(dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Compara las tablas de fotos con los buckets y repara las diferencias.
+    Con dry_run=True sólo cuenta lo que cambiaría.
+    """
+    from database import engine
+    from . import patologia, procedimientosFotosCx
+
+    resultado: Dict[str, Any] = {"dry_run": dry_run}
+    if procedimientosFotosCx._supabase is not None:
+        with engine.begin() as conn:
+            resultado["fotos_partes_cx"] = _reconciliar_cx(
+                conn, procedimientosFotosCx._supabase, procedimientosFotosCx.SUPABASE_BUCKET,
+                procedimientosFotosCx._public_url, dry_run,
+            )
+    if patologia.supabase is not None:
+        bucket = patologia.SUPABASE_BUCKET_PATOLOGIA
+        with engine.begin() as conn:
+            resultado["fotos_patologia"] = _reconciliar_patologia(
+                conn, patologia.supabase, bucket, lambda k: patologia._public_url(bucket, k), dry_run,
+            )
+    logger.info(f"[photo_index] reconciliación: {resultado}")
+    return resultado
+
+
+@router.post(
+    "/reconciliar",
+    summary="Reparar el índice de fotos contra los buckets",
+    dependencies=[Depends(verify_token)],
+)
+async def reconciliar_fotos(dry_run: bool = Query(False, description="Sólo informar, sin modificar la DB")):
+    # El SDK de Supabase y la sesión sync bloquean: va al threadpool
+    return await run_in_threadpool(reconciliar, dry_run)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(reconciliar(dry_run="--dry-run" in sys.argv[1:]))
@@ -1,17 +1,26 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query
 from typing import List, Dict, Any
 import os
 import uuid
+import asyncio
 import logging
 from urllib.parse import quote, unquote
 from io import BytesIO
 
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_async_db
+from . import image_variants, photo_index, storage_http
+
 try:
     # supabase-py v2
     from supabase import create_client
 except Exception as e:  # pragma: no cover
     create_client = None  # type: ignore
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
@@ -22,6 +31,9 @@ _supabase = None
 if create_client and SUPABASE_URL and SUPABASE_KEY:
     _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Subidas async por REST (el SDK es sincrónico y bloquearía el event loop)
+_storage = storage_http.StorageClient(SUPABASE_URL, SUPABASE_KEY, SUPABASE_BUCKET) if (SUPABASE_URL and SUPABASE_KEY) else None
+
 
 def _public_url(file_key: str) -> str:
     """Obtiene URL pública para un objeto del bucket.
@@ -54,160 +66,162 @@ def _safe_name(original: str) -> str:
 
 
 @router.get("/procedimientos/{id_proc_pac}/fotos")
-def listar_fotos_procedimiento(id_proc_pac: int) -> List[Dict[str, Any]]:
-    """Lista fotos desde el Storage para el procedimiento dado.
-    Si no hay filas en BD, usamos el bucket directamente (fallback robusto).
+async def listar_fotos_procedimiento(id_proc_pac: int, db: AsyncSession = Depends(get_async_db)) -> List[Dict[str, Any]]:
+    """Lista las fotos del procedimiento desde el índice en DB (fotos_partes_cx).
+    No consulta el bucket: las altas/bajas escriben en la tabla y
+    /fotos/reconciliar repara diferencias (ver photo_index).
     """
-    if _supabase is None:
-        return []
     try:
-        folder = str(id_proc_pac)
-        resp = _supabase.storage.from_(SUPABASE_BUCKET).list(folder)
-        files: List[Dict[str, Any]] = []
-        # `resp` puede venir como dict { data: [...] } ó como lista
-        if isinstance(resp, dict):
-            files = resp.get("data") or []
-        elif isinstance(resp, list):
-            files = resp  # type: ignore
-        items: List[Dict[str, Any]] = []
-        for it in files:
-            name = it.get("name") if isinstance(it, dict) else str(it)
-            # descartar nombres legados rotos (uuid__.ext)
-            if name and name.count("_") >= 1 and name.endswith("__."):
-                # patrón improbable, evitamos 400
-                continue
-            key = f"{folder}/{name}"
-            url = _public_url(key)
-            size_bytes = 0
-            if isinstance(it, dict):
-                size_bytes = it.get("metadata", {}).get("size", 0) or it.get("size", 0) or 0
-            items.append({
-                "id_foto": None,
-                "url": url,
-                "file_url": url,
-                "file_key": key,
-                "filename": name,
-                "content_type": None,
-                "size_bytes": size_bytes,
-                "created_at": None,
-            })
-        return items
+        return await photo_index.listar_fotos_cx(db, id_proc_pac)
     except Exception as e:  # pragma: no cover
         # preferimos no romper el listado del parte por fotos
+        logger.error(f"[procedimientosFotosCx] listado falló id={id_proc_pac}: {e}")
         return []
 
 
 @router.get("/partes/{id_parte}/fotos")
-def listar_fotos_parte(id_parte: int) -> List[Dict[str, Any]]:
+async def listar_fotos_parte(id_parte: int, db: AsyncSession = Depends(get_async_db)) -> List[Dict[str, Any]]:
     """
     Alias para compatibilidad: algunas vistas llaman con id_parte.
-    Reutiliza el mismo listado por carpeta {id} en el Storage.
+    Reutiliza el mismo listado por id de procedimiento.
     """
-    return listar_fotos_procedimiento(id_parte)
+    return await listar_fotos_procedimiento(id_parte, db)
 
 
 @router.post("/procedimientos/{id_proc_pac}/fotos", status_code=201)
-async def subir_fotos_procedimiento(id_proc_pac: int, files: List[UploadFile] = File(...)) -> Dict[str, Any]:
-    """Sube una o varias fotos al bucket en la carpeta {id_proc_pac} y devuelve metadatos.
-    No toca BD; el front puede listar por storage.
+async def subir_fotos_procedimiento(
+    id_proc_pac: int,
+    files: List[UploadFile] = File(...),
+    db: AsyncSession = Depends(get_async_db),
+) -> Dict[str, Any]:
+    """Sube una o varias fotos al bucket en la carpeta {id_proc_pac} y las registra
+    en fotos_partes_cx (write-through).
+    Las subidas van en paralelo (concurrencia acotada, reintentos con backoff por
+    archivo); `results` trae el resultado de cada archivo en el orden recibido.
+    Por cada imagen subida se suben también miniatura y versión pantalla (ver image_variants).
     """
-    if _supabase is None:
+    if _storage is None:
         raise HTTPException(status_code=500, detail="Supabase no configurado")
     if not files:
         raise HTTPException(status_code=400, detail="Sin archivos")
 
-    errors: List[str] = []
-
-    created: List[Dict[str, Any]] = []
+    items: List[storage_http.UploadItem] = []
     for f in files:
-        try:
-            unique_name = _safe_name(f.filename)
-            key = f"{id_proc_pac}/{unique_name}"
-            content = await f.read()
-            options = {
-                "contentType": f.content_type or "application/octet-stream",
-            }
-            try:
-                logging.info(f"[procedimientosFotosCx] upload bucket={SUPABASE_BUCKET} key={key} ct={f.content_type} bytes={len(content)}")
-            except Exception:
-                pass
-            try:
-                _supabase.storage.from_(SUPABASE_BUCKET).upload(
-                    path=key,
-                    file=content,
-                    file_options=options,
-                )
-            except Exception as up:
-                print(f"[upload_fotos] fallo upload primario '{key}': {up}")
-                alt_key = f"{id_proc_pac}/{int(__import__('time').time())}_{unique_name}"
-                try:
-                    _supabase.storage.from_(SUPABASE_BUCKET).upload(
-                        path=alt_key,
-                        file=content,
-                        file_options=options,
-                    )
-                    key = alt_key
-                except Exception as up2:
-                    print(f"[upload_fotos] reintento falló '{alt_key}': {up2}")
-                    raise HTTPException(status_code=500, detail=f"Upload falló para '{f.filename}': {up2}")
-            url = _public_url(key)
-            created.append({
-                "id_foto": None,
-                "url": url,
-                "file_url": url,
-                "file_key": key,
-                "filename": unique_name,
-                "content_type": f.content_type or None,
-                "size_bytes": len(content),
-                "created_at": None,
-            })
-        except Exception as e:  # pragma: no cover
-            # si es un HTTPException previo, re-lanzarlo para que llegue el detail al cliente
-            if isinstance(e, HTTPException):
-                raise
-            msg = f"[procedimientosFotosCx][upload_fail] key={locals().get('key','?')} err={e}"
-            try:
-                logging.error(msg)
-                print(msg)
-            except Exception:
-                pass
-            errors.append(str(e))
+        content = await f.read()
+        item = storage_http.UploadItem(
+            key=f"{id_proc_pac}/{_safe_name(f.filename)}",
+            data=content,
+            content_type=f.content_type or "application/octet-stream",
+            filename=f.filename,
+        )
+        items.append(item)
+        logger.info(f"[procedimientosFotosCx] upload bucket={SUPABASE_BUCKET} key={item.key} ct={f.content_type} bytes={len(content)}")
+
+    sem = asyncio.Semaphore(storage_http.UPLOAD_CONCURRENCY)
+
+    async def _subir(item: storage_http.UploadItem):
+        # Cada archivo en su tarea: las variantes (Pillow, CPU -> threadpool) se
+        # arman mientras sube el original y se suben sólo si el original subió
+        variantes = None
+        if image_variants.is_image(item.filename, item.content_type):
+            variantes = asyncio.ensure_future(run_in_threadpool(image_variants.make_variants, item.data))
+        async with sem:
+            res = (await _storage.upload_many([item]))[0]
+        if variantes is None:
+            return res, set()
+        variants = await variantes
+        if not res["ok"] or not variants:
+            return res, set()
+        variant_items = [
+            storage_http.UploadItem(key=image_variants.variant_key(item.key, name), data=data, content_type=ct)
+            for name, (data, ct) in variants.items()
+        ]
+        async with sem:
+            variant_results = await _storage.upload_many(variant_items)
+        return res, {r["key"] for r in variant_results if r["ok"]}
+
+    subidas = await asyncio.gather(*(_subir(item) for item in items))
+    results = [res for res, _ in subidas]
+    uploaded_keys = set().union(*(keys for _, keys in subidas))
+
+    nuevas: List[Dict[str, Any]] = []
+    errors: List[str] = []
+    for item, res in zip(items, results):
+        if not res["ok"]:
+            errors.append(f"{item.filename}: {res['error']}")
             continue
-
-    if not created:
+        url = _public_url(item.key)
+        urls = {
+            f"{name}_url": _public_url(vkey) if vkey in uploaded_keys else None
+            for name, vkey in image_variants.variant_keys(item.key).items()
+        }
+        res.update(url=url, **urls)
+        nuevas.append({
+            "storage_key": item.key,
+            "url": url,
+            "filename": item.filename or item.key.rsplit("/", 1)[-1],
+            "content_type": item.content_type,
+            "size_bytes": len(item.data),
+            **urls,
+        })
+
+    if not nuevas:
         detail = "No se pudo subir ninguna foto"
         if errors:
             detail += f": {errors[0]}"
         raise HTTPException(status_code=500, detail=detail)
 
-    return {"uploaded": created}
+    try:
+        created = await photo_index.registrar_fotos_cx(db, id_proc_pac, nuevas)
+    except Exception as e:
+        # Los archivos ya están en el bucket: la reconciliación los va a indexar
+        await db.rollback()
+        logger.error(f"[procedimientosFotosCx] no se pudo indexar fotos id={id_proc_pac}: {e}")
+        created = [photo_index.foto_cx_out(n) for n in nuevas]
+
+    return {"uploaded": created, "errors": errors, "results": results}
 
 
 @router.delete("/procedimientos/{id_proc_pac}/fotos/{file_key:path}")
-def borrar_foto_procedimiento_path(id_proc_pac: int, file_key: str):
-    """Borra una foto del bucket por clave en el path. Acepta file_key con subcarpetas.
+async def borrar_foto_procedimiento_path(id_proc_pac: int, file_key: str, db: AsyncSession = Depends(get_async_db)):
+    """Borra una foto del bucket por clave en el path y su fila en fotos_partes_cx.
+    Acepta file_key con subcarpetas.
     Ej.: DELETE /procedimientos/49/fotos/49%2Fabcd.jpg
     """
     if _supabase is None:
         raise HTTPException(status_code=500, detail="Supabase no configurado")
+    key = unquote(file_key or "").lstrip("/")
+    # Si no viene con prefijo, lo agregamos
+    if not key.startswith(f"{id_proc_pac}/"):
+        key = f"{id_proc_pac}/" + key
     try:
-        key = unquote(file_key or "").lstrip("/")
-        # Si no viene con prefijo, lo agregamos
-        if not key.startswith(f"{id_proc_pac}/"):
-            key = f"{id_proc_pac}/" + key
-        # Ejecutar borrado
-        resp = _supabase.storage.from_(SUPABASE_BUCKET).remove([key])
+        # Ejecutar borrado (original + miniatura + versión pantalla, si existen); SDK sync -> threadpool
+        resp = await run_in_threadpool(
+            _supabase.storage.from_(SUPABASE_BUCKET).remove,
+            [key, *image_variants.variant_keys(key).values()],
+        )
         # remove retorna {'data': [...], 'error': None} o similar; validamos error si existe
         if isinstance(resp, dict) and resp.get("error"):
             raise Exception(str(resp["error"]))
-        return {"deleted": key}
     except Exception as e:  # pragma: no cover
         raise HTTPException(status_code=500, detail=f"Delete falló: {e}")
 
+    try:
+        await photo_index.borrar_foto_cx(db, id_proc_pac, key)
+    except Exception as e:
+        # El objeto ya no existe: la reconciliación limpia la fila
+        await db.rollback()
+        logger.error(f"[procedimientosFotosCx] no se pudo desindexar {key}: {e}")
+    return {"deleted": key}
+
 
 @router.delete("/procedimientos/{id_proc_pac}/fotos")
-def borrar_foto_procedimiento_query(id_proc_pac: int, file_key: str = Query(..., description="Clave del archivo a borrar")):
+async def borrar_foto_procedimiento_query(
+    id_proc_pac: int,
+    file_key: str = Query(..., description="Clave del archivo a borrar"),
+    db: AsyncSession = Depends(get_async_db),
+):
     """Compat: permite borrar pasando `file_key` como query string.
     Ej.: DELETE /procedimientos/49/fotos?file_key=49/abcd.jpg
     """
-    return borrar_foto_procedimiento_path(id_proc_pac=id_proc_pac, file_key=file_key)
\ No newline at end of file
+    return await borrar_foto_procedimiento_path(id_proc_pac=id_proc_pac, file_key=file_key, db=db)
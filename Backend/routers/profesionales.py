@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 
 import models
 import schemas
+import catalog_cache
 from database import get_db
 
 router = APIRouter(
@@ -12,8 +13,11 @@ router = APIRouter(
 
 # CIRUJANOS
 @router.get("/cirujanos", response_model=list[schemas.CirujanoOut])
-def listar_cirujanos(db: Session = Depends(get_db)):
-    return db.query(models.Cirujano).order_by(models.Cirujano.nombre).all()
+def listar_cirujanos(request: Request, db: Session = Depends(get_db)):
+    return catalog_cache.cached_response(request, "cirujanos", lambda: [
+        schemas.CirujanoOut.model_validate(x).model_dump(mode="json")
+        for x in db.query(models.Cirujano).order_by(models.Cirujano.nombre).all()
+    ])
 
 @router.post("/cirujanos", response_model=schemas.CirujanoOut)
 def crear_cirujano(cirujano: schemas.CirujanoCreate, db: Session = Depends(get_db)):
@@ -21,11 +25,13 @@ def crear_cirujano(cirujano: schemas.CirujanoCreate, db: Session = Depends(get_d
     if existente:
         existente.activo = True
         db.commit()
+        catalog_cache.invalidate("cirujanos")
         db.refresh(existente)
         return existente
     nuevo = models.Cirujano(nombre=cirujano.nombre)
     db.add(nuevo)
     db.commit()
+    catalog_cache.invalidate("cirujanos")
     db.refresh(nuevo)
     return nuevo
 
@@ -36,14 +42,18 @@ def actualizar_estado_cirujano(id: str, activo: bool, db: Session = Depends(get_
         raise HTTPException(status_code=404, detail="Cirujano no encontrado")
     cirujano.activo = activo
     db.commit()
+    catalog_cache.invalidate("cirujanos")
     db.refresh(cirujano)
     return cirujano
 
 
 # ANESTESIOLOGOS
 @router.get("/anestesiologos", response_model=list[schemas.AnestesiologoOut])
-def listar_anestesiologos(db: Session = Depends(get_db)):
-    return db.query(models.Anestesiologo).order_by(models.Anestesiologo.nombre).all()
+def listar_anestesiologos(request: Request, db: Session = Depends(get_db)):
+    return catalog_cache.cached_response(request, "anestesiologos", lambda: [
+        schemas.AnestesiologoOut.model_validate(x).model_dump(mode="json")
+        for x in db.query(models.Anestesiologo).order_by(models.Anestesiologo.nombre).all()
+    ])
 
 @router.post("/anestesiologos", response_model=schemas.AnestesiologoOut)
 def crear_anestesiologo(anest: schemas.AnestesiologoCreate, db: Session = Depends(get_db)):
@@ -51,11 +61,13 @@ def crear_anestesiologo(anest: schemas.AnestesiologoCreate, db: Session = Depend
     if existente:
         existente.activo = True
         db.commit()
+        catalog_cache.invalidate("anestesiologos")
         db.refresh(existente)
         return existente
     nuevo = models.Anestesiologo(nombre=anest.nombre)
     db.add(nuevo)
     db.commit()
+    catalog_cache.invalidate("anestesiologos")
     db.refresh(nuevo)
     return nuevo
 
@@ -66,14 +78,18 @@ def actualizar_estado_anestesiologo(id: str, activo: bool, db: Session = Depends
         raise HTTPException(status_code=404, detail="Anestesiólogo no encontrado")
     anest.activo = activo
     db.commit()
+    catalog_cache.invalidate("anestesiologos")
     db.refresh(anest)
     return anest
 
 
 # INSTRUMENTADORES
 @router.get("/instrumentadores", response_model=list[schemas.InstrumentadorOut])
-def listar_instrumentadores(db: Session = Depends(get_db)):
-    return db.query(models.Instrumentador).order_by(models.Instrumentador.nombre).all()
+def listar_instrumentadores(request: Request, db: Session = Depends(get_db)):
+    return catalog_cache.cached_response(request, "instrumentadores", lambda: [
+        schemas.InstrumentadorOut.model_validate(x).model_dump(mode="json")
+        for x in db.query(models.Instrumentador).order_by(models.Instrumentador.nombre).all()
+    ])
 
 @router.post("/instrumentadores", response_model=schemas.InstrumentadorOut)
 def crear_instrumentador(instr: schemas.InstrumentadorCreate, db: Session = Depends(get_db)):
@@ -83,5 +99,6 @@ def crear_instrumentador(instr: schemas.InstrumentadorCreate, db: Session = Depe
     nuevo = models.Instrumentador(nombre=instr.nombre)
     db.add(nuevo)
     db.commit()
+    catalog_cache.invalidate("instrumentadores")
     db.refresh(nuevo)
     return nuevo
\ No newline at end of file
@@ -1,11 +1,18 @@
+import logging
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 
 # Usamos el get_db del módulo database (igual que en otros routers)
-from database import get_db
+# get_async_db para las lecturas más usadas (resumen / completo)
+from database import get_db, get_async_db
+import catalog_cache
+import pdf_cache
 from schemas import ParteUpdate
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/partes", tags=["PartesQuirurgicos"])
 
 def _norm_institucion(val):
@@ -165,6 +172,7 @@ def crear_parte(payload: dict, db: Session = Depends(get_db)):
             ).mappings().first()
 
             db.commit()
+            pdf_cache.invalidate("resumen_hc", id_paciente)
 
             # Intentar devolver desde la vista; si no, IDs
             try:
@@ -186,7 +194,7 @@ def crear_parte(payload: dict, db: Session = Depends(get_db)):
             raise
         except Exception as e:
             db.rollback()
-            print("[POST /partes] ERROR (A):", e)
+            logger.error(f"[POST /partes] ERROR (A): {e}")
             raise HTTPException(status_code=500, detail="Error interno al crear el parte")
 
     # ---------- Forma B (compatibilidad) ----------
@@ -327,6 +335,7 @@ def crear_parte(payload: dict, db: Session = Depends(get_db)):
         ).mappings().first()
 
         db.commit()
+        pdf_cache.invalidate("resumen_hc", id_paciente)
 
         # Vista si está
         try:
@@ -349,7 +358,7 @@ def crear_parte(payload: dict, db: Session = Depends(get_db)):
         raise
     except Exception as e:
         db.rollback()
-        print("[POST /partes] ERROR (B):", e)
+        logger.error(f"[POST /partes] ERROR (B): {e}")
         raise HTTPException(status_code=500, detail="Error interno al crear el parte")
 
 # Alias de compatibilidad para el front que llama a /protocolos_cx/partes
@@ -394,7 +403,7 @@ def obtener_parte(id_pp: int, db: Session = Depends(get_db)):
 
 # --- NUEVO ENDPOINT: parte completo (cabecera + detalle + fotos) ---
 @router.get("/completo/{id_pp}")
-def obtener_parte_completo(id_pp: int, db: Session = Depends(get_db)):
+async def obtener_parte_completo(id_pp: int, db: AsyncSession = Depends(get_async_db)):
     """
     GET /api/partes/completo/{id_pp}
     Devuelve un objeto consolidado con:
@@ -425,7 +434,7 @@ def obtener_parte_completo(id_pp: int, db: Session = Depends(get_db)):
         WHERE pp.id_procedimiento_paciente = :id
         """
     )
-    row_pp = db.execute(q_pp, {"id": id_pp}).mappings().first()
+    row_pp = (await db.execute(q_pp, {"id": id_pp})).mappings().first()
     if not row_pp:
         raise HTTPException(status_code=404, detail="procedimiento_paciente no encontrado")
 
@@ -470,7 +479,7 @@ def obtener_parte_completo(id_pp: int, db: Session = Depends(get_db)):
         WHERE pq.id_procedimiento_paciente = :id
         """
     )
-    row_pq = db.execute(q_pq, {"id": id_pp}).mappings().first()
+    row_pq = (await db.execute(q_pq, {"id": id_pp})).mappings().first()
 
     # 3) Fotos (tabla real: fotos_partes_cx)
     q_fotos = text(
@@ -483,13 +492,15 @@ def obtener_parte_completo(id_pp: int, db: Session = Depends(get_db)):
             f.filename,
             f.content_type,
             f.size_bytes,
+            f.thumb_url,
+            f.display_url,
             f.created_at
         FROM fotos_partes_cx f
         WHERE f.id_procedimiento_paciente = :id
         ORDER BY f.created_at DESC, f.id_foto DESC
         """
     )
-    fotos = [dict(r) for r in db.execute(q_fotos, {"id": id_pp}).mappings().all()]
+    fotos = [dict(r) for r in (await db.execute(q_fotos, {"id": id_pp})).mappings().all()]
 
     # 4) Respuesta consolidada (estructura estable para el front)
     resp = {
@@ -550,8 +561,8 @@ def obtener_parte_completo(id_pp: int, db: Session = Depends(get_db)):
 router_cx = APIRouter(prefix="/protocolos_cx", tags=["PartesQuirurgicos"])
 
 @router_cx.get("/partes/{id_pp}")
-def obtener_parte_completo_alias(id_pp: int, db: Session = Depends(get_db)):
-    return obtener_parte_completo(id_pp, db)
+async def obtener_parte_completo_alias(id_pp: int, db: AsyncSession = Depends(get_async_db)):
+    return await obtener_parte_completo(id_pp, db)
 
 # NUEVO: alias PUT/DELETE para que el front use /protocolos_cx/partes/{id_pp}
 @router_cx.put("/partes/{id_pp}")
@@ -564,9 +575,9 @@ def borrar_parte_alias(id_pp: int, db: Session = Depends(get_db)):
 
 # --- NUEVO ENDPOINT: listar resumen de partes por paciente ---
 @router.get("/resumen")
-def listar_resumen(
+async def listar_resumen(
     id_paciente: int = Query(..., description="ID del paciente"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     GET /api/partes/resumen?id_paciente=8
@@ -581,7 +592,7 @@ def listar_resumen(
     - id_parte (detalle)
     """
     try:
-        rows = db.execute(text(
+        rows = (await db.execute(text(
             """
             SELECT
                 pp.id_procedimiento_paciente,
@@ -618,7 +629,7 @@ def listar_resumen(
             WHERE pp.id_paciente = :id_paciente
             ORDER BY pp.fecha DESC, pp.id_procedimiento_paciente DESC
             """
-        ), {"id_paciente": id_paciente}).mappings().all()
+        ), {"id_paciente": id_paciente})).mappings().all()
 
         # Normalización mínima hacia lo que espera el front
         out = []
@@ -630,7 +641,7 @@ def listar_resumen(
             out.append(d)
         return out
     except Exception as e:
-        print("[/partes/resumen] ERROR:", e)
+        logger.error(f"[/partes/resumen] ERROR: {e}")
         raise HTTPException(status_code=500, detail="Error al listar resumen")
 
 @router.put("/{id_pp}")
@@ -687,9 +698,9 @@ def actualizar_parte(id_pp: int, payload: dict, db: Session = Depends(get_db)):
             else:
                 data[_b] = bool(data[_b])
 
-    # Verificar existencia de encabezado
+    # Verificar existencia de encabezado (y el paciente, para invalidar su resumen de HC)
     exists = db.execute(
-        text("SELECT 1 FROM procedimientos_pacientes WHERE id_procedimiento_paciente = :id_pp"),
+        text("SELECT id_paciente FROM procedimientos_pacientes WHERE id_procedimiento_paciente = :id_pp"),
         {"id_pp": id_pp},
     ).first()
     if not exists:
@@ -774,6 +785,9 @@ def actualizar_parte(id_pp: int, payload: dict, db: Session = Depends(get_db)):
             )
 
         db.commit()
+        # El PDF del parte y el resumen de HC del paciente quedan viejos
+        pdf_cache.invalidate("hzb", id_pp)
+        pdf_cache.invalidate("resumen_hc", exists.id_paciente)
         # Devolver vista actualizada
         data = db.execute(
             text("""
@@ -795,7 +809,7 @@ def borrar_parte(id_pp: int, db: Session = Depends(get_db)):
     try:
         # Verificar existencia
         exists = db.execute(
-            text("SELECT 1 FROM procedimientos_pacientes WHERE id_procedimiento_paciente = :id_pp"),
+            text("SELECT id_paciente FROM procedimientos_pacientes WHERE id_procedimiento_paciente = :id_pp"),
             {"id_pp": id_pp},
         ).first()
         if not exists:
@@ -812,6 +826,8 @@ def borrar_parte(id_pp: int, db: Session = Depends(get_db)):
             {"id_pp": id_pp},
         )
         db.commit()
+        pdf_cache.invalidate("hzb", id_pp)
+        pdf_cache.invalidate("resumen_hc", exists.id_paciente)
         return {"ok": True}
     except HTTPException:
         raise
@@ -839,7 +855,7 @@ def listar_plantillas(db: Session = Depends(get_db)):
         """)).mappings().all()
         return [dict(r) for r in rows]
     except Exception as e:
-        print("[plantillas_tecnicas][GET] ERROR:", e)
+        logger.error(f"[plantillas_tecnicas][GET] ERROR: {e}")
         # Para que el front no explote, devolvemos lista vacía si algo sale mal
         return []
 
@@ -860,12 +876,13 @@ def crear_plantilla(payload: dict, db: Session = Depends(get_db)):
             RETURNING id_plantilla AS id, tecnica, desarrollo
         """), {"tecnica": tecnica, "desarrollo": desarrollo}).mappings().first()
         db.commit()
+        catalog_cache.invalidate("plantillas_tecnicas")
         return dict(row)
     except Exception as e:
         db.rollback()
         # Si es violación de unique, devolvemos 409
         msg = str(e)
-        print("[plantillas_tecnicas][POST] ERROR:", msg)
+        logger.error(f"[plantillas_tecnicas][POST] ERROR: {msg}")
         if "unique" in msg.lower() or "duplicate key" in msg.lower():
             raise HTTPException(status_code=409, detail="La técnica ya existe")
         raise HTTPException(status_code=500, detail="Error al crear la plantilla")
@@ -888,11 +905,12 @@ def actualizar_plantilla(id_plantilla: int, payload: dict, db: Session = Depends
             WHERE id_plantilla = :id
         """), {"tecnica": tecnica, "desarrollo": desarrollo, "id": id_plantilla})
         db.commit()
+        catalog_cache.invalidate("plantillas_tecnicas")
         return {"ok": True}
     except Exception as e:
         db.rollback()
         msg = str(e)
-        print("[plantillas_tecnicas][PUT] ERROR:", msg)
+        logger.error(f"[plantillas_tecnicas][PUT] ERROR: {msg}")
         if "unique" in msg.lower() or "duplicate key" in msg.lower():
             raise HTTPException(status_code=409, detail="La técnica ya existe")
         raise HTTPException(status_code=500, detail="Error al actualizar la plantilla")
@@ -910,8 +928,9 @@ def borrar_plantilla(id_plantilla: int, db: Session = Depends(get_db)):
             WHERE id_plantilla = :id
         """), {"id": id_plantilla})
         db.commit()
+        catalog_cache.invalidate("plantillas_tecnicas")
         return {"ok": True}
     except Exception as e:
         db.rollback()
-        print("[plantillas_tecnicas][DELETE] ERROR:", e)
+        logger.error(f"[plantillas_tecnicas][DELETE] ERROR: {e}")
         raise HTTPException(status_code=500, detail="Error al borrar la plantilla")
@@ -24,21 +24,28 @@ Todas retornan:
         "url": str,          # URL pública para mostrar/descargar
         "storage_key": str,  # ruta interna del bucket o del FS local
         "size_bytes": int,   # tamaño del archivo
-        "content_type": str  # content-type normalizado
+        "content_type": str, # content-type normalizado
+        "thumb_url": str | None,    # miniatura (sólo imágenes)
+        "display_url": str | None,  # versión pantalla (sólo imágenes)
     }
 
-Nota: NO realizamos resize/conversión de imágenes aquí. Si se necesita,
-se puede agregar luego sin romper las firmas públicas.
+Imágenes: además del original se guardan miniatura y versión pantalla sin
+EXIF (ver image_variants). upload_file es sincrónica: desde un endpoint async
+llamarla con run_in_threadpool.
 """
 
 import os
 from uuid import uuid4
 from typing import Optional
 
+import signed_urls
+from . import image_variants
+
 # Intentamos inicializar el cliente de Supabase si hay credenciales
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SUPABASE_BUCKET = os.getenv("SUPABASE_PARTES_BUCKET", "partes")
+SIGNED_URL_TTL = 3600  # segundos
 
 _uploads_dir_default = os.getenv("UPLOADS_DIR", "uploads")
 _public_base_default = os.getenv("PUBLIC_UPLOADS_BASE", "/static")
@@ -90,19 +97,11 @@ def build_storage_key(base_path: str, filename: str, identifier: Optional[str |
     return f"{base_path}/{uid}_{clean_name}"
 
 
-def upload_file(base_path: str, fileobj, filename: str, content_type: Optional[str] = None) -> dict:
+def _put_object(storage_key: str, data: bytes, ct: str) -> str:
     """
-    Sube un archivo a Supabase si está configurado; en caso contrario, guarda localmente.
-
-    Retorna: {url, storage_key, size_bytes, content_type}
+    Guarda un objeto en Supabase (URL firmada) o, si no hay Supabase o falla,
+    en el FS local. Devuelve la URL para mostrarlo.
     """
-    ct = _normalize_content_type(content_type)
-    data = _read_all(fileobj)
-    size = len(data)
-
-    # Construimos una key de almacenamiento única
-    storage_key = build_storage_key(base_path, filename)
-
     # Camino 1: Supabase
     if _supabase_client:
         try:
@@ -112,15 +111,9 @@ def upload_file(base_path: str, fileobj, filename: str, content_type: Optional[s
             # Algunas versiones devuelven None o un objeto con .error
             if res is None or getattr(res, "error", None):
                 raise RuntimeError("Error subiendo a Supabase")
-            # Generar URL firmada (signed URL) para bucket privado
-            signed = _supabase_client.storage.from_(SUPABASE_BUCKET).create_signed_url(storage_key, 3600)
-            public_url = signed.get("signedURL") or signed.get("signedUrl")
-            return {
-                "url": public_url,
-                "storage_key": storage_key,
-                "size_bytes": size,
-                "content_type": ct,
-            }
+            # Generar URL firmada (signed URL) para bucket privado; queda en cache
+            # para los próximos pedidos de la misma key (ver signed_urls.py)
+            return signed_urls.get(_supabase_client, SUPABASE_BUCKET, storage_key, SIGNED_URL_TTL)
         except Exception as e:
             # Si falla, seguimos al fallback local
             # (También podríamos relanzar si preferís fallo duro)
@@ -131,12 +124,35 @@ def upload_file(base_path: str, fileobj, filename: str, content_type: Optional[s
     os.makedirs(os.path.dirname(dest_path), exist_ok=True)
     with open(dest_path, "wb") as f:
         f.write(data)
-    public_url = f"{_public_base_default}/{storage_key}"
+    return f"{_public_base_default}/{storage_key}"
+
+
+def upload_file(base_path: str, fileobj, filename: str, content_type: Optional[str] = None) -> dict:
+    """
+    Sube un archivo a Supabase si está configurado; en caso contrario, guarda localmente.
+    Si es una imagen, sube también miniatura y versión pantalla.
+
+    Retorna: {url, storage_key, size_bytes, content_type, thumb_url, display_url}
+    """
+    ct = _normalize_content_type(content_type)
+    data = _read_all(fileobj)
+    size = len(data)
+
+    # Construimos una key de almacenamiento única
+    storage_key = build_storage_key(base_path, filename)
+    url = _put_object(storage_key, data, ct)
+
+    variant_urls = {f"{name}_url": None for name in image_variants.VARIANTS}
+    if image_variants.is_image(filename, content_type):
+        for name, (vdata, vct) in image_variants.make_variants(data).items():
+            variant_urls[f"{name}_url"] = _put_object(image_variants.variant_key(storage_key, name), vdata, vct)
+
     return {
-        "url": public_url,
+        "url": url,
         "storage_key": storage_key,
         "size_bytes": size,
         "content_type": ct,
+        **variant_urls,
     }
 
 
@@ -145,12 +161,16 @@ def delete_file(storage_key: str) -> bool:
     Borra un archivo del bucket si hay Supabase; si no, intenta borrar del FS local.
 
     Devuelve True si aparenta haberse borrado (o no existir).
+    También borra la miniatura y la versión pantalla, si las hay.
     """
     ok = False
+    keys = [storage_key, *image_variants.variant_keys(storage_key).values()]
+    for key in keys:
+        signed_urls.invalidate(SUPABASE_BUCKET, key)
     if _supabase_client:
         try:
             # La API de supabase-py para borrar puede variar; la más nueva usa .remove()
-            res = _supabase_client.storage.from_(SUPABASE_BUCKET).remove([storage_key])
+            res = _supabase_client.storage.from_(SUPABASE_BUCKET).remove(keys)
             # Si no explota, lo consideramos OK
             ok = True
         except Exception:
@@ -158,9 +178,10 @@ def delete_file(storage_key: str) -> bool:
 
     # Intentamos también borrar local por si existiera
     try:
-        local_path = os.path.join(_uploads_dir_default, storage_key)
-        if os.path.exists(local_path):
-            os.remove(local_path)
+        for key in keys:
+            local_path = os.path.join(_uploads_dir_default, key)
+            if os.path.exists(local_path):
+                os.remove(local_path)
         ok = True or ok
     except Exception:
         pass
@@ -0,0 +1,192 @@
+# routers/storage_http.py
+"""
+Cliente async para la API REST de Supabase Storage (httpx).
+
+El SDK de supabase-py es sincrónico: llamado desde un endpoint `async`
+bloquea el event loop y obliga a subir los archivos de a uno. Acá:
+
+- Un único httpx.AsyncClient compartido (pool de conexiones keep-alive),
+  cerrado en el shutdown de la app (`close()`).
+- `StorageClient.upload()`: sube un objeto con reintentos y backoff
+  exponencial + jitter ante errores de red, 429 y 5xx.
+- `StorageClient.upload_many()`: sube varios en paralelo con concurrencia
+  acotada y devuelve un resultado por archivo (nunca corta el lote entero).
+- `StorageClient.upload_stream()`: pasa un UploadFile a Storage por bloques,
+  sin archivo temporal ni copia completa en memoria, con tamaño máximo.
+
+ENV:
+    STORAGE_UPLOAD_CONCURRENCY  (default 4)   subidas simultáneas por lote
+    STORAGE_UPLOAD_RETRIES      (default 3)   intentos por archivo
+    STORAGE_HTTP_TIMEOUT        (default 60)  segundos por request
+    STORAGE_MAX_UPLOAD_MB       (default 25)  tamaño máximo de upload_stream
+"""
+import asyncio
+import logging
+import os
+import random
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+from urllib.parse import quote
+
+import httpx
+
+import request_metrics
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CONCURRENCY = int(os.getenv("STORAGE_UPLOAD_CONCURRENCY", "4"))
+UPLOAD_RETRIES = max(1, int(os.getenv("STORAGE_UPLOAD_RETRIES", "3")))
+HTTP_TIMEOUT = float(os.getenv("STORAGE_HTTP_TIMEOUT", "60"))
+MAX_UPLOAD_BYTES = int(float(os.getenv("STORAGE_MAX_UPLOAD_MB", "25")) * 1024 * 1024)
+STREAM_CHUNK = 256 * 1024
+_BACKOFF_BASE = 0.5  # segundos; se duplica en cada intento
+
+_RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=max(UPLOAD_CONCURRENCY * 2, 10), max_keepalive_connections=UPLOAD_CONCURRENCY),
+        )
+    return _client
+
+
+async def close() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class StorageError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UploadTooLarge(StorageError):
+    def __init__(self, max_bytes: int):
+        super().__init__(f"El archivo supera el máximo de {max_bytes // (1024 * 1024)} MB", 413)
+
+
+async def iter_upload(file, max_bytes: int = MAX_UPLOAD_BYTES, chunk_size: int = STREAM_CHUNK):
+    """Lee un UploadFile por bloques; corta con UploadTooLarge si pasa de `max_bytes`."""
+    total = 0
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadTooLarge(max_bytes)
+        yield chunk
+
+
+@dataclass
+class UploadItem:
+    key: str
+    data: Any  # bytes o iterable async de bytes (ver StorageClient.upload)
+    content_type: str = "application/octet-stream"
+    filename: Optional[str] = None  # nombre original, sólo para el resultado
+
+
+class StorageClient:
+    """Acceso a un bucket de Supabase Storage vía REST."""
+
+    def __init__(self, url: str, key: str, bucket: str):
+        self.base = (url or "").rstrip("/") + "/storage/v1"
+        self.bucket = bucket
+        self._headers = {"Authorization": f"Bearer {key}", "apikey": key}
+
+    def object_url(self, key: str) -> str:
+        return f"{self.base}/object/{self.bucket}/{quote(key)}"
+
+    async def upload(
+        self,
+        key: str,
+        data: Any,
+        content_type: str = "application/octet-stream",
+        *,
+        upsert: bool = False,
+        content_length: Optional[int] = None,
+    ) -> str:
+        """
+        Sube `data` a `key` y devuelve la key. Reintenta con backoff exponencial.
+        Lanza StorageError si se agotan los intentos o el error no es reintentable.
+
+        `data` puede ser bytes o un iterable async de bytes (subida en streaming);
+        un stream no se puede volver a leer, así que en ese caso hay un solo intento.
+        """
+        headers = {**self._headers, "Content-Type": content_type, "x-upsert": "true" if upsert else "false"}
+        if content_length is not None:
+            # Con largo conocido httpx no usa Transfer-Encoding: chunked
+            headers["Content-Length"] = str(content_length)
+        attempts = UPLOAD_RETRIES if isinstance(data, (bytes, bytearray, memoryview)) else 1
+        last_error: Optional[StorageError] = None
+        for attempt in range(attempts):
+            if attempt:
+                delay = _BACKOFF_BASE * (2 ** (attempt - 1))
+                await asyncio.sleep(delay + random.uniform(0, delay))
+            try:
+                with request_metrics.span("storage"):
+                    resp = await _get_client().post(self.object_url(key), content=data, headers=headers)
+            except httpx.TransportError as e:
+                last_error = StorageError(f"Error de red subiendo '{key}': {e}")
+                logger.warning(f"[storage] intento {attempt + 1}/{attempts} falló para '{key}': {e}")
+                continue
+
+            if resp.status_code < 300:
+                return key
+            # 409 en un reintento: el intento anterior llegó al bucket aunque no vimos la respuesta
+            if resp.status_code == 409 and attempt and not upsert:
+                return key
+            last_error = StorageError(f"Supabase respondió {resp.status_code} para '{key}': {resp.text[:200]}", resp.status_code)
+            if resp.status_code not in _RETRY_STATUS:
+                break
+            logger.warning(f"[storage] intento {attempt + 1}/{attempts} falló para '{key}': HTTP {resp.status_code}")
+        raise last_error or StorageError(f"Upload falló para '{key}'")
+
+    async def upload_many(self, items: Sequence[UploadItem], *, concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Sube `items` en paralelo (a lo sumo `concurrency` a la vez).
+        Devuelve un dict por item, en el mismo orden:
+            {"key", "filename", "ok": bool, "error": str | None}
+        """
+        sem = asyncio.Semaphore(concurrency or UPLOAD_CONCURRENCY)
+
+        async def _one(item: UploadItem) -> Dict[str, Any]:
+            async with sem:
+                try:
+                    await self.upload(item.key, item.data, item.content_type)
+                    return {"key": item.key, "filename": item.filename, "ok": True, "error": None}
+                except StorageError as e:
+                    logger.error(f"[storage] upload_fail key={item.key} err={e}")
+                    return {"key": item.key, "filename": item.filename, "ok": False, "error": str(e)}
+
+        return list(await asyncio.gather(*(_one(it) for it in items)))
+
+    async def upload_stream(
+        self,
+        key: str,
+        file,
+        content_type: str = "application/octet-stream",
+        *,
+        upsert: bool = False,
+        max_bytes: int = MAX_UPLOAD_BYTES,
+    ) -> str:
+        """
+        Sube un UploadFile por bloques directo a Storage. Lanza UploadTooLarge
+        (status 413) si supera `max_bytes`, antes de mandar nada si se conoce el tamaño.
+        """
+        size = getattr(file, "size", None)
+        if size is not None and size > max_bytes:
+            raise UploadTooLarge(max_bytes)
+        await file.seek(0)
+        return await self.upload(
+            key, iter_upload(file, max_bytes), content_type, upsert=upsert, content_length=size,
+        )
@@ -5,48 +5,57 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from database import get_db
-from models import Turno, Derivador
+from models import Turno
 from schemas import TurnoSchema, TurnoCreateSchema
 from typing import List, Optional
 from datetime import date
 
 router = APIRouter()
 
+def _turno_out(turno: Turno) -> TurnoSchema:
+    # derivador_rel es lazy="joined": el nombre ya viene en el mismo SELECT del turno
+    return TurnoSchema(
+        id_turno=turno.id_turno,
+        nombre=turno.nombre,
+        fecha=turno.fecha,
+        motivo=turno.motivo,
+        derivador=turno.derivador,
+        nombre_derivador=turno.derivador_rel.nombre_derivador if turno.derivador_rel else None,
+    )
+
+
 @router.post("/turnos/", response_model=TurnoSchema)
 def crear_turno(turno: TurnoCreateSchema, db: Session = Depends(get_db)):
     nuevo_turno = Turno(**turno.dict())
     db.add(nuevo_turno)
     db.commit()
     db.refresh(nuevo_turno)
-
-    # Traemos el nombre del derivador si existe
-    nombre_derivador = None
-    if nuevo_turno.derivador:
-        derivador = db.query(Derivador).filter(Derivador.id_derivador == nuevo_turno.derivador).first()
-        if derivador:
-            nombre_derivador = derivador.nombre_derivador
-
-    return TurnoSchema(
-        **nuevo_turno.__dict__,
-        nombre_derivador=nombre_derivador
-    )
+    return _turno_out(nuevo_turno)
 
 @router.get("/turnos/", response_model=List[TurnoSchema])
-def obtener_turnos(fecha: Optional[date] = Query(None), db: Session = Depends(get_db)):
+def obtener_turnos(
+    fecha: Optional[date] = Query(None),
+    desde: Optional[date] = Query(None, description="Fecha inicial (inclusive)"),
+    hasta: Optional[date] = Query(None, description="Fecha final (inclusive)"),
+    db: Session = Depends(get_db),
+):
+    """
+    Lista turnos con el nombre del derivador resuelto en la misma consulta.
+    - `fecha`: un día puntual.
+    - `desde` / `hasta`: rango (por ej. la agenda semanal). Usa el índice ix_turnos_fecha.
+    """
+    if desde and hasta and desde > hasta:
+        raise HTTPException(status_code=400, detail="'desde' no puede ser posterior a 'hasta'.")
+
     query = db.query(Turno)
     if fecha:
         query = query.filter(Turno.fecha == fecha)
-    turnos = query.order_by(Turno.fecha).all()
-
-    resultados = []
-    for turno in turnos:
-        nombre_derivador = None
-        if turno.derivador:
-            derivador = db.query(Derivador).filter(Derivador.id_derivador == turno.derivador).first()
-            if derivador:
-                nombre_derivador = derivador.nombre_derivador
-        resultados.append(TurnoSchema(**turno.__dict__, nombre_derivador=nombre_derivador))
-    return resultados
+    if desde:
+        query = query.filter(Turno.fecha >= desde)
+    if hasta:
+        query = query.filter(Turno.fecha <= hasta)
+    turnos = query.order_by(Turno.fecha, Turno.id_turno).all()
+    return [_turno_out(t) for t in turnos]
 
 
 
@@ -63,17 +72,7 @@ def actualizar_turno(id_turno: int, turno: TurnoCreateSchema, db: Session = Depe
 
     db.commit()
     db.refresh(db_turno)
-
-    nombre_derivador = None
-    if db_turno.derivador:
-        derivador = db.query(Derivador).filter(Derivador.id_derivador == db_turno.derivador).first()
-        if derivador:
-            nombre_derivador = derivador.nombre_derivador
-
-    return TurnoSchema(
-        **db_turno.__dict__,
-        nombre_derivador=nombre_derivador
-    )
+    return _turno_out(db_turno)
 
 
 @router.delete("/turnos/{id_turno}")
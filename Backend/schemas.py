@@ -54,13 +54,24 @@ class PacienteConCobertura(PacienteBase):
 
 class PacientePaginatedResponse(BaseModel):
     items: list[PacienteConCobertura]
-    total: int
+    total: Optional[int] = None  # en modo cursor sólo viene en la primera página
     page: int
     page_size: int
+    next_cursor: Optional[str] = None  # opaco; None = no hay más páginas
 
     class Config:
         from_attributes = True
 
+
+class PacienteSearchResult(BaseModel):
+    id_paciente: int
+    nombre: str
+    dni: Optional[str] = None
+    fecha_nacimiento: Optional[date] = None
+    activo: bool = True
+    nombre_cobertura: Optional[str] = None
+    score: float  # similitud trigram (0..1)
+
 # ----------------------------------
 # COBERTURAS
 # ----------------------------------
@@ -487,6 +498,8 @@ class FotosPatologiaOut(BaseModel):
     id_patologia: int
     file_key: str
     file_url: str
+    thumb_url: Optional[str] = None    # miniatura (None en fotos viejas sin variantes)
+    display_url: Optional[str] = None  # versión pantalla
 
     class Config:
         from_attributes = True
@@ -809,3 +822,16 @@ class ParteUpdate(BaseModel):
     id_ayudante_1: Optional[int] = None
     id_ayudante_2: Optional[int] = None
     id_ayudante_3: Optional[int] = None
+
+
+# ----------------------------------
+# PDF EN LOTE
+# ----------------------------------
+
+class PdfLoteRequest(BaseModel):
+    # Filtros combinables (AND); al menos uno es obligatorio
+    ids: Optional[list[int]] = None  # id_procedimiento_paciente
+    id_paciente: Optional[int] = None
+    desde: Optional[date] = None
+    hasta: Optional[date] = None
+    formato: Literal["zip", "pdf"] = "zip"  # pdf = un único PDF unido (requiere pypdf o PyPDF2)
@@ -0,0 +1,151 @@
+"""
+Cache de URLs firmadas de Supabase Storage, por (bucket, key).
+
+Cada `create_signed_url` es un round-trip a Supabase. Una URL firmada sirve
+hasta que vence, así que se reutiliza mientras le quede vida útil suficiente
+y se vuelve a firmar recién cuando está por vencer:
+
+    vida restante >= max(SIGNED_URL_MIN_REMAINING, 25% de expires_in)
+
+Para listados se usa `get_many()`: las que no están en cache se firman todas
+juntas con `create_signed_urls` (un solo request para N archivos).
+
+Al borrar o reemplazar un archivo, llamar a `invalidate(bucket, key)`.
+
+ENV:
+    SIGNED_URL_CACHE_MAX_ENTRIES   (default 5000)
+    SIGNED_URL_MIN_REMAINING       (default 30 segundos)
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+import request_metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRIES = int(os.getenv("SIGNED_URL_CACHE_MAX_ENTRIES", "5000"))
+MIN_REMAINING = float(os.getenv("SIGNED_URL_MIN_REMAINING", "30"))
+
+_lock = threading.Lock()
+# (bucket, key) -> (vence_en [monotonic], url)
+_entries: "OrderedDict[Tuple[str, str], Tuple[float, str]]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "batch_calls": 0, "errors": 0}
+
+
+def _min_remaining(expires_in: int) -> float:
+    return max(MIN_REMAINING, expires_in * 0.25)
+
+
+def _lookup(bucket: str, key: str, expires_in: int) -> Optional[str]:
+    with _lock:
+        entry = _entries.get((bucket, key))
+        if entry is None:
+            return None
+        expires_at, url = entry
+        if expires_at - time.monotonic() < _min_remaining(expires_in):
+            _entries.pop((bucket, key), None)
+            return None
+        _entries.move_to_end((bucket, key))
+        return url
+
+
+def _store(bucket: str, key: str, url: str, expires_in: int, signed_at: float) -> None:
+    with _lock:
+        _entries[(bucket, key)] = (signed_at + expires_in, url)
+        _entries.move_to_end((bucket, key))
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+
+def _extract_url(signed) -> Optional[str]:
+    # supabase-py devuelve {'signedURL': ...} (o 'signedUrl' según versión)
+    if isinstance(signed, str):
+        return signed
+    if isinstance(signed, dict):
+        return signed.get("signedURL") or signed.get("signedUrl")
+    return None
+
+
+def get(client, bucket: str, key: str, expires_in: int) -> str:
+    """
+    URL firmada para (bucket, key), reutilizada mientras no esté por vencer.
+    Lanza RuntimeError si Supabase no devuelve una URL.
+    """
+    url = _lookup(bucket, key, expires_in)
+    if url is not None:
+        _stats["hits"] += 1
+        return url
+
+    _stats["misses"] += 1
+    # Se toma la hora antes de firmar: el vencimiento real nunca es anterior al calculado
+    signed_at = time.monotonic()
+    try:
+        with request_metrics.span("storage"):
+            url = _extract_url(client.storage.from_(bucket).create_signed_url(key, expires_in))
+    except Exception:
+        _stats["errors"] += 1
+        raise
+    if not url:
+        _stats["errors"] += 1
+        raise RuntimeError("Respuesta inesperada al generar URL firmada")
+    _store(bucket, key, url, expires_in, signed_at)
+    return url
+
+
+def get_many(client, bucket: str, keys: Iterable[str], expires_in: int) -> Dict[str, Optional[str]]:
+    """
+    {key: url} para varias keys. Las que faltan en cache se firman en un solo
+    `create_signed_urls`. Una key que Supabase no pudo firmar queda en None.
+    """
+    result: Dict[str, Optional[str]] = {}
+    missing = []
+    for key in dict.fromkeys(keys):
+        url = _lookup(bucket, key, expires_in)
+        if url is not None:
+            _stats["hits"] += 1
+            result[key] = url
+        else:
+            missing.append(key)
+
+    if missing:
+        _stats["misses"] += len(missing)
+        _stats["batch_calls"] += 1
+        signed_at = time.monotonic()
+        try:
+            with request_metrics.span("storage"):
+                items = client.storage.from_(bucket).create_signed_urls(missing, expires_in)
+        except Exception as e:
+            _stats["errors"] += 1
+            logger.warning(f"[signed_urls] create_signed_urls falló bucket={bucket} n={len(missing)}: {e}")
+            items = []
+        if isinstance(items, dict):
+            items = items.get("data") or []
+        by_path = {}
+        for it in items or []:
+            if isinstance(it, dict) and it.get("path") and not it.get("error"):
+                by_path[it["path"]] = _extract_url(it)
+        for key in missing:
+            url = by_path.get(key)
+            if url:
+                _store(bucket, key, url, expires_in, signed_at)
+            result[key] = url
+    return result
+
+
+def invalidate(bucket: str, key: str) -> None:
+    with _lock:
+        _entries.pop((bucket, key), None)
+
+
+def clear() -> None:
+    with _lock:
+        _entries.clear()
+
+
+def stats() -> dict:
+    with _lock:
+        return {**_stats, "entries": len(_entries), "max_entries": MAX_ENTRIES}